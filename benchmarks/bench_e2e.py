@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput harness: drives tulp's cli.run() in-process against the
+offline mock model, sweeping input size, chunk size (--max-chars), concurrency
+(--jobs) and simulated latency distributions (--mock_latency).
+
+Every sweep point runs --repeat times in a forked worker process, so peak RSS is
+measured per point, and reports requests/sec, request and end-to-end latency
+percentiles, peak RSS and token throughput:
+
+    python3 benchmarks/bench_e2e.py
+    python3 benchmarks/bench_e2e.py --sizes 1MB --jobs 1,8,32 --latency exp:0.2 --json results.json
+    python3 benchmarks/bench_e2e.py --tulp-args "--reduce" --model mock:upper
+"""
+import argparse
+import io
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import shlex
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+from bench_hotpaths import parse_size, format_size, short_lines
+
+DEFAULT_SIZES = "256KB,1MB"
+DEFAULT_MAX_CHARS = "20000,100000"
+DEFAULT_JOBS = "1,4,16"
+DEFAULT_LATENCY = "0,uniform:0.02:0.1,lognormal:0.05:0.5"
+DEFAULT_REQUEST = "repeat the input"
+
+
+def _percentile(values: List[float], fraction: float) -> float | None:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(1, math.ceil(fraction * len(values))) - 1]
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_tulp(argv: List[str], input_bytes: bytes) -> Dict[str, Any]:
+    """Runs cli.run(argv) in this process with input_bytes as stdin. Returns its exit code, wall time and metrics."""
+    from tulp import cli
+    from tulp.metrics import metrics
+
+    saved = sys.stdin, sys.stdout
+    sys.stdin = io.TextIOWrapper(io.BytesIO(input_bytes), encoding="utf-8")
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        cli.run(argv)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    finally:
+        wall_time = time.perf_counter() - start
+        sys.stdout.close()
+        sys.stdin, sys.stdout = saved
+    return {"exit_code": exit_code, "wall_time": wall_time, "metrics": metrics.to_dict()}
+
+
+def run_point(point: Dict[str, Any], repeat: int, model: str, extra_args: List[str]) -> Dict[str, Any]:
+    """Runs one sweep point `repeat` times and aggregates the measurements."""
+    input_bytes = short_lines(point["size"]).encode("utf-8")
+    argv = ["--model", model, "--max-chars", str(point["max_chars"]), "--jobs", str(point["jobs"]),
+            "--mock_latency", point["latency"], "-q", *extra_args, DEFAULT_REQUEST]
+
+    runs = [run_tulp(argv, input_bytes) for _ in range(repeat)]
+    wall_times = [run["wall_time"] for run in runs]
+    request_latencies = [latency for run in runs for chunk in run["metrics"]["chunks"] for latency in chunk["request_latencies"]]
+    requests = sum(run["metrics"]["totals"]["requests"] for run in runs)
+    output_tokens = sum(run["metrics"]["totals"]["output_tokens"] or 0 for run in runs)
+    total_time = sum(wall_times)
+    return {
+        "size": format_size(point["size"]),
+        "max_chars": point["max_chars"],
+        "jobs": point["jobs"],
+        "latency": point["latency"],
+        "runs": repeat,
+        "exit_codes": sorted({run["exit_code"] for run in runs}),
+        "chunks": runs[-1]["metrics"].get("num_chunks"),
+        "requests": requests,
+        "requests_per_s": round(requests / total_time, 2) if total_time else None,
+        "output_tokens_per_s": round(output_tokens / total_time, 1) if total_time else None,
+        "input_mb_per_s": round(len(input_bytes) * repeat / (1024 ** 2) / total_time, 3) if total_time else None,
+        "request_latency": {name: _percentile(request_latencies, fraction) for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "e2e_latency": {name: round(_percentile(wall_times, fraction), 4) for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="End-to-end throughput harness for tulp with the offline mock model.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma separated stdin sizes (default: {DEFAULT_SIZES})")
+    parser.add_argument("--max-chars", default=DEFAULT_MAX_CHARS, help=f"Comma separated chunk sizes (default: {DEFAULT_MAX_CHARS})")
+    parser.add_argument("--jobs", default=DEFAULT_JOBS, help=f"Comma separated concurrency levels (default: {DEFAULT_JOBS})")
+    parser.add_argument("--latency", default=DEFAULT_LATENCY, help=f"Comma separated --mock_latency distributions (default: {DEFAULT_LATENCY})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per sweep point (default: 3)")
+    parser.add_argument("--model", default="mock", help="Model to run, a mock or replay model (default: mock)")
+    parser.add_argument("--tulp-args", default="", help="Extra tulp arguments for every run, e.g. \"--reduce --cont 5\"")
+    parser.add_argument("--json", metavar="FILE", help="Write the results as JSON to FILE ('-' for stdout)")
+    args = parser.parse_args()
+
+    points = [
+        {"size": parse_size(size), "max_chars": int(max_chars), "jobs": int(jobs), "latency": latency.strip()}
+        for size, max_chars, jobs, latency in itertools.product(
+            args.sizes.split(","), args.max_chars.split(","), args.jobs.split(","), args.latency.split(","))
+    ]
+    extra_args = shlex.split(args.tulp_args)
+    repeat = max(1, args.repeat)
+
+    # One fresh worker per point keeps peak RSS per point and the parent process small
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    results = []
+    for point in points:
+        if context:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_point, (point, repeat, args.model, extra_args))
+        else:
+            result = run_point(point, repeat, args.model, extra_args)
+        results.append(result)
+        p50 = result["request_latency"]["p50"]
+        print(f"{result['size']:>6s} max_chars={result['max_chars']:<7d} jobs={result['jobs']:<3d} latency={result['latency']:<22s} "
+              f"{result['requests_per_s'] or 0:8.2f} req/s  e2e p50 {result['e2e_latency']['p50']:7.3f}s  "
+              f"req p50 {p50 if p50 is not None else float('nan'):6.3f}s  {result['output_tokens_per_s'] or 0:10.1f} tok/s  "
+              f"rss {result['peak_rss_mb']} MB  exit {result['exit_codes']}", file=sys.stderr)
+
+    if args.json:
+        report = {"model": args.model, "tulp_args": args.tulp_args, "repeat": repeat, "results": results}
+        if args.json == "-":
+            json.dump(report, sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+    return 1 if any(code != 0 for result in results for code in result["exit_codes"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the hot paths that scale with input size:
+input_handler.chunk_stdin, response_parser.parse_response and output_handler.cleanup_output.
+
+Each case runs on synthetic inputs (many short lines, few huge lines, CRLF line
+endings, long tagged responses) and reports throughput (MB/s, best of --repeat runs)
+and peak traced memory. Results can be stored as baselines and checked against them:
+
+    python3 benchmarks/bench_hotpaths.py                      # report only
+    python3 benchmarks/bench_hotpaths.py --update-baselines   # store results as the new baselines
+    python3 benchmarks/bench_hotpaths.py --check              # exit 1 on regressions
+
+Only the peak memory relative to the input size does not depend on the machine: it
+is the baseline kept in the repository (baselines.json). Throughput baselines are
+stored next to it in baselines.local.json, which is not committed, so --check only
+compares throughput with results measured earlier on the same machine.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tulp import constants, logger
+from tulp.input_handler import chunk_stdin
+from tulp.response_parser import parse_response
+from tulp.output_handler import cleanup_output
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+LOCAL_BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.local.json")
+PORTABLE_METRICS = ("peak_ratio",) # Results that do not depend on the machine
+DEFAULT_SIZES = "64KB,1MB,16MB"
+DEFAULT_THRESHOLD = 0.25
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+CHUNKS_PER_INPUT = 16 # max_chars of the chunking cases is set so every input splits in about this many chunks
+MIN_RUN_SECONDS = 0.02 # Fast cases are looped until a timed run lasts at least this long
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor"]
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+def format_size(size: int) -> str:
+    for unit in ("GB", "MB", "KB"):
+        if size >= SIZE_UNITS[unit] and size % SIZE_UNITS[unit] == 0:
+            return f"{size // SIZE_UNITS[unit]}{unit}"
+    return str(size)
+
+
+# --- Synthetic inputs ---
+
+def _lines(size: int, line_len: int, newline: str = "\n") -> str:
+    rng = random.Random(line_len)
+    line_pool = []
+    for _ in range(64):
+        words, length = [], 0
+        while length < line_len:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        line_pool.append(" ".join(words)[:line_len])
+    text = newline.join(rng.choice(line_pool) for _ in range(size // (line_len + len(newline)) + 1))
+    return text[:size]
+
+def short_lines(size: int) -> str:
+    return _lines(size, 40)
+
+def huge_lines(size: int) -> str:
+    # A handful of lines, each longer than the chunk size
+    return _lines(size, size // 4)
+
+def crlf_lines(size: int) -> str:
+    return _lines(size, 80, "\r\n")
+
+def long_response(size: int) -> str:
+    body = _lines(size, 100)
+    return (f"{constants.TAG_REPLY_START}\n{constants.TAG_STDOUT_START}\n{body}\n{constants.TAG_FILE_END}\n"
+            f"{constants.TAG_STDERR_START}\nGenerated a long response.\n{constants.TAG_FILE_END}\n{constants.TAG_REPLY_END}\n")
+
+def fenced_output(size: int) -> str:
+    return f"```python\n{_lines(size, 60)}\n```\n"
+
+def unclosed_fence(size: int) -> str:
+    # Opening fence without a closing one: the regex scans to the end and backtracks
+    return f"```\n{_lines(size, 60)}\n"
+
+
+# --- Cases: (benchmark name, input name, input factory, function under test) ---
+
+def _chunk(text: str):
+    return chunk_stdin(text, SimpleNamespace(max_chars=max(1024, len(text) // CHUNKS_PER_INPUT)))
+
+CASES: List[Tuple[str, str, Callable[[int], str], Callable[[str], object]]] = [
+    ("chunk_stdin", "short_lines", short_lines, _chunk),
+    ("chunk_stdin", "huge_lines", huge_lines, _chunk),
+    ("chunk_stdin", "crlf_lines", crlf_lines, _chunk),
+    ("parse_response", "long_response", long_response, parse_response),
+    ("parse_response", "crlf_response", lambda size: long_response(size).replace("\n", "\r\n"), parse_response),
+    ("cleanup_output", "fenced_output", fenced_output, cleanup_output),
+    ("cleanup_output", "unclosed_fence", unclosed_fence, cleanup_output),
+]
+
+
+def run_case(func: Callable[[str], object], text: str, repeat: int) -> Dict[str, float]:
+    """Runs func(text): best time per call over `repeat` runs, then one traced run for peak memory."""
+    # Calibrate the calls per timed run so sub-millisecond cases are not dominated by timer noise
+    start = time.perf_counter()
+    func(text)
+    loops = max(1, int(MIN_RUN_SECONDS / max(time.perf_counter() - start, 1e-9)))
+
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(loops):
+            func(text)
+        best = min(best, (time.perf_counter() - start) / loops)
+
+    gc.collect()
+    tracemalloc.start()
+    func(text)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size_mb = len(text) / SIZE_UNITS["MB"]
+    return {
+        "seconds": round(best, 6),
+        "mb_per_s": round(size_mb / best, 2) if best > 0 else float("inf"),
+        # Peak memory allocated by the call, relative to the input size
+        "peak_mb": round(peak / SIZE_UNITS["MB"], 3),
+        "peak_ratio": round(peak / max(1, len(text)), 3),
+    }
+
+
+def run_benchmarks(sizes: List[int], repeat: int, only: str | None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for bench, input_name, make_input, func in CASES:
+        if only and only not in bench:
+            continue
+        for size in sizes:
+            key = f"{bench}/{input_name}/{format_size(size)}"
+            text = make_input(size)
+            results[key] = run_case(func, text, repeat)
+            r = results[key]
+            print(f"{key:45s} {r['mb_per_s']:10.2f} MB/s {r['seconds'] * 1000:10.2f} ms   peak {r['peak_mb']:9.2f} MB ({r['peak_ratio']:.2f}x input)")
+            del text
+    return results
+
+
+def load_baselines(path: str) -> Dict[str, Dict[str, float]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def update_baselines(path: str, results: Dict[str, Dict[str, float]]):
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dict(sorted(baselines.items())), f, indent=2)
+        f.write("\n")
+    print(f"Baselines updated: {path}")
+
+
+def check_regressions(results: Dict[str, Dict[str, float]], baselines: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """
+    Lists the cases that are slower or use more memory than their baseline beyond the
+    threshold. Throughput is only compared when the baseline has it (local baselines).
+    """
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if not baseline:
+            continue
+        if "mb_per_s" in baseline and result["mb_per_s"] < baseline["mb_per_s"] * (1 - threshold):
+            regressions.append(f"{key}: throughput {result['mb_per_s']} MB/s < baseline {baseline['mb_per_s']} MB/s")
+        if "peak_ratio" in baseline and result["peak_ratio"] > baseline["peak_ratio"] * (1 + threshold) + 0.05:
+            regressions.append(f"{key}: peak memory {result['peak_ratio']}x input > baseline {baseline['peak_ratio']}x")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for tulp's chunking, parsing and output cleanup hot paths.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma separated input sizes, e.g. 64KB,1MB,1GB (default: {DEFAULT_SIZES})")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case, the best one is reported (default: 5)")
+    parser.add_argument("--only", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--check", action="store_true", help="Compare with the baselines and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"Allowed relative regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--update-baselines", action="store_true", help=f"Store the memory results in {os.path.relpath(BASELINES_FILE)} and all of them in {os.path.relpath(LOCAL_BASELINES_FILE)}")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON to FILE")
+    args = parser.parse_args()
+
+    logger.set_global_log_level("ERROR") # chunk_stdin warns about large inputs on every call
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    results = run_benchmarks(sizes, max(1, args.repeat), args.only)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baselines:
+        update_baselines(BASELINES_FILE, {key: {name: result[name] for name in PORTABLE_METRICS} for key, result in results.items()})
+        update_baselines(LOCAL_BASELINES_FILE, results)
+
+    if args.check:
+        baselines = load_baselines(BASELINES_FILE)
+        if not baselines:
+            print(f"No baselines found at {BASELINES_FILE}. Run with --update-baselines first.", file=sys.stderr)
+            return 1
+        local_baselines = load_baselines(LOCAL_BASELINES_FILE)
+        if not local_baselines:
+            print(f"No throughput baselines of this machine ({os.path.relpath(LOCAL_BASELINES_FILE)}), only memory is checked. Run with --update-baselines to create them.")
+        # Throughput from this machine's own baselines, memory from the portable ones
+        regressions = check_regressions(results, {key: {**local_baselines.get(key, {}), **baseline} for key, baseline in baselines.items()}, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from tulp.llms import LlmGemini
+from tulp.llms.LlmGemini import ModelInstances, ContextCaches
+
+# Offline tests of the Gemini client caches: they only need factories, not the google-generativeai library
+
+def _contents(prefix_chars):
+    return [
+        {"role": "user", "parts": ["d" * prefix_chars]},
+        {"role": "model", "parts": ["partial reply"]},
+        {"role": "user", "parts": ["continue"]},
+    ]
+
+
+def test_gemini_model_instances_memoized():
+    instances = ModelInstances()
+    keys = [("gemini-pro", f"system-{i % 3}", ()) for i in range(30)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda key: instances.get(key, lambda: object()), keys))
+    assert instances.created == 3
+    assert results[0] is results[3] and results[0] is not results[1]
+
+def test_gemini_context_cache_for_repeated_prefix():
+    created = []
+    caches = ContextCaches(lambda system, prefix, ttl: created.append(len(prefix)) or f"cache-{len(created)}", min_chars=1000)
+    # Small prefixes are always sent in full
+    assert caches.lookup("system", _contents(10)) == (None, _contents(10))
+    # A large prefix is cached the second time it is sent, then reused: only the messages after the document are sent
+    assert caches.lookup("system", _contents(2000)) == (None, _contents(2000))
+    assert caches.lookup("system", _contents(2000)) == ("cache-1", _contents(2000)[1:])
+    assert caches.lookup("system", _contents(2000)) == ("cache-1", _contents(2000)[1:])
+    assert created == [1]
+
+def test_gemini_context_cache_for_continuations():
+    created = []
+    caches = ContextCaches(lambda system, prefix, ttl: created.append(prefix) or "cache", min_chars=100)
+    document = [{"role": "user", "parts": ["d" * 500]}]
+    # The first request sends the document alone, every continuation resends it with a new anchor
+    assert caches.lookup("system", document) == (None, document)
+    for i in range(1, 5):
+        tail = [{"role": "model", "parts": [f"partial reply {i}"]}, {"role": "user", "parts": ["continue"]}]
+        assert caches.lookup("system", document + tail) == ("cache", tail)
+    assert created == [document]
+
+def test_gemini_context_cache_failure_not_retried():
+    attempts = []
+    def create(system, prefix, ttl):
+        attempts.append(1)
+        raise RuntimeError("caching not supported by this model")
+    caches = ContextCaches(create, min_chars=1000)
+    for _ in range(4):
+        assert caches.lookup("s" * 2000, _contents(0)) == (None, _contents(0))
+    assert len(attempts) == 1
+
+def test_gemini_context_cache_created_from_the_document(monkeypatch):
+    calls = []
+    class CachedContent:
+        @staticmethod
+        def create(**kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(name=f"cachedContents/{len(calls)}")
+    # Records the arguments the client passes to google.generativeai.caching
+    monkeypatch.setattr(LlmGemini, "caching", SimpleNamespace(CachedContent=CachedContent))
+    client = SimpleNamespace(model_name="gemini-1.5-flash-002")
+    caches = ContextCaches(lambda system, prefix, ttl: LlmGemini.Client._create_context_cache(client, system, prefix, ttl), min_chars=100)
+    contents = _contents(500)
+    caches.lookup("system", contents[:1])
+    cache, remaining = caches.lookup("system", contents)
+    assert cache.name == "cachedContents/1" and remaining == contents[1:]
+    assert calls == [{"model": "gemini-1.5-flash-002", "system_instruction": "system", "contents": contents[:1], "ttl": LlmGemini.datetime.timedelta(seconds=LlmGemini.CONTEXT_CACHE_TTL)}]
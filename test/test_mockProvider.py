@@ -0,0 +1,415 @@
+import gzip
+import json
+from utils import execute
+
+# Offline tests: the mock provider derives its replies from the prompt, no API key needed
+
+LINES = "\n".join(f"line {i} of the mock test input" for i in range(1, 41))
+
+
+def test_mock_echo():
+    cmd = "printf 'hello\\nworld' | ./main.py --model mock 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "hello\nworld"
+
+def test_mock_request_mode():
+    cmd = "./main.py --model mock:upper 'say hello' < /dev/null"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "SAY HELLO"
+
+def test_mock_parallel_chunks_keep_order():
+    cmd = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 200 --jobs 4 --mock_latency uniform:0:0.05 'uppercase'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == LINES.upper()
+
+def test_mock_truncation_with_continuations():
+    cmd = f"printf '{LINES}' | ./main.py --model mock --mock_truncate_rate 0.5 --mock_seed 7 --cont 20 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == LINES
+
+def test_mock_prefilled_continuations_keep_repeated_lines():
+    from tulp.core import stitch_continuation
+    # A prefilled continuation resumes at the anchor: repeating the end of the partial reply is real output
+    assert stitch_continuation("a repeated line\na repeated line\n", "\na repeated line\nend", prefilled=True) == "a repeated line\na repeated line\na repeated line\nend"
+    repeated = "\\n".join(["the same line again"] * 40)
+    cmd = f"printf '{repeated}' | ./main.py --model mock --mock_max_output_chars 300 --cont 20 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == repeated.replace("\\n", "\n")
+
+def test_mock_code_fences_stripped():
+    # Fences wrapping a reply are removed once, where the reply's stdout is read
+    for options in ("", "--max-chars 20 --reduce"):
+        result = execute(f"printf '```python\\nprint(1)\\n```' | ./main.py --model mock {options} 'repeat the input'")
+        assert result.returncode == 0
+        assert result.stdout.decode().strip() == "print(1)"
+
+def test_mock_output_chars():
+    cmd = "echo short | ./main.py --model mock --mock_output_chars 5000 --mock_truncate_rate 0.8 --cont 30 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert len(result.stdout.decode().strip()) == 5000
+
+def test_mock_error_block():
+    cmd = "echo data | ./main.py --model mock --mock_error_rate 1 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode != 0
+    assert "Mock error" in result.stderr.decode()
+
+def test_mock_failed_chunk_leaves_partial_output(tmp_path):
+    # With this seed the first chunks succeed and a later one gets an error block
+    cmd = f"printf '{LINES}' | ./main.py --model mock --max-chars 300 --mock_error_rate 0.3 --mock_seed 4 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 1
+    printed = result.stdout.decode().strip()
+    # The chunks before the failure were streamed to stdout, the output is reported as incomplete
+    assert printed and LINES.startswith(printed) and printed != LINES
+    assert "the output is incomplete" in result.stderr.decode()
+    # A file target is only replaced when every chunk succeeded
+    output_file = tmp_path / "out.txt"
+    output_file.write_text("previous output\n")
+    result = execute(f"{cmd} -w {output_file}")
+    assert result.returncode == 1
+    assert output_file.read_text() == "previous output\n"
+
+def test_mock_rate_limit():
+    cmd = "echo data | ./main.py --model mock --mock_rate_limit_rate 1 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode != 0
+    assert result.stdout.decode().strip() == ""
+
+def test_mock_reduce():
+    cmd = f"printf '{LINES}' | ./main.py --model mock --max-chars 300 --reduce 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == LINES
+
+def test_mock_reduce_with_jobs(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    # Chunks are sent one at a time unless --jobs is given
+    result = execute(f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 300 --reduce --metrics-json {metrics_file} 'uppercase'")
+    assert result.returncode == 0
+    assert json.loads(metrics_file.read_text())["jobs"] == 1
+    # Concurrent map and reduce steps finishing out of order keep the partial results in input order
+    cmd = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 300 --reduce --jobs 4 --mock_latency uniform:0:0.05 --metrics-json {metrics_file} 'uppercase'"
+    parallel = execute(cmd)
+    assert parallel.returncode == 0
+    assert parallel.stdout == result.stdout
+    assert parallel.stdout.decode().strip() == LINES.upper()
+    report = json.loads(metrics_file.read_text())
+    assert report["jobs"] == 4
+    assert report["num_chunks"] > 1
+
+def test_mock_rolling_context(tmp_path):
+    cmd = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 300 --context-chars 500 --inspect-dir {tmp_path} 'uppercase'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    # The context block of every reply is fed into the next chunk's prompt, never into the output
+    assert result.stdout.decode().strip() == LINES.upper()
+    assert "Mock context" not in result.stdout.decode()
+    log_files = list(tmp_path.glob("*/inspect.jsonl"))
+    assert len(log_files) == 1
+    records = [json.loads(line) for line in log_files[0].read_text().splitlines()]
+    messages = {r["id"]: r for r in records if r["type"] == "message"}
+    exchanges = [r for r in records if r["type"] == "exchange"]
+    assert len(exchanges) > 1
+    for previous, exchange in zip(exchanges, exchanges[1:]):
+        user_prompt = next(messages[i]["content"] for i in exchange["request"] if messages[i]["role"] == "user")
+        assert f"Mock context for request {previous['request_hash']}." in user_prompt
+
+def test_mock_execute_mode():
+    cmd = "printf 'abc' | ./main.py --model mock:upper -x 'uppercase the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "ABC"
+
+def test_mock_metrics_json(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    cmd = f"printf '{LINES}' | ./main.py --model mock --max-chars 200 --metrics-json {metrics_file} 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    report = json.loads(metrics_file.read_text())
+    assert report["model"] == "mock"
+    assert report["totals"]["chunks"] == report["num_chunks"] > 1
+    assert report["totals"]["output_tokens"] > 0
+
+def test_mock_record_and_replay(tmp_path):
+    record_cmd = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 200 --inspect-dir {tmp_path} --inspect-compress gzip 'uppercase'"
+    recorded = execute(record_cmd)
+    assert recorded.returncode == 0
+    log_files = list(tmp_path.glob("*/inspect.jsonl.gz"))
+    assert len(log_files) == 1
+    with gzip.open(log_files[0], "rt") as f:
+        records = [json.loads(line) for line in f]
+    assert any(r["type"] == "exchange" for r in records)
+
+    replay_cmd = f"printf '{LINES}' | ./main.py --model replay:{tmp_path} --max-chars 200 'uppercase'"
+    replayed = execute(replay_cmd)
+    assert replayed.returncode == 0
+    assert replayed.stdout == recorded.stdout
+
+def test_mock_in_process_runs(monkeypatch, capsysbinary):
+    import io
+    import pytest
+    from tulp import cli
+    from tulp.metrics import metrics
+    # cli.run(argv) can run repeatedly in one process, with fresh arguments, config and metrics each time
+    for transform, expected in (("upper", "HELLO"), ("lower", "hello")):
+        monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO(b"Hello")))
+        with pytest.raises(SystemExit) as exit_info:
+            cli.run(["--model", f"mock:{transform}", "-q", "transform the input"])
+        assert exit_info.value.code == 0
+        assert capsysbinary.readouterr().out.decode().strip() == expected
+        assert metrics.to_dict()["totals"]["requests"] == 1
+
+def test_mock_cascade_escalates_on_validation(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    cmd = f"printf 'hello' | ./main.py --cascade mock:lower,mock:upper --validate 'grep -q HELLO' --metrics-json {metrics_file} 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == "HELLO"
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["escalations"] == 1
+    assert report["totals"]["models"] == {"mock:upper": 1}
+
+def test_mock_validation_failure():
+    cmd = "printf 'hello' | ./main.py --model mock --validate false 'repeat the input'"
+    result = execute(cmd)
+    assert result.returncode != 0
+    assert "--validate" in result.stderr.decode()
+
+def test_mock_hedged_requests(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    base = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 40 --jobs 4 --mock_latency lognormal:0.01:1.5 --mock_seed 5"
+    plain = execute(f"{base} 'uppercase'")
+    hedged = execute(f"{base} --hedge 75 --metrics-json {metrics_file} 'uppercase'")
+    assert hedged.returncode == 0
+    assert hedged.stdout == plain.stdout
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["hedged_requests"] > 0
+
+def test_mock_failover_chain(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    record_cmd = f"printf '{LINES}' | ./main.py --model mock:upper --max-chars 200 --jobs 1 --inspect-dir {tmp_path} 'uppercase'"
+    recorded = execute(record_cmd)
+    assert recorded.returncode == 0
+    # Every request to the mock fails with a 429: the chain moves to the recordings and stays there
+    failover_cmd = (f"printf '{LINES}' | ./main.py --model mock:upper --mock_rate_limit_rate 1 --max-chars 200 --jobs 1 "
+                    f"--failover replay:{tmp_path} --metrics-json {metrics_file} 'uppercase'")
+    result = execute(failover_cmd)
+    assert result.returncode == 0
+    assert result.stdout == recorded.stdout
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["failovers"] == 1
+
+def test_mock_duplicate_chunks_sent_once(tmp_path):
+    metrics_file = tmp_path / "metrics.json"
+    block = "\\n".join(f"repeated record {i}" for i in range(8)) + "\\n"
+    cmd = f"printf '{block * 4}' | ./main.py --model mock:upper --max-chars {len(block) - 3} --jobs 3 --metrics-json {metrics_file} 'uppercase'"
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == (block * 4).replace("\\n", "\n").upper().strip()
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["requests"] == 1
+    assert report["totals"]["duplicate_chunks"] == 3
+    assert report["totals"]["saved_requests"] == 3
+
+def test_mock_per_record_cache(tmp_path):
+    cache = tmp_path / "records.sqlite3"
+    metrics_file = tmp_path / "metrics.json"
+    first = execute(f"printf 'apple\\nbanana\\n\\napple' | ./main.py --model mock:upper --per-record --record-cache {cache} 'uppercase'")
+    assert first.returncode == 0
+    assert first.stdout.decode().strip() == "APPLE\nBANANA\n\nAPPLE"
+    # Only the new record is sent, the output keeps the input order
+    second = execute(f"printf 'cherry\\nbanana\\napple' | ./main.py --model mock:upper --per-record --record-cache {cache} --metrics-json {metrics_file} 'uppercase'")
+    assert second.returncode == 0
+    assert second.stdout.decode().strip() == "CHERRY\nBANANA\nAPPLE"
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["cached_records"] == 2
+    assert report["totals"]["sent_records"] == 1
+
+def test_mock_per_record_empty_last_result(tmp_path):
+    cache = tmp_path / "records.sqlite3"
+    # The reply is cut to "1\tAPPLE\n2\t": the empty result of the last record loses its tab when stripped
+    result = execute(f"printf 'apple\\nkiwi' | ./main.py --model mock:upper --mock_output_chars 10 --per-record --record-cache {cache} 'uppercase'")
+    assert result.returncode == 0
+    assert result.stdout.decode().rstrip("\n") == "APPLE"
+    assert "missing from the replies" not in result.stderr.decode()
+
+def test_mock_csv_chunks_repeat_header(tmp_path):
+    input_file = tmp_path / "input.csv"
+    rows = [f'{i},"note {i}\nspans two lines"' for i in range(30)]
+    input_file.write_text("id,note\n" + "\n".join(rows))
+    metrics_file = tmp_path / "metrics.json"
+    result = execute(f"./main.py --model mock --max-chars 200 --metrics-json {metrics_file} 'repeat the input' < {input_file}")
+    assert result.returncode == 0
+    report = json.loads(metrics_file.read_text())
+    assert report["input_format"] == "csv"
+    # Every chunk is a CSV document on its own (header repeated, quoted fields never cut),
+    # the repeated headers are dropped when the outputs are merged
+    assert report["num_chunks"] > 1
+    assert result.stdout.decode().strip() == input_file.read_text()
+
+def test_mock_json_array_outputs_merged(tmp_path):
+    input_file = tmp_path / "input.json"
+    items = [{"id": i, "name": f"item {i}"} for i in range(40)]
+    input_file.write_text(json.dumps(items, indent=2))
+    metrics_file = tmp_path / "metrics.json"
+    result = execute(f"./main.py --model mock --max-chars 300 --jobs 4 --metrics-json {metrics_file} 'repeat the input' < {input_file}")
+    assert result.returncode == 0
+    report = json.loads(metrics_file.read_text())
+    assert report["num_chunks"] > 1
+    assert report["output_format"] == "json"
+    assert json.loads(result.stdout.decode()) == items
+
+def test_mock_diff_and_list_outputs_joined_as_text(tmp_path):
+    # Outputs starting with "---" or "- " are not YAML documents: the chunks are joined as they are
+    diff = "".join(f"--- a/f{i}.py\n+++ b/f{i}.py\n@@ -1 +1 @@\n-old {i}\n+new {i}\n" for i in range(6))
+    items = "".join(f"- item {i} of the list\n" for i in range(20))
+    for name, text in (("input.diff", diff), ("input.md", items)):
+        input_file = tmp_path / name
+        input_file.write_text(text)
+        metrics_file = tmp_path / f"{name}.metrics.json"
+        result = execute(f"./main.py --model mock --max-chars 100 --metrics-json {metrics_file} 'repeat the input' < {input_file}")
+        assert result.returncode == 0
+        report = json.loads(metrics_file.read_text())
+        assert report["num_chunks"] > 1
+        assert report["output_format"] == "text"
+        assert result.stdout.decode() == text
+
+def test_mock_execute_mode_samples_large_input(tmp_path):
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(f"record {i}" for i in range(20000)))
+    metrics_file = tmp_path / "metrics.json"
+    result = execute(f"./main.py --model mock:upper -x --sample-chars 1000 --metrics-json {metrics_file} 'uppercase the input' < {input_file}")
+    assert result.returncode == 0
+    # The program runs on the whole input, the prompt only holds a sample of it
+    assert result.stdout.decode().strip() == input_file.read_text().upper()
+    report = json.loads(metrics_file.read_text())
+    assert report["totals"]["input_tokens"] < 2000
+
+def test_mock_bracketed_log_is_not_json(tmp_path):
+    input_file = tmp_path / "input.log"
+    input_file.write_text("".join(f"[2024-01-01 10:00:{i:02d}] INFO request {i} done\n" for i in range(30)))
+    metrics_file = tmp_path / "metrics.json"
+    for options in ("--input-format auto", "--input-format json"):
+        result = execute(f"./main.py --model mock --max-chars 300 {options} --inspect-dir {tmp_path} --metrics-json {metrics_file} 'repeat the input' < {input_file}")
+        assert result.returncode == 0
+        assert result.stdout.decode() == input_file.read_text()
+        report = json.loads(metrics_file.read_text())
+        assert report["num_chunks"] > 1
+        # The prompts and the metrics tell the format the chunks were actually cut by
+        assert report["input_format"] == ("log" if options.endswith("auto") else "text")
+    prompts = "".join(log_file.read_text() for log_file in tmp_path.glob("*/inspect.jsonl"))
+    assert "request 29 done" in prompts and "complete JSON document" not in prompts
+
+def test_mock_compact_json_table(tmp_path):
+    input_file = tmp_path / "input.json"
+    items = [{"id": i, "name": f"item {i}", "tags": ["a", "b"]} for i in range(60)]
+    input_file.write_text(json.dumps(items, indent=4))
+    metrics_file = tmp_path / "metrics.json"
+    result = execute(f"./main.py --model mock --compact --restore-format --max-chars 600 --metrics-json {metrics_file} 'repeat the input' < {input_file}")
+    assert result.returncode == 0
+    # The array is sent as a table, split between rows, and written back with the original indentation
+    assert result.stdout.decode().strip() == json.dumps(items, indent=4)
+    report = json.loads(metrics_file.read_text())
+    assert report["input_format"] == "table"
+    assert report["input_chars"] < report["compacted_from_chars"] / 3
+    assert report["num_chunks"] > 1
+
+def test_mock_capabilities_size_chunks_and_pace(tmp_path):
+    capabilities_file = tmp_path / "capabilities.json"
+    capabilities_file.write_text(json.dumps([{"idRe": "mock.*", "max_output_tokens": 500, "rpm": 1200}]))
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(f"line {i} of the capabilities test input" for i in range(100)))
+    metrics_file = tmp_path / "metrics.json"
+    result = execute(f"./main.py --model mock:upper --jobs 4 --capabilities-file {capabilities_file} --metrics-json {metrics_file} 'uppercase' < {input_file}")
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == input_file.read_text().upper()
+    report = json.loads(metrics_file.read_text())
+    # Replies must fit 500 output tokens: the default --max-chars is lowered, and concurrent requests are spaced
+    assert report["max_chars"] == 1200
+    assert report["num_chunks"] > 2
+    assert report["totals"]["paced_requests"] > 0
+    # A --max-chars set by the user is kept, with a warning
+    result = execute(f"./main.py --model mock:upper --max-chars 3000 --capabilities-file {capabilities_file} --metrics-json {metrics_file} 'uppercase' < {input_file}")
+    assert result.returncode == 0
+    assert "exceeds the limits of mock:upper" in result.stderr.decode()
+    assert json.loads(metrics_file.read_text())["max_chars"] == 3000
+
+def test_mock_adaptive_chunks_learn_output_limit(tmp_path):
+    input_file = tmp_path / "input.txt"
+    input_file.write_text("\n".join(f"line {i} of the adaptive chunking test" for i in range(500)))
+    stats_file = tmp_path / "chunk_stats.json"
+    metrics_file = tmp_path / "metrics.json"
+    cmd = (f"./main.py --model mock:upper --max-chars 6000 --jobs 1 --cont 10 --mock_max_output_chars 1000 --adaptive-chunks "
+           f"--chunk-stats {stats_file} --metrics-json {metrics_file} 'uppercase' < {input_file}")
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert result.stdout.decode().strip() == input_file.read_text().upper()
+    report = json.loads(metrics_file.read_text())
+    # The first chunk is cut off and continued, the remaining input is re-split into chunks whose reply fits
+    continuations = [chunk["continuations"] for chunk in report["chunks"]]
+    assert continuations[0] > 0 and sum(continuations[1:]) == 0
+    assert report["num_chunks"] == len(continuations)
+    stats = json.loads(stats_file.read_text())["mock:upper filter text"]
+    assert stats["output_limit"] < 1000
+
+    # The next run starts from the learned sizes
+    result = execute(cmd)
+    assert result.returncode == 0
+    assert json.loads(metrics_file.read_text())["totals"]["continuations"] == 0
+
+def test_mock_write_keeps_file_permissions(tmp_path):
+    import os
+    import stat
+    output_file = tmp_path / "out.txt"
+    # A new file gets the permissions of the umask, a replaced one keeps its own (and so does its backup)
+    result = execute(f"umask 022; echo first | ./main.py --model mock -w {output_file} 'repeat the input'")
+    assert result.returncode == 0
+    assert stat.S_IMODE(os.stat(output_file).st_mode) == 0o644
+    os.chmod(output_file, 0o640)
+    result = execute(f"echo second | ./main.py --model mock -w {output_file} 'repeat the input'")
+    assert result.returncode == 0
+    assert output_file.read_text().strip() == "second"
+    assert stat.S_IMODE(os.stat(output_file).st_mode) == 0o640
+    assert [stat.S_IMODE(os.stat(backup).st_mode) for backup in tmp_path.glob("out.backup-*")] == [0o640]
+
+def test_mock_log_json_sink(tmp_path):
+    log_file = tmp_path / "log.jsonl"
+    result = execute(f"printf '{LINES}' | ./main.py --model mock --max-chars 300 --log-json {log_file} 'repeat the input'")
+    assert result.returncode == 0
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert records
+    for record in records:
+        assert record["level"] in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+        assert isinstance(record["msg"], str) and record["msg"]
+    # Records logged while a chunk is processed carry its number
+    assert {record["chunk"] for record in records} >= {None, 1, 2}
+
+def test_pricing_estimate():
+    from tulp.pricing import estimate_cost, format_cost
+    # USD per 1M input and output tokens from the built-in table, first match wins
+    assert estimate_cost("gpt-4o", {"input_tokens": 1_000_000, "output_tokens": 100_000}) == 2.50 + 1.00
+    assert estimate_cost("gpt-4o-mini", {"input_tokens": 2_000_000}) == 0.30
+    assert estimate_cost("ollama.llama3", {"input_tokens": 5000, "output_tokens": 5000}) == 0.0
+    assert estimate_cost("unknown-model", {"input_tokens": 5000}) is None
+    assert format_cost(None) == "unknown" and format_cost(0.5) == "$0.5000"
+
+def test_mock_max_cost_stops_the_run(tmp_path):
+    pricing_file = tmp_path / "pricing.json"
+    pricing_file.write_text(json.dumps([{"idRe": "mock.*", "input": 1000, "output": 1000}]))
+    metrics_file = tmp_path / "metrics.json"
+    cmd = (f"printf '{LINES}' | ./main.py --model mock --max-chars 200 --pricing-file {pricing_file} --max-cost 0.001 "
+           f"--metrics-json {metrics_file} 'repeat the input'")
+    result = execute(cmd)
+    # The first chunk already spends the budget: the next one is never sent
+    assert result.returncode != 0
+    assert "Cost budget reached" in result.stderr.decode()
+    report = json.loads(metrics_file.read_text())
+    assert report["num_chunks"] > 1
+    assert report["totals"]["requests"] < report["num_chunks"]
@@ -0,0 +1,23 @@
+from tulp.llms.LlmOllama import plan_context, parse_keep_alive, MIN_NUM_CTX, MAX_NUM_CTX
+
+# Offline tests of the Ollama request options: they do not need the ollama library or server
+
+
+def test_ollama_context_fits_the_planned_chunk():
+    num_ctx, num_predict = plan_context(6000)
+    # Prompt overhead, a 2000-token chunk and a reply as long as the chunk
+    assert num_ctx % 1024 == 0 and num_ctx >= 1024 + 2000 + num_predict
+    assert num_predict >= 2000
+    assert MIN_NUM_CTX <= plan_context(10)[0] <= 4096
+
+def test_ollama_context_capped():
+    assert plan_context(10_000_000)[0] == MAX_NUM_CTX
+    assert plan_context(10_000_000, model_context=8192) == (8192, 4096)
+    # An explicit num_ctx is used as is, the reply keeps at most half of it
+    assert plan_context(10_000_000, model_context=8192, num_ctx=65536) == (65536, 32768)
+
+def test_ollama_keep_alive_numbers_sent_as_seconds():
+    # The server parses strings as durations, which need a unit
+    assert parse_keep_alive("-1") == -1
+    assert parse_keep_alive(" 300 ") == 300
+    assert parse_keep_alive("30m") == "30m"
@@ -0,0 +1,194 @@
+# adaptive.py
+import json
+import math
+import os
+import threading
+import time
+from typing import List, Dict, Any, Iterator
+from . import constants
+from .logger import log
+from .metrics import metrics
+from .input_handler import split_records
+from .response_parser import has_reply_end
+
+
+def _ewma(average: float | None, value: float) -> float:
+    """Running average giving ADAPTIVE_SMOOTHING weight to the latest value."""
+    if average is None:
+        return value
+    return average + constants.ADAPTIVE_SMOOTHING * (value - average)
+
+
+class ChunkSizeController:
+    """
+    Feedback controller of the chunk size (--adaptive-chunks).
+
+    It learns, from the chunks answered so far (and from earlier runs, see
+    load_chunk_stats), the output/input size ratio of the request, the number of
+    output characters a single reply can hold (estimated from the replies that were
+    cut off), the truncation rate and the throughput. The next chunk is sized so
+    that its reply fits one response and is done within the target latency, never
+    above max_chars.
+    """
+
+    def __init__(self, max_chars: int, target_latency: float = 0.0, stats: Dict[str, Any] | None = None):
+        self.max_chars = max_chars
+        self.target_latency = target_latency
+        stats = stats or {}
+        self.output_ratio: float | None = stats.get("output_ratio") # Output chars per input char
+        self.output_limit: float | None = stats.get("output_limit") # Output chars a reply can hold (None: no truncation seen)
+        self.truncation_rate: float = stats.get("truncation_rate", 0.0)
+        self.chars_per_second: float | None = stats.get("chars_per_second") # Input chars processed per second
+        self.chunks: int = stats.get("chunks", 0)
+        self._lock = threading.Lock()
+
+    def next_size(self) -> int:
+        """Size in characters of the next chunk."""
+        with self._lock:
+            size = self.max_chars
+            if self.output_limit and self.output_ratio:
+                # Frequent truncations leave a wider margin
+                fill = constants.ADAPTIVE_OUTPUT_FILL * (1 - self.truncation_rate / 2)
+                size = min(size, int(self.output_limit * fill / self.output_ratio))
+            if self.target_latency > 0 and self.chars_per_second:
+                size = min(size, int(self.target_latency * self.chars_per_second))
+            return max(min(constants.MIN_ADAPTIVE_CHUNK_CHARS, self.max_chars), size)
+
+    def observe(self, input_chars: int, output_chars: int, seconds: float, replies: int, complete: bool):
+        """
+        Learns from an answered chunk: its size, the size of its output, the time
+        spent on it and the number of replies it took (1 plus its continuations).
+        """
+        if input_chars <= 0:
+            return
+        truncated = replies > 1 or not complete
+        with self._lock:
+            self.chunks += 1
+            self.truncation_rate = _ewma(self.truncation_rate, 1.0 if truncated else 0.0)
+            if seconds > 0:
+                self.chars_per_second = _ewma(self.chars_per_second, input_chars / seconds)
+            if complete:
+                self.output_ratio = _ewma(self.output_ratio, max(output_chars, 1) / input_chars)
+            if truncated:
+                # Every reply but the last one was cut at the limit
+                estimate = output_chars / replies
+                self.output_limit = estimate if self.output_limit is None else min(self.output_limit, estimate)
+            elif self.output_limit is not None and output_chars > self.output_limit:
+                # A longer reply fitted: the limit was underestimated
+                self.output_limit = output_chars
+
+    def to_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "output_ratio": self.output_ratio,
+                "output_limit": self.output_limit,
+                "truncation_rate": round(self.truncation_rate, 4),
+                "chars_per_second": self.chars_per_second,
+                "chunks": self.chunks,
+                "updated": time.time(),
+            }
+
+
+class AdaptiveChunker:
+    """
+    Iterable of the chunks of an input, cut lazily at record boundaries: each chunk
+    is sized by the controller when it is pulled, so the remaining input is re-split
+    as soon as the replies of the previous chunks change the controller's estimates.
+    """
+
+    def __init__(self, input_text: str, input_format: str, controller: ChunkSizeController):
+        self.input_format, self.header, self.records, self.join = split_records(input_text, input_format)
+        self.controller = controller
+        self.split_long = self.input_format in ("text", "log")
+        self.chunks: List[str] = [] # Chunks cut so far
+        self.estimates: List[int] = [] # Estimated number of chunks when each chunk was cut
+        self._remaining = sum(len(record) + 1 for record in self.records)
+
+    def estimated_total(self) -> int:
+        """Chunks cut so far plus the chunks of the remaining input at the current size."""
+        return len(self.chunks) + math.ceil(self._remaining / max(1, self.controller.next_size() - len(self.header)))
+
+    def __iter__(self) -> Iterator[str]:
+        records = self.records
+        position = 0
+        while position < len(records):
+            size = self.controller.next_size()
+            budget = max(1, size - len(self.header) - (1 if self.header else 0))
+            current: List[str] = []
+            current_len = 0
+            while position < len(records):
+                record = records[position]
+                if len(record) > budget and not current:
+                    if self.split_long:
+                        # The rest of the record stays in place for the next chunk
+                        current.append(record[:budget])
+                        records[position] = record[budget:]
+                        self._remaining -= budget
+                    else:
+                        log.warning(f"A single record ({len(record)} chars) exceeds the chunk size ({size}). Sending it whole to keep it valid.")
+                        current.append(record)
+                        position += 1
+                        self._remaining -= len(record) + 1
+                    break
+                if current and current_len + 1 + len(record) > budget:
+                    break
+                current_len += len(record) + (1 if current else 0)
+                current.append(record)
+                position += 1
+                self._remaining -= len(record) + 1
+            chunk = self.join(self.header, current)
+            self.chunks.append(chunk)
+            self.estimates.append(max(len(self.chunks), self.estimated_total()))
+            log.debug(f"Chunk {len(self.chunks)} cut at {len(chunk)} chars (target size {size}).")
+            yield chunk
+
+    def observe(self, index: int, parsed_response: Dict[str, str], seconds: float):
+        """Feeds the controller with the reply to chunk index (see core.process_request)."""
+        continuations = metrics.get_chunk(f"chunk_{index}")["continuations"]
+        output = parsed_response.get(constants.BLOCK_STDOUT, "")
+        self.controller.observe(len(self.chunks[index]), len(output), seconds, 1 + continuations, has_reply_end(parsed_response))
+
+
+def stats_key(model: str, mode: str, input_format: str) -> str:
+    """Chunk statistics are kept per model and type of request (mode and input format)."""
+    return f"{model} {mode} {input_format}"
+
+
+def load_chunk_stats(path: str, key: str) -> Dict[str, Any] | None:
+    """The statistics stored for key by earlier runs, or None."""
+    path = os.path.expanduser(path)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, AttributeError) as e:
+        log.warning(f"Ignoring the chunk statistics in '{path}': {e}")
+        return None
+
+
+def save_chunk_stats(path: str, key: str, stats: Dict[str, Any]) -> bool:
+    """Stores the statistics of key, keeping those of other keys. Returns False (after logging) on failure."""
+    path = os.path.expanduser(path)
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                all_stats = json.load(f)
+            if not isinstance(all_stats, dict):
+                all_stats = {}
+        except (FileNotFoundError, ValueError):
+            all_stats = {}
+        all_stats[key] = stats
+        # Replaced atomically, so concurrent runs never read a partial file
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(all_stats, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    except OSError as e:
+        log.error(f"Failed to save the chunk statistics to '{path}': {e}")
+        return False
+    log.debug(f"Chunk statistics for '{key}' saved to {path}")
+    return True
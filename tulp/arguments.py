@@ -14,14 +14,23 @@ def _validate_model_type(arg_value):
    log.debug(f"Model '{arg_value}' validated successfully.")
    return arg_value
 
+def _validate_cascade_type(arg_value):
+   """Argparse type checker for comma separated model lists."""
+   models = [model.strip() for model in arg_value.split(",") if model.strip()]
+   if not models:
+       raise argparse.ArgumentTypeError("The cascade needs at least one model.")
+   for model in models:
+       _validate_model_type(model)
+   return ",".join(models)
+
 class TulpArgs:
     """Parses and stores command-line arguments using argparse."""
     _instance = None
 
-    def __new__(cls):
+    def __new__(cls, argv=None):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            cls._instance.args = cls._instance._parse()
+            cls._instance.args = cls._instance._parse(argv)
         return cls._instance
 
     def _load_llm_arguments(self, parser):
@@ -40,8 +49,8 @@ class TulpArgs:
                     default=None # Let config handle default precedence
                 )
 
-    def _parse(self):
-        """Configures and runs the argparse parser."""
+    def _parse(self, argv=None):
+        """Configures and runs the argparse parser on argv (sys.argv[1:] if None)."""
         parser = argparse.ArgumentParser(
             description=f"""TULP v{version.VERSION} - TULP Understands Language Promptly:
 A command-line tool, in the best essence of POSIX tooling, that helps you
@@ -63,26 +72,160 @@ Currently supported model patterns:
             '-w', '--write', type=str, metavar='FILE',
             help='Write the main output (<|||stdout|||>) to FILE. Creates backups (.backup-N) if FILE exists.'
         )
+        parser.add_argument(
+            '--max-backups', type=int, metavar='N',
+            help=f'Keep at most N backups (.backup-N) of the -w output file, deleting the oldest. 0 disables backups. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}MAX_BACKUPS, default: {constants.DEFAULT_MAX_BACKUPS})'
+        )
         parser.add_argument(
             '--model', type=_validate_model_type, metavar='MODEL_NAME',
             help=f'Select the AI model to use (e.g., gpt-4o, claude-3-opus-20240229, groq.llama3-70b-8192). '
                  f'(Config/Env: {constants.ENV_VAR_PREFIX}MODEL, default: {constants.DEFAULT_MODEL})'
         )
+        parser.add_argument(
+            '--cascade', type=_validate_cascade_type, metavar='MODEL1,MODEL2,...',
+            help=f'Send every chunk to the first (cheapest/fastest) model and escalate it to the next one only when the reply is incomplete, '
+                 f'reports an error or fails --validate. Replaces --model. (Config/Env: {constants.ENV_VAR_PREFIX}CASCADE)'
+        )
+        parser.add_argument(
+            '--failover', type=_validate_cascade_type, metavar='MODEL1,MODEL2,...',
+            help=f'Fallback models, in order, used for the remaining requests when the provider fails (connection errors, 5xx, '
+                 f'repeated 429s). The failed request is resent with the same prompt. (Config/Env: {constants.ENV_VAR_PREFIX}FAILOVER)'
+        )
+        parser.add_argument(
+            '--failover-cooldown', type=float, metavar='SECONDS',
+            help=f'Seconds before a failed provider is tried again. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}FAILOVER_COOLDOWN, default: {constants.DEFAULT_FAILOVER_COOLDOWN})'
+        )
+        parser.add_argument(
+            '--hedge', type=float, metavar='PCT',
+            help=f'Straggler mitigation: when a request runs longer than the PCT percentile of the observed latencies, send a duplicate '
+                 f'(to --hedge-model if set) and use the first reply. 0 disables it. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}HEDGE, default: {constants.DEFAULT_HEDGE_PERCENTILE})'
+        )
+        parser.add_argument(
+            '--hedge-model', type=_validate_model_type, metavar='MODEL_NAME',
+            help=f'Model for the hedged duplicate requests, the same model by default. (Config/Env: {constants.ENV_VAR_PREFIX}HEDGE_MODEL)'
+        )
+        parser.add_argument(
+            '--validate', type=str, metavar='CMD',
+            help=f'Shell command that checks every chunk\'s output, passed on its stdin. A non-zero exit fails the chunk, '
+                 f'or escalates it to the next --cascade model. (Config/Env: {constants.ENV_VAR_PREFIX}VALIDATE)'
+        )
         parser.add_argument(
             '--max-chars', type=int, metavar='NUM',
             help=f'Max characters per LLM request chunk when processing large stdin. '
                  f'(Config/Env: {constants.ENV_VAR_PREFIX}MAX_CHARS, default: {constants.DEFAULT_MAX_CHARS})'
         )
+        parser.add_argument(
+            '--sample-chars', type=int, metavar='NUM',
+            help=f'Max characters of the stdin excerpt shown to the model in -x mode: larger input is replaced by a summary and '
+                 f'representative records. (Config/Env: {constants.ENV_VAR_PREFIX}SAMPLE_CHARS, default: {constants.DEFAULT_SAMPLE_CHARS})'
+        )
+        parser.add_argument(
+            '--input-format', type=str.lower, choices=constants.INPUT_FORMATS,
+            help=f'Format of stdin, used to split large input only at record boundaries: the CSV header is repeated in every chunk '
+                 f'and JSON arrays are split between elements. (Config/Env: {constants.ENV_VAR_PREFIX}INPUT_FORMAT, default: {constants.DEFAULT_INPUT_FORMAT})'
+        )
+        parser.add_argument(
+            '--compact', action='store_true', default=None,
+            help=f'Compact stdin before chunking to save prompt tokens: JSON is minified (arrays of objects with the same keys become a table), '
+                 f'padding and runs of whitespace are removed from CSV, logs and text. (Config/Env: {constants.ENV_VAR_PREFIX}COMPACT)'
+        )
+        parser.add_argument(
+            '--restore-format', action='store_true', default=None,
+            help=f'With --compact, write JSON output indented like the original input. (Config/Env: {constants.ENV_VAR_PREFIX}RESTORE_FORMAT)'
+        )
+        parser.add_argument(
+            '--output-format', type=str.lower, choices=constants.OUTPUT_FORMATS,
+            help=f'Format of the chunk outputs, used to merge them into one valid document: JSON arrays are concatenated, repeated CSV headers '
+                 f'are dropped, JSONL and text are joined by lines. (Config/Env: {constants.ENV_VAR_PREFIX}OUTPUT_FORMAT, default: {constants.DEFAULT_OUTPUT_FORMAT})'
+        )
         parser.add_argument(
             '--cont', type=int, metavar='N',
             help=f'Automatically ask the model to continue N times if the response seems incomplete (missing <|||end|||>). '
                  f'(Config/Env: {constants.ENV_VAR_PREFIX}CONT, default: {constants.DEFAULT_CONTINUATION_RETRIES})'
         )
+        parser.add_argument(
+            '--jobs', type=int, metavar='N',
+            help=f'Number of chunks sent to the model concurrently when processing large stdin. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}JOBS, default: {constants.DEFAULT_JOBS})'
+        )
+        parser.add_argument(
+            '--adaptive-chunks', action='store_true', default=None,
+            help=f'Size every chunk from the replies to the previous ones (and earlier runs, see --chunk-stats): the remaining input is re-split '
+                 f'into smaller chunks when replies are cut off or slower than --target-latency. --max-chars is the largest size. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}ADAPTIVE_CHUNKS)'
+        )
+        parser.add_argument(
+            '--target-latency', type=float, metavar='SECONDS',
+            help=f'With --adaptive-chunks, the time each chunk should take. 0 disables it. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}TARGET_LATENCY, default: {constants.DEFAULT_TARGET_LATENCY})'
+        )
+        parser.add_argument(
+            '--chunk-stats', type=str, metavar='FILE',
+            help=f'JSON file where --adaptive-chunks keeps what it learned (output/input ratio, reply size limit, truncation rate, throughput) '
+                 f'per model and type of request. (Config/Env: {constants.ENV_VAR_PREFIX}CHUNK_STATS, default: {constants.DEFAULT_CHUNK_STATS})'
+        )
+        parser.add_argument(
+            '--reduce', action='store_true', default=None,
+            help=f'Map-reduce mode for whole-document tasks (summaries, aggregations) over chunked stdin: the request runs on every chunk '
+                 f'in parallel and the partial results are combined until one answer remains. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}REDUCE)'
+        )
+        parser.add_argument(
+            '--per-record', action='store_true', default=None,
+            help=f'Process every stdin line as an independent record. Results are cached by (model, request, record) in --record-cache, '
+                 f'so only records never seen before are sent to the model, in batches. (Config/Env: {constants.ENV_VAR_PREFIX}PER_RECORD)'
+        )
+        parser.add_argument(
+            '--record-cache', type=str, metavar='FILE',
+            help=f'SQLite file storing the --per-record results. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}RECORD_CACHE, default: {constants.DEFAULT_RECORD_CACHE})'
+        )
+        parser.add_argument(
+            '--no-dedup', action='store_true', default=None,
+            help=f'Send every chunk to the model, even chunks identical to an earlier one (by default their result is reused). '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}DEDUP=false)'
+        )
+        parser.add_argument(
+            '--context-chars', type=int, metavar='NUM',
+            help=f'Carry a compact context block (state, running totals, glossary) of up to NUM characters from each chunk\'s response '
+                 f'into the next chunk\'s prompt. Chunks are then processed sequentially. 0 disables it. '
+                 f'(Config/Env: {constants.ENV_VAR_PREFIX}CONTEXT_CHARS, default: {constants.DEFAULT_CONTEXT_CHARS})'
+        )
+        parser.add_argument(
+             '--metrics-json', type=str, metavar='FILE',
+             help=f'Write a JSON report of the run to FILE: per-chunk timings (prompt build, network, parse, write), '
+                  f'request latencies, continuations, finish reasons and token usage. '
+                  f'(Config/Env: {constants.ENV_VAR_PREFIX}METRICS_JSON)'
+        )
+        parser.add_argument(
+             '--max-cost', type=float, metavar='USD',
+             help=f'Stop sending new chunks once the estimated cost of the run reaches USD (uses the local price table). '
+                  f'0 disables it. (Config/Env: {constants.ENV_VAR_PREFIX}MAX_COST, default: {constants.DEFAULT_MAX_COST})'
+        )
+        parser.add_argument(
+             '--pricing-file', type=str, metavar='FILE',
+             help=f'JSON list of extra prices ({{"idRe": ..., "input": ..., "output": ...}}, USD per 1M tokens) '
+                  f'that take precedence over the built-in table. (Config/Env: {constants.ENV_VAR_PREFIX}PRICING_FILE)'
+        )
+        parser.add_argument(
+             '--capabilities-file', type=str, metavar='FILE',
+             help=f'JSON list of model capabilities ({{"idRe": ..., "context_window": ..., "max_output_tokens": ..., "rpm": ...}}) '
+                  f'that take precedence over the built-in tables. They size the chunks and the replies, "rpm" paces the requests. '
+                  f'(Config/Env: {constants.ENV_VAR_PREFIX}CAPABILITIES_FILE)'
+        )
         parser.add_argument(
              '--inspect-dir', type=str, metavar='DIR',
-             help=f'Save LLM request/response messages to timestamped subdirectories in DIR for debugging. '
+             help=f'Append LLM request/response exchanges to an inspect.jsonl log in a timestamped subdirectory of DIR for debugging. '
                   f'(Config/Env: {constants.ENV_VAR_PREFIX}INSPECT_DIR)'
         )
+        parser.add_argument(
+             '--inspect-compress', type=str, choices=['none', 'gzip', 'zstd'],
+             help=f'Compress the inspect log (zstd requires the zstandard package). '
+                  f'(Config/Env: {constants.ENV_VAR_PREFIX}INSPECT_COMPRESS, default: {constants.DEFAULT_INSPECT_COMPRESS})'
+        )
         # parser.add_argument('--continue-file', type=str, help='Continue processing from the file, where file is a json file created by inspect-dir') # WIP
 
         # Logging Options
@@ -97,6 +240,11 @@ Currently supported model patterns:
             help=f'Enable quiet logging (ERROR level). Overrides config and env. '
                  f'(Config/Env: {constants.ENV_VAR_PREFIX}LOG_LEVEL=ERROR)'
         )
+        parser.add_argument(
+            '--log-json', type=str, metavar='FILE',
+            help=f'Also append log records as JSON lines (timestamp, level, chunk id, message) to FILE, '
+                 f'using the same log level. (Config/Env: {constants.ENV_VAR_PREFIX}LOG_JSON)'
+        )
 
         # Load LLM specific arguments
         self._load_llm_arguments(parser)
@@ -107,7 +255,7 @@ Currently supported model patterns:
             help="User's request or processing instructions in natural language. Reads from stdin if processing piped data."
         )
 
-        parsed_args = parser.parse_args()
+        parsed_args = parser.parse_args(argv)
 
         # Combine remainder args into a single request string
         if parsed_args.request:
@@ -123,6 +271,10 @@ Currently supported model patterns:
         return self.args
 
 # Function to get the singleton instance easily
-def get_args():
-    """Returns the singleton parsed arguments object."""
-    return TulpArgs().get_args()
+def get_args(argv=None):
+    """Returns the singleton parsed arguments object, parsing argv (sys.argv[1:] if None) on first use."""
+    return TulpArgs(argv).get_args()
+
+def reset_args():
+    """Drops the parsed arguments so the next get_args() parses again (in-process runs)."""
+    TulpArgs._instance = None
@@ -0,0 +1,125 @@
+# capabilities.py
+import json
+import re
+from typing import Any, Dict, List
+from . import constants
+from .logger import log
+
+# What tulp knows about a model. Every provider attaches a list of capability
+# entries to its getModels() definitions: {"idRe": <model id regex>, <key>: <value>, ...}.
+# The first entry whose idRe matches the whole model name wins; missing keys keep these defaults.
+DEFAULT_CAPABILITIES: Dict[str, Any] = {
+    "context_window": None,     # Tokens of prompt plus reply (None: unknown)
+    "max_output_tokens": None,  # Tokens of one reply (None: unknown, the provider default applies)
+    "rpm": None,                # Requests per minute allowed by the account (None: not paced)
+    "streaming": False,         # The API can stream replies
+    "prefill": False,           # Continuations can prefill a partial assistant reply
+    "json_mode": False,         # The API can constrain replies to valid JSON
+}
+
+# Entries loaded with --capabilities-file, matched before the providers' tables
+_custom_capabilities: List[Dict[str, Any]] = []
+_capabilities_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def load_capabilities_file(file_path: str) -> bool:
+    """
+    Loads extra capability entries from a JSON file, taking precedence over the built-in tables.
+    Format: [{"idRe": "my-model.*", "context_window": 32768, "max_output_tokens": 4096, "rpm": 60}, ...]
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        custom = []
+        for entry in entries:
+            re.compile(entry["idRe"])
+            unknown = set(entry) - set(DEFAULT_CAPABILITIES) - {"idRe"}
+            if unknown:
+                log.warning(f"Ignoring unknown capabilities {sorted(unknown)} for '{entry['idRe']}' in {file_path}.")
+            custom.append({key: value for key, value in entry.items() if key not in unknown})
+    except (OSError, ValueError, TypeError, KeyError, AttributeError, re.error) as e:
+        log.error(f"Failed to load capabilities file '{file_path}': {e}")
+        return False
+    _custom_capabilities[:0] = custom
+    _capabilities_cache.clear()
+    log.debug(f"Loaded {len(custom)} capability entries from {file_path}")
+    return True
+
+
+def match_capabilities(entries: List[Dict[str, Any]], model_name: str) -> Dict[str, Any] | None:
+    """Returns the first entry whose idRe matches the whole model name, or None."""
+    return next((entry for entry in entries if re.fullmatch(entry["idRe"], model_name)), None)
+
+
+def get_capabilities(model_name: str) -> Dict[str, Any]:
+    """
+    Returns the capabilities of model_name: the first matching --capabilities-file
+    entry, else the first matching entry of its provider's table, over DEFAULT_CAPABILITIES.
+    """
+    if model_name not in _capabilities_cache:
+        from . import llms # Providers import this module
+        entry = match_capabilities(_custom_capabilities, model_name)
+        if entry is None:
+            module = llms.get_model_module(model_name)
+            for model_def in llms.get_models_definitions():
+                if model_def.get("module") is module:
+                    entry = match_capabilities(model_def.get("capabilities", []), model_name)
+                    if entry is not None:
+                        break
+        capabilities = dict(DEFAULT_CAPABILITIES)
+        capabilities.update({key: value for key, value in (entry or {}).items() if key != "idRe"})
+        _capabilities_cache[model_name] = capabilities
+    return _capabilities_cache[model_name]
+
+
+def chunk_chars_limit(capabilities: Dict[str, Any], output_bound: bool) -> int | None:
+    """
+    Largest chunk, in characters, whose request fits the model limits. None if they are unknown.
+
+    The prompt overhead, the chunk and the reply must fit the context window. When
+    output_bound is set (filters, whose reply is about as long as the chunk) the reply
+    must also fit the output cap, otherwise only a reply of up to a quarter of the
+    context window (or the output cap, if smaller) is reserved.
+    """
+    context_window = capabilities.get("context_window")
+    max_output = capabilities.get("max_output_tokens")
+    limits = []
+    if context_window:
+        available = context_window - constants.CAPABILITY_PROMPT_OVERHEAD_TOKENS
+        if output_bound:
+            limits.append(available // 2)
+        else:
+            limits.append(available - min(max_output or context_window // 4, context_window // 4))
+    if max_output and output_bound:
+        limits.append(int(max_output * constants.CAPABILITY_OUTPUT_FILL))
+    if not limits:
+        return None
+    return max(constants.MIN_PLANNED_CHUNK_CHARS, min(limits) * constants.CAPABILITY_CHARS_PER_TOKEN)
+
+
+def _prompt_chars(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(message.get("content") or "") for message in messages)
+
+def fits_context(capabilities: Dict[str, Any], messages: List[Dict[str, Any]]) -> bool:
+    """False if the messages surely leave no room for a reply in the context window."""
+    context_window = capabilities.get("context_window")
+    if not context_window:
+        return True
+    # A lower bound of the prompt tokens: only refuse requests that cannot fit
+    return _prompt_chars(messages) // constants.CAPABILITY_MAX_CHARS_PER_TOKEN < context_window
+
+
+def reply_token_limit(capabilities: Dict[str, Any], messages: List[Dict[str, Any]]) -> int | None:
+    """
+    The max_tokens to request for the messages: the output cap, lowered
+    so that prompt and reply fit the context window. None if the output cap is unknown.
+    """
+    max_output = capabilities.get("max_output_tokens")
+    context_window = capabilities.get("context_window")
+    if not max_output:
+        return None
+    if context_window:
+        # Prompt tokens are overestimated, so the request is never refused for its size
+        room = context_window - _prompt_chars(messages) // constants.CAPABILITY_CHARS_PER_TOKEN - constants.CAPABILITY_PROMPT_OVERHEAD_TOKENS
+        return max(min(max_output, constants.MIN_REPLY_TOKENS), min(max_output, room))
+    return max_output
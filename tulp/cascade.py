@@ -0,0 +1,57 @@
+# cascade.py
+import subprocess
+from typing import List, Dict, Any, Tuple
+from . import constants
+from .logger import log
+
+
+class CascadeClient:
+    """
+    Ordered list of LLM clients for --cascade, cheapest/fastest model first.
+
+    core.process_chunk sends each chunk to the first client and escalates to the
+    next one when the reply fails the structural checks. Code paths that are not
+    cascade-aware call generate(), which uses the first client.
+    """
+
+    def __init__(self, clients: List[Any]):
+        if not clients:
+            raise ValueError("A model cascade needs at least one model.")
+        self.clients = clients
+        self.model_name = getattr(clients[0], "model_name", None)
+        self.supports_prefill = bool(getattr(clients[0], "supports_prefill", False))
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return self.clients[0].generate(messages)
+
+
+def cascade_tiers(llm_client: Any) -> List[Any]:
+    """Returns the clients a chunk may be sent to, in escalation order."""
+    if isinstance(llm_client, CascadeClient):
+        return llm_client.clients
+    return [llm_client]
+
+
+def validate_output(command: str, output: str) -> Tuple[bool, str]:
+    """
+    Runs the --validate shell command with the chunk's stdout content on its stdin.
+
+    Returns:
+        A tuple (ok, message): ok is True if the command exited with 0, message
+        describes the failure (exit code and the start of its stderr).
+    """
+    try:
+        process = subprocess.run(
+            command, shell=True, input=output.encode('utf-8'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            timeout=constants.VALIDATE_TIMEOUT_SECONDS,
+        )
+    except subprocess.TimeoutExpired:
+        return False, f"timed out after {constants.VALIDATE_TIMEOUT_SECONDS}s"
+    except OSError as e:
+        return False, f"could not run it: {e}"
+    if process.returncode != 0:
+        stderr = process.stderr.decode('utf-8', errors='replace').strip()
+        return False, f"exit code {process.returncode}" + (f": {stderr[:200]}" if stderr else "")
+    log.debug(f"Validation command passed: {command}")
+    return True, ""
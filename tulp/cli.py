@@ -2,72 +2,143 @@
 import sys
 import os
 import time
-from typing import TYPE_CHECKING # Use for type hints to avoid circular imports
 from . import arguments
 # Use the initializer and getter for config
-from .config import initialize_config, get_config
+from .config import initialize_config, get_config, reset_config
 from . import version
 from . import constants
-from .logger import log, set_global_log_level # Import set_global_log_level
-from .input_handler import read_stdin, chunk_stdin
+from .logger import log, set_global_log_level, close_log_json_file # Import set_global_log_level
+from .input_handler import read_stdin, chunk_stdin, detect_format
+from .compaction import compact_input
 from . import core
 from . import executor
+from . import reducer
+from .metrics import metrics
+from . import pricing
+from . import capabilities
+from . import adaptive
 from . import llms
-from .promptSerializer import RequestMessageSerializer
+from .inspect_log import InspectLog
+from .cascade import CascadeClient
+from .hedging import HedgedClient
+from .failover import FailoverClient
+from .pacing import PacedClient
 
-# Use TYPE_CHECKING for type hints that would cause circular imports
-if TYPE_CHECKING:
-    # from .config import TulpConfig # Not needed now with get_config
-    from .promptSerializer import RequestMessageSerializer as InspectManagerType # Alias for clarity
 
-
-def _setup_inspect_dir(inspect_base_dir: str) -> 'InspectManagerType | None':
-    """Creates the inspection directory and returns a manager instance."""
+def _setup_inspect_dir(inspect_base_dir: str, compression: str = "none") -> 'InspectLog | None':
+    """Creates a timestamped subdirectory of the inspection directory and opens an inspect log in it."""
     if not inspect_base_dir:
         return None
 
     try:
-        # Create the base inspect_dir folder if it doesn't exist
-        os.makedirs(inspect_base_dir, exist_ok=True)
-
-        # Create the timestamped subdirectory
+        # Create the timestamped subdirectory (and the base inspect_dir folder if needed)
         # Use timestamp that's safe for filenames across OSes
         timestamp_str = time.strftime("%Y%m%d_%H%M%S")
         inspect_folder_path = os.path.join(inspect_base_dir, timestamp_str)
         os.makedirs(inspect_folder_path, exist_ok=True)
 
-        log.info(f"Inspection enabled. Saving interaction details to: {inspect_folder_path}")
+        inspect_log = InspectLog(inspect_folder_path, compression)
+        log.info(f"Inspection enabled. Saving interaction details to: {inspect_log.path}")
+        return inspect_log
+
+    except Exception as e:
+        log.error(f"Failed to create inspect log in '{inspect_base_dir}': {e}")
+        return None
+
+def _run_models(config) -> list:
+    """Every model that may answer a request of the run (--model or --cascade, --failover, --hedge-model)."""
+    models = config.cascade if len(config.cascade) > 1 else [config.model]
+    return models + config.failover + ([config.hedge_model] if config.hedge > 0 and config.hedge_model else [])
 
-        # Define a simple manager class locally or use PromptSerializer directly if adaptable
-        class InspectManager:
-            def __init__(self, base_path):
-                self.base_path = base_path
-                self.counter = 0 # Add counter for unique filenames
+def _plan_chunk_size(config, args) -> None:
+    """
+    Lowers the default --max-chars so that every chunk request fits the capabilities of
+    the run's models: a filter's reply is about as long as its chunk, so it must also fit
+    their output limit; --reduce and --per-record replies are short. Execute mode sends a
+    sample. A --max-chars set by the user is kept, with a warning if it exceeds the limits.
+    """
+    if args.execute:
+        return
+    output_bound = not (config.reduce or config.per_record)
+    limits = []
+    for model in _run_models(config):
+        limit = capabilities.chunk_chars_limit(capabilities.get_capabilities(model), output_bound)
+        if limit is not None:
+            limits.append((limit, model))
+    if limits and min(limits)[0] < config.max_chars:
+        limit, model = min(limits)
+        if config.max_chars_explicit:
+            log.warning(f"--max-chars {config.max_chars} exceeds the limits of {model} (about {limit} characters per chunk): replies may be cut off and need continuations.")
+            return
+        log.info(f"Chunks limited to {limit} characters (--max-chars {config.max_chars}) so that requests fit the limits of {model}.")
+        config.max_chars = limit
+        metrics.set_run_info(max_chars=limit)
 
-            def save(self, request_messages, response=None, suffix=""):
-                 # Use counter and suffix for more descriptive names
-                 filename = os.path.join(self.base_path, f"{suffix}_{self.counter:03d}.json")
-                 self.counter += 1
-                 serializer = RequestMessageSerializer(filename) # Creates serializer for each save
-                 try:
-                     serializer.save(request_messages, response)
-                     log.debug(f"Saved inspection data to {filename}")
-                 except Exception as e:
-                     log.error(f"Failed to save inspection data to {filename}: {e}")
+def _adaptive_chunker(config, input_text: str, input_format: str) -> 'adaptive.AdaptiveChunker':
+    """The lazy chunker of --adaptive-chunks, starting from what earlier runs learned about the model and type of request."""
+    chunker = adaptive.AdaptiveChunker(input_text, input_format, adaptive.ChunkSizeController(config.max_chars, config.target_latency))
+    # Keyed by the format actually used (text if a json input is not a valid array)
+    stats = adaptive.load_chunk_stats(config.chunk_stats, adaptive.stats_key(config.model, "filter", chunker.input_format))
+    if stats:
+        chunker.controller = adaptive.ChunkSizeController(config.max_chars, config.target_latency, stats)
+        log.info(f"Adaptive chunks: starting at {chunker.controller.next_size()} chars (learned from {stats.get('chunks', 0)} earlier chunks).")
+    return chunker
 
-        return InspectManager(inspect_folder_path)
+def _model_client(model: str, config) -> 'object':
+    """Creates the client of one model, paced when its capabilities set a requests-per-minute limit."""
+    client = llms.get_model_client(model, config)
+    rpm = capabilities.get_capabilities(model)["rpm"]
+    if rpm:
+        log.info(f"Requests to {model} are paced to {rpm:g} per minute.")
+        return PacedClient(client, rpm)
+    return client
 
-    except Exception as e:
-        log.error(f"Failed to create inspect directory '{inspect_base_dir}': {e}")
-        return None
+def _create_clients(config) -> 'object':
+    """
+    Creates the LLM client for the run: a single model or a --cascade, each model
+    backed by the --failover chain and wrapped for --hedge.
+    """
+    models = config.cascade if len(config.cascade) > 1 else [config.model]
+    clients = [_model_client(model, config) for model in models]
+    if config.failover:
+        fallback_clients = [_model_client(model, config) for model in config.failover]
+        clients = [FailoverClient([client] + fallback_clients, config.failover_cooldown) for client in clients]
+        log.info(f"Failover chain: {' -> '.join([config.model] + config.failover)} (cool-down {config.failover_cooldown:g}s)")
+    if config.hedge > 0:
+        hedge_client = _model_client(config.hedge_model, config) if config.hedge_model else None
+        clients = [HedgedClient(client, hedge_client, config.hedge) for client in clients]
+        log.info(f"Hedged requests enabled after the p{config.hedge:g} latency (hedge model: {config.hedge_model or 'same model'})")
+    if len(clients) == 1:
+        return clients[0]
+    log.info(f"Model cascade: {' -> '.join(models)}")
+    metrics.set_run_info(cascade=models)
+    return CascadeClient(clients)
 
-def run():
-    """Main entry point for the Tulp CLI application."""
+def _log_usage_summary(config) -> None:
+    """Logs the run's token usage and estimated cost to stderr."""
+    totals = metrics.to_dict()["totals"]
+    if not totals["requests"]:
+        return
+    cost = pricing.format_cost(totals["cost"])
+    if config.max_cost > 0:
+        cost += f" (budget {pricing.format_cost(config.max_cost)})"
+    log.info(f"Usage: {totals['requests']} request(s), {totals['input_tokens'] or 0} input / {totals['output_tokens'] or 0} output tokens, estimated cost: {cost}")
+
+def run(argv=None):
+    """
+    Main entry point for the Tulp CLI application.
+    argv replaces sys.argv[1:]; every call starts from fresh arguments, config and metrics,
+    so run() can be called repeatedly in the same process (it always ends with SystemExit).
+    """
     exit_code = 0
     llm_client = None # Define outside try block for potential cleanup
+    inspect_manager = None # Closed in the finally block so queued records are written
     try:
         # 1. Parse Arguments (Singleton)
-        args = arguments.get_args()
+        arguments.reset_args()
+        reset_config()
+        metrics.reset()
+        args = arguments.get_args(argv)
 
         # 2. Initialize Configuration (Singleton, requires args)
         # This call ensures config is loaded using args for overrides
@@ -75,10 +146,20 @@ def run():
         # Now use get_config() to access the initialized instance
         config = get_config()
         log.debug(f"Running tulp v{version.VERSION} with model: {config.model}")
+        metrics.set_run_info(version=version.VERSION, model=config.model, jobs=config.jobs, max_chars=config.max_chars)
+        if config.pricing_file:
+            pricing.load_pricing_file(config.pricing_file)
+        if pricing.get_price(config.model) is None:
+            log.debug(f"No price known for model '{config.model}', cost will not be estimated.")
+            if config.max_cost > 0:
+                log.warning(f"--max-cost is set but no price is known for model '{config.model}'. The budget cannot be enforced (see --pricing-file).")
+        if config.capabilities_file:
+            capabilities.load_capabilities_file(config.capabilities_file)
+        _plan_chunk_size(config, args)
 
         # 3. Initialize LLM Client (Can raise errors)
         # Pass the initialized config object
-        llm_client = llms.get_model_client(config.model, config)
+        llm_client = _create_clients(config)
 
         # 4. Read Standard Input
         input_text = read_stdin()
@@ -112,35 +193,80 @@ def run():
 
         # 6. Chunk Stdin if necessary
         # Pass input_text which might be empty, and the config object
-        stdin_chunks = chunk_stdin(input_text, config)
+        input_format = config.input_format
+        if input_format == "auto" and input_text:
+            input_format = detect_format(input_text)
+            log.debug(f"Detected input format: {input_format}")
+        layout = None
+        if config.compact and input_text:
+            if args.execute or config.per_record:
+                log.warning("--compact is ignored with -x and --per-record, which need the original input.")
+            else:
+                compacted_chars = len(input_text)
+                input_text, input_format, layout = compact_input(input_text, input_format)
+                log.info(f"Compacted input from {compacted_chars} to {len(input_text)} characters ({input_format}).")
+                metrics.set_run_info(compacted_from_chars=compacted_chars)
+        adaptive_chunks = config.adaptive_chunks and bool(input_text) and not (args.execute or config.reduce or config.per_record)
+        if config.adaptive_chunks and input_text and not adaptive_chunks:
+            log.warning("--adaptive-chunks only applies to filters, it is ignored with -x, --reduce and --per-record.")
+        chunker = None
+        if args.execute:
+            # Generated programs read the whole input, only a sample of it goes in the prompt
+            stdin_chunks = [input_text] if input_text else []
+        elif adaptive_chunks:
+            chunker = _adaptive_chunker(config, input_text, input_format)
+            input_format = chunker.input_format
+            stdin_chunks = [] # Cut while they are sent (see core.process_request)
+        else:
+            stdin_chunks, input_format = chunk_stdin(input_text, config, input_format)
+        metrics.set_run_info(input_chars=len(input_text), num_chunks=len(stdin_chunks), input_format=input_format)
 
         # 7. Setup Inspection Directory if requested
-        inspect_manager = _setup_inspect_dir(config.inspect_dir)
+        inspect_manager = _setup_inspect_dir(config.inspect_dir, config.inspect_compress)
 
         # 8. Select Mode and Prompt Factory & Execute
         if args.execute:
             log.info("Mode: Code Execution (-x enabled)")
+            metrics.set_run_info(mode="execute")
             if input_text: # If there was stdin, use the filtering program prompt
                 from .prompts import filtering_program as prompt_factory
                 log.debug("Using filtering_program prompt factory.")
                 exit_code = executor.handle_execution_request(
-                    llm_client, prompt_factory, user_request, stdin_chunks, config, args, inspect_manager
+                    llm_client, prompt_factory, user_request, input_text, config, args, inspect_manager,
+                    input_format=input_format,
                 )
             else: # No stdin, use the general program prompt
                 from .prompts import program as prompt_factory
                 log.debug("Using program prompt factory.")
-                # Pass empty list for stdin_chunks if input_text was empty
                 exit_code = executor.handle_execution_request(
-                    llm_client, prompt_factory, user_request, [], config, args, inspect_manager
+                    llm_client, prompt_factory, user_request, "", config, args, inspect_manager
                 )
         else:
             log.info("Mode: Standard Processing / Request")
-            if input_text: # If there was stdin, use the filtering prompt
+            metrics.set_run_info(mode="reduce" if input_text and config.reduce else "filter" if input_text else "request")
+            if input_text and config.per_record: # Independent lines, memoized results
+                from . import records
+                if config.reduce or config.context_chars:
+                    log.warning("--per-record processes every line independently: --reduce and --context-chars are ignored.")
+                exit_code = records.handle_per_record_request(
+                    llm_client, user_request, input_text, config, args, inspect_manager
+                )
+            elif input_text and config.reduce: # Map-reduce over the chunks
+                from .prompts import filtering as prompt_factory
+                log.debug("Using filtering prompt factory with map-reduce.")
+                exit_code = reducer.handle_reduce_request(
+                    llm_client, prompt_factory, user_request, stdin_chunks, config, args, inspect_manager,
+                    input_format=input_format, layout=layout,
+                )
+            elif input_text: # If there was stdin, use the filtering prompt
                 from .prompts import filtering as prompt_factory
                 log.debug("Using filtering prompt factory.")
                 exit_code = core.process_request(
-                    llm_client, prompt_factory, user_request, stdin_chunks, config, args, inspect_manager
+                    llm_client, prompt_factory, user_request, stdin_chunks, config, args, inspect_manager,
+                    input_format=input_format, layout=layout, chunker=chunker,
                 )
+                if chunker is not None and chunker.controller.chunks:
+                    adaptive.save_chunk_stats(config.chunk_stats, adaptive.stats_key(config.model, "filter", input_format), chunker.controller.to_stats())
             else: # No stdin, use the direct request prompt
                 from .prompts import request as prompt_factory
                 log.debug("Using request prompt factory.")
@@ -150,6 +276,9 @@ def run():
                 )
 
     # --- Exception Handling ---
+    except SystemExit as se:
+        # argparse errors and early exits: keep their code, the finally block exits with it
+        exit_code = se.code if isinstance(se.code, int) else (0 if se.code is None else 1)
     except ValueError as ve:
         # Specific errors likely from config or setup (e.g., missing API key)
         log.error(f"Configuration or setup error: {ve}")
@@ -195,6 +324,17 @@ def run():
         # if llm_client and hasattr(llm_client, 'close'):
         #     llm_client.close()
         log.debug(f"Tulp finished with exit code: {exit_code}")
+        if inspect_manager:
+            inspect_manager.close()
+        try:
+            config = get_config()
+            _log_usage_summary(config)
+            if config.metrics_json:
+                metrics.set_run_info(exit_code=exit_code)
+                metrics.write_json(config.metrics_json)
+        except RuntimeError:
+            pass # Config was never initialized (e.g. argument error), nothing was measured
+        close_log_json_file()
         sys.exit(exit_code)
 
 # Make the script executable
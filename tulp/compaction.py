@@ -0,0 +1,127 @@
+# compaction.py
+import json
+import re
+from typing import List, Dict, Any, Tuple
+from .logger import log
+from .input_handler import split_records, csv_delimiter
+
+# A JSON string, kept as is, or a run of whitespace outside strings, removed
+JSON_TOKEN_RE = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+# Indentation of the first nested line of a pretty-printed JSON document
+JSON_INDENT_RE = re.compile(r"^\s*[\[{][ \t]*\r?\n([ \t]+)\S")
+# Run of spaces/tabs after a non-blank character (leading indentation is kept)
+INNER_WHITESPACE_RE = re.compile(r"(?<=\S)[ \t]{2,}")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _minify_json(text: str) -> str:
+    """Removes the whitespace outside strings of a valid JSON document, keeping every value as written."""
+    return JSON_TOKEN_RE.sub(lambda match: match.group(1) or "", text)
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _table_columns(value: Any) -> List[str] | None:
+    """The keys of an array of objects that all have the same keys in the same order, else None."""
+    if not isinstance(value, list) or len(value) < 2 or not all(isinstance(item, dict) for item in value):
+        return None
+    columns = list(value[0])
+    if not columns or any(list(item) != columns for item in value):
+        return None
+    return columns
+
+
+def compact_input(input_text: str, input_format: str) -> Tuple[str, str, Dict[str, Any]]:
+    """
+    Rewrites the input in a more compact form before it is chunked (--compact):
+    - json: an array of objects sharing the same keys becomes a table (a header
+      line with the keys, then one line with the values of every object); any
+      other document is minified.
+    - jsonl: every line is minified.
+    - csv: the padding around delimiters of unquoted records is removed.
+    - text, log: trailing whitespace and runs of spaces inside lines are removed,
+      as are runs of blank lines.
+
+    Returns:
+        A tuple (text, input_format, layout): the format becomes "table" for the
+        table form, and layout holds what restore_output needs (original indentation,
+        table form).
+    """
+    layout: Dict[str, Any] = {"table": False, "indent": None}
+    if input_format == "json":
+        try:
+            value = json.loads(input_text)
+        except ValueError:
+            log.warning("--compact: input is not valid JSON, compacting it as plain text.")
+            input_format = "text"
+        else:
+            match = JSON_INDENT_RE.match(input_text)
+            if match:
+                indent = match.group(1)
+                layout["indent"] = indent if "\t" in indent else len(indent)
+            columns = _table_columns(value)
+            if columns:
+                layout["table"] = True
+                rows = [_dumps(columns)] + [_dumps(list(item.values())) for item in value]
+                return "\n".join(rows), "table", layout
+            return _minify_json(input_text), "json", layout
+
+    if input_format == "jsonl":
+        lines = []
+        for line in input_text.splitlines():
+            try:
+                json.loads(line)
+            except ValueError:
+                lines.append(line.rstrip())
+                continue
+            lines.append(_minify_json(line))
+        return "\n".join(lines), input_format, layout
+
+    if input_format == "csv":
+        delimiter = csv_delimiter(input_text) or ","
+        padding = re.compile(rf"[ \t]*{re.escape(delimiter)}[ \t]*" if delimiter != "\t" else r" *\t *")
+        _format, header, records, join = split_records(input_text, "csv")
+        records = [record if '"' in record else padding.sub(delimiter, record.strip()) for record in [header] + records]
+        return join(records[0], records[1:]), input_format, layout
+
+    lines = [INNER_WHITESPACE_RE.sub(" ", line.rstrip()) for line in input_text.splitlines()]
+    return BLANK_LINES_RE.sub("\n\n", "\n".join(lines)), input_format, layout
+
+
+def _parse_table(content: str) -> List[Dict[str, Any]] | None:
+    """Parses the table form (header line, then one line of values per object). None if content is not one."""
+    lines = [line for line in content.splitlines() if line.strip()]
+    if not lines:
+        return None
+    try:
+        columns = json.loads(lines[0])
+        rows = [json.loads(line) for line in lines[1:]]
+    except ValueError:
+        return None
+    if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+        return None
+    if not all(isinstance(row, list) and len(row) == len(columns) for row in rows):
+        return None
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def restore_output(content: str, layout: Dict[str, Any] | None, restore_format: bool = False) -> str:
+    """
+    Converts a chunk output (its code fences already stripped) written in the table form
+    back to a JSON array of objects. With restore_format, JSON output is also indented
+    like the original input.
+    """
+    if not layout or not content:
+        return content
+    indent = layout.get("indent") if restore_format else None
+    stripped = content.strip()
+    if layout.get("table"):
+        items = _parse_table(stripped)
+        if items is not None:
+            return json.dumps(items, ensure_ascii=False, indent=indent)
+    if indent is not None and stripped[:1] in ("[", "{"):
+        try:
+            return json.dumps(json.loads(stripped), ensure_ascii=False, indent=indent)
+        except ValueError:
+            pass
+    return content
@@ -83,28 +83,121 @@ class TulpConfig:
         logger.set_global_log_level(self.log_level)
         log.debug(f"Log level set to: {self.log_level}")
 
+        # Optional JSON lines log file (CLI > ENV > Config)
+        log_json_arg = getattr(args, 'log_json', None)
+        self.log_json = log_json_arg if log_json_arg is not None else self._get_value("LOG_JSON", None)
+        if self.log_json:
+            logger.set_log_json_file(self.log_json)
+            log.debug(f"JSON log file: {self.log_json}")
+
         # Load other general settings (CLI > ENV > Config > Default)
         max_chars_arg = getattr(args, 'max_chars', None)
         model_arg = getattr(args, 'model', None)
+        input_format_arg = getattr(args, 'input_format', None)
+        sample_chars_arg = getattr(args, 'sample_chars', None)
+        compact_arg = getattr(args, 'compact', None)
+        restore_format_arg = getattr(args, 'restore_format', None)
+        output_format_arg = getattr(args, 'output_format', None)
         cont_arg = getattr(args, 'cont', None)
         write_arg = getattr(args, 'write', None)
         execute_arg = getattr(args, 'execute', None)
         inspect_dir_arg = getattr(args, 'inspect_dir', None)
+        inspect_compress_arg = getattr(args, 'inspect_compress', None)
+        jobs_arg = getattr(args, 'jobs', None)
+        adaptive_chunks_arg = getattr(args, 'adaptive_chunks', None)
+        target_latency_arg = getattr(args, 'target_latency', None)
+        chunk_stats_arg = getattr(args, 'chunk_stats', None)
+        reduce_arg = getattr(args, 'reduce', None)
+        no_dedup_arg = getattr(args, 'no_dedup', None)
+        per_record_arg = getattr(args, 'per_record', None)
+        record_cache_arg = getattr(args, 'record_cache', None)
+        context_chars_arg = getattr(args, 'context_chars', None)
+        max_backups_arg = getattr(args, 'max_backups', None)
+        metrics_json_arg = getattr(args, 'metrics_json', None)
+        max_cost_arg = getattr(args, 'max_cost', None)
+        pricing_file_arg = getattr(args, 'pricing_file', None)
+        capabilities_file_arg = getattr(args, 'capabilities_file', None)
+        cascade_arg = getattr(args, 'cascade', None)
+        validate_arg = getattr(args, 'validate', None)
+        failover_arg = getattr(args, 'failover', None)
+        failover_cooldown_arg = getattr(args, 'failover_cooldown', None)
+        hedge_arg = getattr(args, 'hedge', None)
+        hedge_model_arg = getattr(args, 'hedge_model', None)
 
-        self.max_chars = int(max_chars_arg if max_chars_arg is not None else self._get_value("MAX_CHARS", str(constants.DEFAULT_MAX_CHARS)))
+        max_chars_setting = max_chars_arg if max_chars_arg is not None else self._get_value("MAX_CHARS")
+        # Only the default is lowered to fit the model limits (see cli._plan_chunk_size)
+        self.max_chars_explicit = max_chars_setting is not None
+        self.max_chars = int(max_chars_setting if max_chars_setting is not None else constants.DEFAULT_MAX_CHARS)
         self.model = model_arg if model_arg is not None else self._get_value("MODEL", constants.DEFAULT_MODEL)
+        self.input_format = (input_format_arg if input_format_arg is not None else self._get_value("INPUT_FORMAT", constants.DEFAULT_INPUT_FORMAT)).lower()
+        if self.input_format not in constants.INPUT_FORMATS:
+            log.warning(f"Unknown input format '{self.input_format}', using '{constants.DEFAULT_INPUT_FORMAT}'.")
+            self.input_format = constants.DEFAULT_INPUT_FORMAT
+        self.compact = bool(compact_arg) or self._get_value("COMPACT", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.restore_format = bool(restore_format_arg) or self._get_value("RESTORE_FORMAT", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.sample_chars = max(1, int(sample_chars_arg if sample_chars_arg is not None else self._get_value("SAMPLE_CHARS", str(constants.DEFAULT_SAMPLE_CHARS))))
+        self.output_format = (output_format_arg if output_format_arg is not None else self._get_value("OUTPUT_FORMAT", constants.DEFAULT_OUTPUT_FORMAT)).lower()
+        if self.output_format not in constants.OUTPUT_FORMATS:
+            log.warning(f"Unknown output format '{self.output_format}', using '{constants.DEFAULT_OUTPUT_FORMAT}'.")
+            self.output_format = constants.DEFAULT_OUTPUT_FORMAT
         self.continuation_retries = int(cont_arg if cont_arg is not None else self._get_value("CONT", str(constants.DEFAULT_CONTINUATION_RETRIES)))
         self.write_file = write_arg if write_arg is not None else self._get_value("WRITE_FILE", None)
         self.execute_code = bool(execute_arg) if execute_arg is not None else self._get_value("EXECUTE_CODE", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.max_backups = int(max_backups_arg if max_backups_arg is not None else self._get_value("MAX_BACKUPS", str(constants.DEFAULT_MAX_BACKUPS)))
         self.inspect_dir = inspect_dir_arg if inspect_dir_arg is not None else self._get_value("INSPECT_DIR", None)
+        self.inspect_compress = (inspect_compress_arg if inspect_compress_arg is not None else self._get_value("INSPECT_COMPRESS", constants.DEFAULT_INSPECT_COMPRESS)).lower()
+        self.jobs = max(1, int(jobs_arg if jobs_arg is not None else self._get_value("JOBS", str(constants.DEFAULT_JOBS))))
+        self.adaptive_chunks = bool(adaptive_chunks_arg) or self._get_value("ADAPTIVE_CHUNKS", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.target_latency = max(0.0, float(target_latency_arg if target_latency_arg is not None else self._get_value("TARGET_LATENCY", str(constants.DEFAULT_TARGET_LATENCY))))
+        self.chunk_stats = chunk_stats_arg if chunk_stats_arg is not None else self._get_value("CHUNK_STATS", constants.DEFAULT_CHUNK_STATS)
+        self.context_chars = max(0, int(context_chars_arg if context_chars_arg is not None else self._get_value("CONTEXT_CHARS", str(constants.DEFAULT_CONTEXT_CHARS))))
+        self.reduce = bool(reduce_arg) or self._get_value("REDUCE", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.per_record = bool(per_record_arg) or self._get_value("PER_RECORD", "False").lower() in ('true', '1', 't', 'y', 'yes')
+        self.record_cache = record_cache_arg if record_cache_arg is not None else self._get_value("RECORD_CACHE", constants.DEFAULT_RECORD_CACHE)
+        self.dedup = not no_dedup_arg and self._get_value("DEDUP", "True").lower() in ('true', '1', 't', 'y', 'yes')
+        self.metrics_json = metrics_json_arg if metrics_json_arg is not None else self._get_value("METRICS_JSON", None)
+        self.max_cost = max(0.0, float(max_cost_arg if max_cost_arg is not None else self._get_value("MAX_COST", str(constants.DEFAULT_MAX_COST))))
+        self.pricing_file = pricing_file_arg if pricing_file_arg is not None else self._get_value("PRICING_FILE", None)
+        self.capabilities_file = capabilities_file_arg if capabilities_file_arg is not None else self._get_value("CAPABILITIES_FILE", None)
+        cascade_value = cascade_arg if cascade_arg is not None else self._get_value("CASCADE", "")
+        self.cascade = [model.strip() for model in cascade_value.split(",") if model.strip()]
+        if self.cascade:
+            # The first cascade model is the run's model (metrics, pricing, non-cascade code paths)
+            self.model = self.cascade[0]
+        self.validate = validate_arg if validate_arg is not None else self._get_value("VALIDATE", None)
+        failover_value = failover_arg if failover_arg is not None else self._get_value("FAILOVER", "")
+        self.failover = [model.strip() for model in failover_value.split(",") if model.strip()]
+        self.failover_cooldown = max(0.0, float(failover_cooldown_arg if failover_cooldown_arg is not None else self._get_value("FAILOVER_COOLDOWN", str(constants.DEFAULT_FAILOVER_COOLDOWN))))
+        self.hedge = min(100.0, max(0.0, float(hedge_arg if hedge_arg is not None else self._get_value("HEDGE", str(constants.DEFAULT_HEDGE_PERCENTILE)))))
+        self.hedge_model = hedge_model_arg if hedge_model_arg is not None else self._get_value("HEDGE_MODEL", None)
 
         log.debug(f"Using config file: {self.config_file_path}")
         log.debug(f"Max chars: {self.max_chars}")
+        log.debug(f"Input format: {self.input_format}")
+        log.debug(f"Output format: {self.output_format}")
+        log.debug(f"Sample chars: {self.sample_chars}")
+        log.debug(f"Compact input: {self.compact} (restore format: {self.restore_format})")
         log.debug(f"Model: {self.model}")
         log.debug(f"Continuation retries: {self.continuation_retries}")
         log.debug(f"Write file: {self.write_file}")
+        log.debug(f"Max backups: {self.max_backups}")
         log.debug(f"Execute code: {self.execute_code}")
         log.debug(f"Inspect dir: {self.inspect_dir}")
+        log.debug(f"Inspect compression: {self.inspect_compress}")
+        log.debug(f"Jobs: {self.jobs}")
+        log.debug(f"Adaptive chunks: {self.adaptive_chunks} (target latency: {self.target_latency}s, stats: {self.chunk_stats})")
+        log.debug(f"Context chars: {self.context_chars}")
+        log.debug(f"Reduce: {self.reduce}")
+        log.debug(f"Dedup chunks: {self.dedup}")
+        log.debug(f"Per record: {self.per_record} (cache: {self.record_cache})")
+        log.debug(f"Metrics JSON: {self.metrics_json}")
+        log.debug(f"Max cost: {self.max_cost}")
+        log.debug(f"Pricing file: {self.pricing_file}")
+        log.debug(f"Capabilities file: {self.capabilities_file}")
+        log.debug(f"Cascade: {self.cascade}")
+        log.debug(f"Validate: {self.validate}")
+        log.debug(f"Failover: {self.failover} (cool-down: {self.failover_cooldown}s)")
+        log.debug(f"Hedge: {self.hedge} (model: {self.hedge_model})")
 
         # Load LLM-specific arguments
         self._load_llm_arguments(args)
@@ -181,6 +274,12 @@ def initialize_config(args=None):
          _tulp_config_instance._initialize(args)
     return _tulp_config_instance
 
+def reset_config():
+    """Drops the config singleton so the next initialize_config() loads it again (in-process runs)."""
+    global _tulp_config_instance
+    _tulp_config_instance = None
+    TulpConfig._instance = None
+
 def get_config():
     """Returns the singleton TulpConfig instance. Assumes initialize_config was called."""
     global _tulp_config_instance
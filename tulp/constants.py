@@ -56,15 +56,81 @@ DEFAULT_LOG_LEVEL = "INFO"
 DEFAULT_MAX_CHARS = 1000000
 DEFAULT_MODEL = "gpt-4o" # Default model setting
 DEFAULT_CONTINUATION_RETRIES = 0 # Default for --cont
+DEFAULT_JOBS = 1 # Default for --jobs (chunks processed concurrently): sequential unless asked
+DEFAULT_CONTEXT_CHARS = 0 # Default for --context-chars (0 disables rolling context)
+
+DEFAULT_MAX_BACKUPS = 10 # Default for --max-backups (backups kept per output file)
+DEFAULT_MAX_COST = 0 # Default for --max-cost (USD per run, 0 disables the budget)
+DEFAULT_INSPECT_COMPRESS = "none" # Default for --inspect-compress (none, gzip or zstd)
+DEFAULT_RECORD_CACHE = "~/.cache/tulp/records.sqlite3" # Default for --record-cache (per-record results store)
+DEFAULT_FAILOVER_COOLDOWN = 60 # Default for --failover-cooldown (seconds before a failed provider is tried again)
+DEFAULT_HEDGE_PERCENTILE = 0 # Default for --hedge (latency percentile that triggers a hedged request, 0 disables it)
+DEFAULT_INPUT_FORMAT = "auto" # Default for --input-format (detected from the start of stdin)
+DEFAULT_OUTPUT_FORMAT = "auto" # Default for --output-format (detected from the first chunk output)
+DEFAULT_SAMPLE_CHARS = 8000 # Default for --sample-chars (stdin excerpt in -x prompts, about 2000 tokens)
+DEFAULT_TARGET_LATENCY = 60 # Default for --target-latency (seconds per chunk with --adaptive-chunks, 0 disables it)
+DEFAULT_CHUNK_STATS = "~/.cache/tulp/chunk_stats.json" # Default for --chunk-stats (learned chunk sizing per model)
 
 # --- Environment Variable Prefix ---
 ENV_VAR_PREFIX = "TULP_"
 
+# Finish reasons of the error responses returned by the LLM clients ({"role": "error", ...})
+ERROR_FINISH_REASONS = ("error", "rate_limit", "timeout", "connection_error", "server_error", "content_filter", "SAFETY")
+# Error finish reasons that mark the provider as unavailable (--failover)
+FAILOVER_FINISH_REASONS = ("connection_error", "server_error", "timeout")
+
+# --- Continuations ---
+CONTINUATION_TAIL_CHARS = 4000 # Tail of the partial reply resent as the continuation anchor
+MIN_CONTINUATION_OVERLAP = 16 # Shortest repeated prefix removed when stitching a continuation
+
+# --- Model capabilities ---
+CAPABILITY_CHARS_PER_TOKEN = 3 # Conservative characters per token when sizing chunks from token limits
+CAPABILITY_MAX_CHARS_PER_TOKEN = 6 # Generous characters per token: a prompt longer than this surely does not fit
+CAPABILITY_PROMPT_OVERHEAD_TOKENS = 1500 # System prompt, instructions and reply tags of a chunk request
+CAPABILITY_OUTPUT_FILL = 0.8 # Share of the output cap a filter chunk's reply may use (tags, stderr block, slack)
+MIN_PLANNED_CHUNK_CHARS = 1000 # Chunks are never planned smaller than this
+MIN_REPLY_TOKENS = 1024 # max_tokens is never lowered below this to fit the context window
+
+# --- Adaptive chunk sizing (--adaptive-chunks) ---
+ADAPTIVE_SMOOTHING = 0.3 # Weight of the latest chunk in the running averages of the controller
+ADAPTIVE_OUTPUT_FILL = 0.8 # Share of the learned reply size limit a chunk's output is sized to fill
+MIN_ADAPTIVE_CHUNK_CHARS = 500 # Chunks are never made smaller than this
+
+# --- Input chunking ---
+INPUT_FORMATS = ["auto", "text", "json", "jsonl", "csv", "log"] # Choices of --input-format
+STRUCTURED_INPUT_FORMATS = ("json", "jsonl", "csv", "table") # Formats whose chunks are complete documents ("table": --compact)
+FORMAT_DETECTION_CHARS = 64 * 1024 # Start of stdin examined to detect its format
+FORMAT_DETECTION_LINES = 20 # Non-empty lines examined to detect its format
+OUTPUT_FORMATS = ["auto", "text", "json", "jsonl", "csv", "yaml"] # Choices of --output-format (merging of chunk outputs)
+
+# --- Stdin sampling (-x prompts) ---
+SAMPLE_HEAD_RECORDS = 5 # First records always shown
+SAMPLE_TAIL_RECORDS = 3 # Last records always shown
+SAMPLE_RANDOM_RECORDS = 50 # Random records tried once every record shape is shown
+SAMPLE_SCAN_RECORDS = 5000 # Evenly spaced records examined for shapes and the schema summary
+SAMPLE_SEED = 0 # Random picks are reproducible: the same input gives the same prompt
+
 # --- Execution ---
 MAX_EXECUTION_RETRIES = 5
 
+# --- Hedged requests ---
+HEDGE_MIN_SAMPLES = 8 # Latencies observed before requests are hedged
+HEDGE_LATENCY_WINDOW = 200 # Most recent latencies the hedge percentile is computed from
+
+# --- Per-record mode ---
+RECORD_BATCH_MAX_RECORDS = 100 # Records sent in one request (also bounded by max_chars)
+RECORD_MAX_RETRIES = 1 # Extra rounds for records missing from the replies
+RECORD_CACHE_QUERY_BATCH = 500 # Keys looked up per SQLite query
+
+# --- Provider failover ---
+FAILOVER_RATE_LIMIT_THRESHOLD = 3 # Consecutive 429 errors after which a provider is considered down
+
+# --- Output validation (--validate) ---
+VALIDATE_TIMEOUT_SECONDS = 60 # Time limit of one --validate command run
+
 # --- Logging Levels ---
 LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+LOG_JSON_BUFFER_BYTES = 64 * 1024 # Write buffer of the --log-json file sink
 
 # --- Other ---
 DEFAULT_INSPECT_SUBDIR_FORMAT = "%Y%m%d_%H%M%S"
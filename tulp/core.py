@@ -2,21 +2,427 @@
 import sys
 import time
 import re
-from typing import List, Dict, Any, TYPE_CHECKING
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Tuple, TYPE_CHECKING
 from . import constants
-from .logger import log
+from .logger import log, log_chunk
 # Import the UPDATED parser functions and constants
 from .response_parser import parse_response, has_reply_end, block_exists, block_content, block_is_not_empty
 # Import output functions
-from .output_handler import print_stdout, print_stderr, OutputFileWriter, cleanup_output
+from .output_handler import print_stderr, strip_code_fences, OutputSink, OutputMerger
+from .metrics import metrics
+from .pricing import estimate_cost, format_cost
+from .cascade import cascade_tiers, validate_output
+from .compaction import restore_output
+from .capabilities import get_capabilities, fits_context
 
 # Type hints
 if TYPE_CHECKING:
     from .config import TulpConfig
-    from .promptSerializer import RequestMessageSerializer
+    from .inspect_log import InspectLog
+    from .adaptive import AdaptiveChunker
     LlmClientType = Any
     PromptFactoryType = Any
 
+def map_chunks(func: Callable[[int, Any], Any], items: Iterable[Any], jobs: int = 1, log_id: Callable[[int], Any] | None = None) -> Iterator[Any]:
+    """
+    Applies func(index, item) to every item and yields the results in input order.
+
+    Up to `jobs` calls run concurrently in worker threads. Items are pulled lazily,
+    so a caller that stops iterating early also stops new work from being scheduled.
+    If log_id is given, log records emitted by each call are tagged with log_id(index).
+    """
+    if log_id is not None:
+        untagged = func
+        def func(index: int, item: Any) -> Any:
+            with log_chunk(log_id(index)):
+                return untagged(index, item)
+
+    if jobs <= 1:
+        for index, item in enumerate(items):
+            yield func(index, item)
+        return
+
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    pending = deque()
+    try:
+        for index, item in enumerate(items):
+            pending.append(pool.submit(func, index, item))
+            if len(pending) >= jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Drop queued work if the caller stopped early (e.g. on a chunk error)
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def timed_generate(
+    llm_client: 'LlmClientType',
+    messages: List[Dict[str, str]],
+    config: 'TulpConfig',
+    metrics_id: str,
+    inspect_manager: 'InspectLog | None' = None,
+    inspect_tag: str = "",
+) -> Dict[str, Any]:
+    """
+    Calls llm_client.generate, records its latency, usage and estimated cost (priced
+    for the client's model) under metrics_id, and saves the exchange to the inspect
+    log if one is enabled.
+    """
+    request_start = time.perf_counter()
+    response = llm_client.generate(messages)
+    latency = time.perf_counter() - request_start
+    # Wrapper clients (--hedge) name the model that produced the reply when it is not their own
+    cost = estimate_cost(response.get("model") or getattr(llm_client, "model_name", None) or config.model, response.get("usage"))
+    metrics.record_response(metrics_id, response, latency, cost)
+    if inspect_manager:
+        inspect_manager.save(messages, response, inspect_tag or metrics_id, latency=latency)
+    return response
+
+
+def budget_exceeded(config: 'TulpConfig') -> bool:
+    """True when --max-cost is set and the estimated cost of the run has reached it."""
+    return config.max_cost > 0 and metrics.total_cost >= config.max_cost
+
+
+def _needs_continuation(parsed_response: Dict[str, str], finish_reason: str, continuation_count: int) -> bool:
+    """Checks if a (possibly partial) response should be continued."""
+    return (
+        continuation_count > 0 and
+        not has_reply_end(parsed_response) and
+        not block_exists(parsed_response, constants.BLOCK_ERROR) and
+        finish_reason != "stop" and
+        finish_reason not in constants.ERROR_FINISH_REASONS
+    )
+
+
+def _continuation_messages(
+    request_messages: List[Dict[str, str]],
+    response_text: str,
+    chunk_label: str,
+    use_prefill: bool,
+) -> List[Dict[str, str]]:
+    """
+    Builds the messages for a continuation request: the original prompt plus only
+    the last CONTINUATION_TAIL_CHARS of the output produced so far as the anchor.
+    With prefill the anchor is sent as a partial assistant message the model extends;
+    otherwise a short user message asks the model to resume right after it.
+    """
+    anchor = response_text[-constants.CONTINUATION_TAIL_CHARS:]
+    if use_prefill:
+        # Prefilled assistant content must not end with whitespace (Anthropic rejects it)
+        return list(request_messages) + [{"role": "assistant", "content": anchor.rstrip()}]
+
+    omitted = len(response_text) - len(anchor)
+    if omitted > 0:
+        anchor = f"[... {omitted} earlier characters of this reply omitted ...]\n{anchor}"
+    return list(request_messages) + [
+        {"role": "assistant", "content": anchor},
+        {
+            "role": "user",
+            "content": f"Your reply for {chunk_label} was cut off; its last part is shown above. Continue EXACTLY where it stopped: "
+                       f"do not repeat text already written and do not start again with {constants.TAG_REPLY_START}. "
+                       f"Keep using the same {constants.TAG_FILE_START_TPL.format(block_name='...')}/{constants.TAG_FILE_END} blocks "
+                       f"and end the entire reply with {constants.TAG_REPLY_END} on a new line only when fully complete."
+        },
+    ]
+
+
+def stitch_continuation(response_text: str, new_content: str, prefilled: bool = False) -> str:
+    """
+    Appends a continuation to the partial response text.
+    Drops a restarted reply start tag and any prefix of the continuation that repeats
+    the end of the existing text (models often re-emit the last line or two). A
+    prefilled continuation resumes exactly at the anchor, so nothing is dropped: a
+    repeat there is legitimate output (repeated lines of the input).
+    """
+    if prefilled:
+        # The anchor was sent without trailing whitespace, the model continues from there
+        response_text = response_text.rstrip()
+
+    if new_content.lstrip().startswith(constants.TAG_REPLY_START):
+        new_content = new_content.lstrip()[len(constants.TAG_REPLY_START):].lstrip("\r\n")
+
+    if not prefilled:
+        tail = response_text[-constants.CONTINUATION_TAIL_CHARS:]
+        for overlap in range(min(len(tail), len(new_content)), constants.MIN_CONTINUATION_OVERLAP - 1, -1):
+            if tail.endswith(new_content[:overlap]):
+                log.debug(f"Dropping {overlap} chars of continuation that repeat the previous output.")
+                new_content = new_content[overlap:]
+                break
+
+    # Tags must start on their own line for the parser
+    if new_content.startswith("<|||") and response_text and not response_text.endswith("\n"):
+        new_content = "\n" + new_content
+    return response_text + new_content
+
+
+def _request_with_continuation(
+    llm_client: 'LlmClientType',
+    request_messages: List[Dict[str, str]],
+    config: 'TulpConfig',
+    inspect_manager: 'InspectLog | None',
+    chunk_label: str,
+    inspect_tag: str,
+) -> Tuple[Dict[str, str], str, int]:
+    """
+    Sends request_messages to the LLM, asking it to continue while the reply looks incomplete.
+
+    Returns:
+        A tuple (parsed_response, finish_reason, continuation_attempts).
+    """
+    continuation_count = config.continuation_retries
+    current_continuation_attempt = 0
+    use_prefill = bool(getattr(llm_client, "supports_prefill", False))
+    capabilities = get_capabilities(getattr(llm_client, "model_name", None) or config.model)
+
+    log.debug(f"Sending initial request for {chunk_label} to LLM...")
+    response = timed_generate(llm_client, request_messages, config, inspect_tag, inspect_manager, f"{inspect_tag}_attempt_0")
+    log.debug("Initial LLM Response for %s: %s", chunk_label, response)
+
+    response_text = response.get("content", "")
+    finish_reason = response.get("finish_reason", "")
+    with metrics.timed(inspect_tag, "parse"):
+        parsed_response = parse_response(response_text)
+
+    while _needs_continuation(parsed_response, finish_reason, continuation_count):
+        # Only the original prompt plus a bounded tail of the output is resent,
+        # so each continuation costs the same instead of growing with the reply.
+        continuation_messages = _continuation_messages(request_messages, response_text, chunk_label, use_prefill)
+        if not fits_context(capabilities, continuation_messages):
+            log.warning(f"A continuation request for {chunk_label} would not fit the model's context window, not sending it. Lower --max-chars.")
+            break
+
+        current_continuation_attempt += 1
+        log.info(f"Response for {chunk_label} seems incomplete (missing {constants.TAG_REPLY_END}). Requesting continuation ({current_continuation_attempt}/{config.continuation_retries})...")
+        continuation_count -= 1
+
+        log.debug(f"Sending continuation request to LLM (prefill: {use_prefill})...")
+        response = timed_generate(
+            llm_client, continuation_messages, config, inspect_tag,
+            inspect_manager, f"{inspect_tag}_attempt_{current_continuation_attempt}"
+        )
+        log.debug("Continuation LLM Response: %s", response)
+
+        if response.get("role") == "error":
+            # Keep the partial reply out of the output, the error is reported by the caller
+            finish_reason = response.get("finish_reason") or "error"
+            log.warning(f"Continuation request for {chunk_label} failed ('{finish_reason}').")
+            break
+
+        new_content = response.get("content", "")
+        if not new_content:
+            log.warning("Continuation request returned empty content.")
+            break
+
+        response_text = stitch_continuation(response_text, new_content, use_prefill)
+        finish_reason = response.get("finish_reason", "")
+
+        # Re-parse the combined response
+        with metrics.timed(inspect_tag, "parse"):
+            parsed_response = parse_response(response_text)
+        log.debug(lambda: f"Combined response after continuation {current_continuation_attempt} has reply end tag: {has_reply_end(parsed_response)}")
+
+    metrics.set_chunk(inspect_tag, continuations=current_continuation_attempt)
+    return parsed_response, finish_reason, current_continuation_attempt
+
+
+def _process_chunk_with(
+    llm_client: 'LlmClientType',
+    request_messages: List[Dict[str, str]],
+    config: 'TulpConfig',
+    inspect_manager: 'InspectLog | None',
+    chunk_label: str,
+    inspect_tag: str,
+    can_escalate: bool,
+) -> Tuple[Dict[str, str] | None, str | None]:
+    """
+    Runs one prompt (with continuations) on one client and validates the reply.
+
+    Returns:
+        A tuple (parsed_response, failure). If can_escalate is set, a reply that is
+        incomplete, reports an error or fails --validate is returned as (None, reason)
+        so the caller can retry it on the next model; otherwise failure is always None
+        and parsed_response is None if the chunk failed.
+    """
+    try:
+        parsed_response, finish_reason, current_continuation_attempt = _request_with_continuation(
+            llm_client, request_messages, config, inspect_manager, chunk_label, inspect_tag
+        )
+
+        # Check reply end tag presence for logging
+        if not has_reply_end(parsed_response):
+            if can_escalate:
+                return None, f"{constants.TAG_REPLY_END} not found (finish_reason: '{finish_reason}')"
+            if finish_reason in constants.ERROR_FINISH_REASONS:
+                 log.error(f"LLM client reported an error during generation for {chunk_label} ('{finish_reason}'). Cannot continue.")
+                 return None, None
+            elif config.continuation_retries > 0 and current_continuation_attempt == config.continuation_retries:
+                 log.error(f"Max continuation retries ({config.continuation_retries}) reached for {chunk_label}, but {constants.TAG_REPLY_END} still not found. Output might be incomplete.")
+            elif finish_reason == "length":
+                 log.error(f"LLM indicated response for {chunk_label} truncated due to token limits ('{finish_reason}'). Output is likely incomplete.")
+            else:
+                 log.warning(f"{constants.TAG_REPLY_END} tag not found in the final response for {chunk_label}. Output may be incomplete (finish_reason: '{finish_reason}').")
+
+        # Check for LLM-reported error block using the new block name constant
+        if block_is_not_empty(parsed_response, constants.BLOCK_ERROR):
+            error_msg = block_content(parsed_response, constants.BLOCK_ERROR)
+            if can_escalate:
+                return None, f"the reply has an error block ({error_msg[:100]})"
+            log.error(f"LLM reported processing error for {chunk_label}:")
+            print(f"Tulp Error: {error_msg}", file=sys.stderr)
+            return None, None
+
+        if block_exists(parsed_response, constants.BLOCK_STDOUT):
+            chunk_stdout = parsed_response.get(constants.BLOCK_STDOUT, "")
+            if chunk_stdout:
+                log.info(f"Processed {constants.BLOCK_STDOUT} block for {chunk_label} ({len(chunk_stdout)} chars).")
+        elif not block_exists(parsed_response, constants.BLOCK_ERROR):
+            # Log warning if neither stdout nor error block is present
+            log.warning(f"No '{constants.BLOCK_STDOUT}' block found in response for {chunk_label}.")
+
+        if config.validate:
+            ok, message = validate_output(config.validate, parsed_response.get(constants.BLOCK_STDOUT, ""))
+            if not ok:
+                if can_escalate:
+                    return None, f"--validate failed ({message})"
+                log.error(f"Output of {chunk_label} failed the --validate command: {message}")
+                return None, None
+
+        return parsed_response, None
+
+    except Exception as e:
+        import traceback
+        if can_escalate:
+            log.debug(traceback.format_exc())
+            return None, f"the request failed ({e})"
+        log.error(f"An unexpected error occurred during processing {chunk_label}: {e}")
+        log.debug(traceback.format_exc())
+        return None, None
+
+
+def process_chunk(
+    llm_client: 'LlmClientType',
+    request_messages: List[Dict[str, str]],
+    config: 'TulpConfig',
+    inspect_manager: 'InspectLog | None',
+    chunk_label: str,
+    inspect_tag: str,
+) -> Dict[str, str] | None:
+    """
+    Runs one prompt (with continuations) and validates the reply.
+    With --cascade the prompt goes to the first model and escalates to the next one
+    while the reply is incomplete, reports an error or fails --validate.
+
+    Returns:
+        The parsed response blocks, or None if the LLM reported an error or the request failed.
+    """
+    tiers = cascade_tiers(llm_client)
+    for tier, client in enumerate(tiers):
+        can_escalate = tier < len(tiers) - 1
+        parsed_response, failure = _process_chunk_with(
+            client, request_messages, config, inspect_manager, chunk_label, inspect_tag, can_escalate
+        )
+        if failure is None:
+            if len(tiers) > 1:
+                metrics.set_chunk(inspect_tag, model=client.model_name, escalations=tier)
+            return parsed_response
+        log.warning(f"Escalating {chunk_label} from {client.model_name} to {tiers[tier + 1].model_name}: {failure}.")
+    return None
+
+
+def _next_context(parsed_response: Dict[str, str], previous_context: str | None, context_chars: int, chunk_label: str) -> str | None:
+    """
+    Returns the context block to feed into the next chunk's prompt, bounded to context_chars.
+    Keeps the previous context if the model did not emit a new one.
+    """
+    if not block_is_not_empty(parsed_response, constants.BLOCK_CONTEXT):
+        if previous_context:
+            log.warning(f"No '{constants.BLOCK_CONTEXT}' block in response for chunk {chunk_label}. Reusing the previous context.")
+        return previous_context
+
+    context = block_content(parsed_response, constants.BLOCK_CONTEXT)
+    if len(context) > context_chars:
+        log.warning(f"Context block for chunk {chunk_label} exceeds the budget ({len(context)} > {context_chars} chars). Truncating.")
+        context = context[:context_chars]
+    log.debug(f"Context carried over from chunk {chunk_label}:\n{context}")
+    return context
+
+
+def open_output_sink(config: 'TulpConfig') -> Tuple[OutputSink, int]:
+    """
+    Opens the sink for the final stdout content: the configured file, or stdout.
+    Falls back to stdout if the file cannot be prepared.
+
+    Returns:
+        A tuple (sink, exit_code) where exit_code is 1 if the fallback was used.
+    """
+    if config.write_file:
+        sink = OutputSink(config.write_file, config.max_backups)
+        ok, msg = sink.open()
+        if ok:
+            return sink, 0
+        log.error(f"Failed to write final output to file: {msg}")
+    return OutputSink(), (1 if config.write_file else 0)
+
+
+def close_output_sink(sink: OutputSink) -> int:
+    """Finishes writing the final output. Returns an exit code."""
+    ok, msg = sink.close()
+    if not ok:
+        log.error(f"Failed to write final output to file: {msg}")
+        return 1
+    if sink.file_path:
+        log.info(f"Final output successfully written to {msg}")
+    return 0
+
+
+def write_output(final_output: str, config: 'TulpConfig') -> int:
+    """Writes the final stdout content to the configured file or to stdout. Returns an exit code."""
+    sink, exit_code = open_output_sink(config)
+    sink.write(final_output)
+    return close_output_sink(sink) or exit_code
+
+
+def dedup_chunks(stdin_chunks: List[str | None]) -> Tuple[List[int], List[int]]:
+    """
+    Groups identical chunks.
+
+    Returns:
+        A tuple (unique_positions, first_positions): the positions of the first
+        occurrence of every distinct chunk, in input order, and for every position
+        the position of the first occurrence of its content.
+    """
+    first_seen: Dict[str | None, int] = {}
+    first_positions = [first_seen.setdefault(chunk, i) for i, chunk in enumerate(stdin_chunks)]
+    unique_positions = [i for i, first in enumerate(first_positions) if first == i]
+    return unique_positions, first_positions
+
+
+def _fan_out(results: Iterator[Any], unique_positions: List[int], first_positions: List[int]) -> Iterator[Any]:
+    """
+    Yields a result for every position, given the results of the unique chunks in order.
+    Results are pulled lazily and kept only until the last duplicate that needs them.
+    """
+    remaining: Dict[int, int] = {}
+    for first in first_positions:
+        remaining[first] = remaining.get(first, 0) + 1
+    cached: Dict[int, Any] = {}
+    unique_iter = iter(unique_positions)
+    for first in first_positions:
+        while first not in cached:
+            cached[next(unique_iter)] = next(results)
+        result = cached[first]
+        remaining[first] -= 1
+        if not remaining[first]:
+            del cached[first]
+        yield result
+
+
 def process_request(
     llm_client: 'LlmClientType',
     prompt_factory: 'PromptFactoryType',
@@ -24,185 +430,138 @@ def process_request(
     stdin_chunks: List[str],
     config: 'TulpConfig',
     args: Any,
-    inspect_manager: 'RequestMessageSerializer | None'
+    inspect_manager: 'InspectLog | None',
+    input_format: str = "text",
+    layout: Dict[str, Any] | None = None,
+    chunker: 'AdaptiveChunker | None' = None,
 ) -> int:
-    """Processes request using the new tag format and parser."""
-    if not stdin_chunks:
-        stdin_chunks = [None] # Handle no-stdin case
-
-    full_response_stdout = []
+    """
+    Processes request using the new tag format and parser.
+    input_format tells the prompt whether every chunk is a complete document (see input_handler.chunk_stdin),
+    layout describes the original input when it was compacted (see compaction.compact_input).
+    With a chunker (--adaptive-chunks) stdin_chunks is ignored: chunks are cut as they are
+    sent, sized from the replies to the previous ones, and num_chunks is an estimate.
+    """
+    if chunker is not None:
+        stdin_chunks = chunker.chunks # Filled as the chunks are cut
+        num_chunks = chunker.estimated_total()
+    else:
+        if not stdin_chunks:
+            stdin_chunks = [None] # Handle no-stdin case
+        num_chunks = len(stdin_chunks)
     final_stderr_content = ""
+    final_stderr_chunk = -1
     last_response_parsed = {}
 
-    for i, stdin_chunk in enumerate(stdin_chunks):
-        is_last_chunk = (i == len(stdin_chunks) - 1)
-        chunk_num_display = f"{i + 1}/{len(stdin_chunks)}"
+    # Rolling context needs each chunk's response before the next prompt can be built
+    carry_context = config.context_chars > 0 and num_chunks > 1
+    carried_context = None
+    jobs = config.jobs
+    if carry_context and jobs > 1:
+        log.info(f"Rolling context enabled ({config.context_chars} chars): processing chunks sequentially.")
+        jobs = 1
+
+    def run_chunk(i: int, stdin_chunk: str | None) -> Dict[str, str] | None:
+        nonlocal carried_context
+        chunk_total = chunker.estimates[i] if chunker is not None else num_chunks
+        chunk_num_display = f"{i + 1}/{chunk_total}"
+        if budget_exceeded(config):
+            log.error(f"Cost budget reached ({format_cost(metrics.total_cost)} of {format_cost(config.max_cost)}) before chunk {chunk_num_display}. Stopping.")
+            return None
         log.info(f"Processing chunk {chunk_num_display}...")
 
-        response_text = ""
-        finish_reason = ""
-        continuation_count = config.continuation_retries
-        current_continuation_attempt = 0
-
-        # --- Initial Request ---
-        request_messages = prompt_factory.getMessages(
-            user_instructions=user_request,
-            stdin_chunk=stdin_chunk,
-            num_chunks=len(stdin_chunks),
-            current_chunk_num=i + 1,
-        )
+        prompt_kwargs = {}
+        if carry_context:
+            prompt_kwargs = {"context": carried_context, "context_chars": config.context_chars}
+        if input_format in constants.STRUCTURED_INPUT_FORMATS:
+            prompt_kwargs["input_format"] = input_format
+        with metrics.timed(f"chunk_{i}", "prompt_build"):
+            request_messages = prompt_factory.getMessages(
+                user_instructions=user_request,
+                stdin_chunk=stdin_chunk,
+                num_chunks=chunk_total,
+                current_chunk_num=i + 1,
+                **prompt_kwargs,
+            )
 
         # Log request messages if needed
         if log._should_log('DEBUG'): # Check log level directly
             for msg_idx, req_msg in enumerate(request_messages):
                  log.debug(f"Chunk {chunk_num_display} Initial Req Msg {msg_idx+1} Role: {req_msg.get('role')}\nContent:\n{req_msg.get('content', '')[:500]}...")
 
-
-        try:
-            log.debug(f"Sending initial request for chunk {chunk_num_display} to LLM...")
-            response = llm_client.generate(request_messages)
-            log.debug(f"Initial LLM Response for chunk {chunk_num_display}: {response}")
-
-            if inspect_manager:
-                inspect_manager.save(request_messages, response, f"chunk_{i}_attempt_0")
-
-            response_text += response.get("content", "")
-            finish_reason = response.get("finish_reason", "")
-
-            # --- Continuation Loop ---
-            parsed_response = parse_response(response_text)
-
-            # Check if continuation is needed using the new parser function
-            needs_continuation = (
-                continuation_count > 0 and
-                not has_reply_end(parsed_response) and # Use new check
-                not block_exists(parsed_response, constants.BLOCK_ERROR) and # Check block name
-                finish_reason != "stop" and
-                finish_reason != "error"
-            )
-
-            while needs_continuation:
-                current_continuation_attempt += 1
-                log.info(f"Response for chunk {chunk_num_display} seems incomplete (missing {constants.TAG_REPLY_END}). Requesting continuation ({current_continuation_attempt}/{config.continuation_retries})...")
-                continuation_count -= 1
-
-                request_messages.append(response) # Add previous assistant message
-                request_messages.append({
-                    "role": "user",
-                    # Reference the new tag format in the continuation prompt
-                    "content": f"Please continue generating the response exactly where you left off for chunk {chunk_num_display}. Ensure you follow the required format (starting with {constants.TAG_REPLY_START}, using {constants.TAG_FILE_START_TPL.format(block_name='...')}/{constants.TAG_FILE_END} blocks) and end the entire reply with {constants.TAG_REPLY_END} on a new line only when fully complete."
-                })
-
-                log.debug("Sending continuation request to LLM...")
-                response = llm_client.generate(request_messages)
-                log.debug(f"Continuation LLM Response: {response}")
-
-                if inspect_manager:
-                    inspect_manager.save(request_messages, response, f"chunk_{i}_attempt_{current_continuation_attempt}")
-
-                new_content = response.get("content", "")
-                if not new_content:
-                    log.warning("Continuation request returned empty content.")
-                    break
-
-                response_text += "\n" + new_content
-                finish_reason = response.get("finish_reason", "")
-
-                # Re-parse the combined response
-                parsed_response = parse_response(response_text)
-                log.debug(f"Combined response after continuation {current_continuation_attempt} has reply end tag: {has_reply_end(parsed_response)}")
-
-                # Re-evaluate if continuation is still needed
-                needs_continuation = (
-                    continuation_count > 0 and
-                    not has_reply_end(parsed_response) and # Use new check
-                    not block_exists(parsed_response, constants.BLOCK_ERROR) and # Check block name
-                    finish_reason != "stop" and
-                    finish_reason != "error"
-                )
-            # --- End Continuation Loop ---
-
-
-            # --- Process Final Response for the Chunk ---
-            last_response_parsed = parsed_response
-
-            # Check reply end tag presence for logging
-            if not has_reply_end(parsed_response):
-                if config.continuation_retries > 0 and current_continuation_attempt == config.continuation_retries:
-                     log.error(f"Max continuation retries ({config.continuation_retries}) reached for chunk {chunk_num_display}, but {constants.TAG_REPLY_END} still not found. Output might be incomplete.")
-                elif finish_reason == "length":
-                     log.error(f"LLM indicated response for chunk {chunk_num_display} truncated due to token limits ('{finish_reason}'). Output is likely incomplete.")
-                elif finish_reason == 'error':
-                     log.error(f"LLM client reported an error during generation for chunk {chunk_num_display}. Cannot continue.")
-                     return 1
+        chunk_start = time.perf_counter()
+        parsed_response = process_chunk(llm_client, request_messages, config, inspect_manager, f"chunk {chunk_num_display}", f"chunk_{i}")
+        if chunker is not None and parsed_response is not None:
+            chunker.observe(i, parsed_response, time.perf_counter() - chunk_start)
+        if carry_context and parsed_response is not None and i < chunk_total - 1:
+            carried_context = _next_context(parsed_response, carried_context, config.context_chars, chunk_num_display)
+        return parsed_response
+
+    # Identical chunks are sent once and their result is reused at every position.
+    # Not with rolling context: each chunk's prompt then depends on the previous ones.
+    unique_positions = list(range(num_chunks))
+    first_positions = unique_positions
+    if config.dedup and num_chunks > 1 and not carry_context and chunker is None:
+        unique_positions, first_positions = dedup_chunks(stdin_chunks)
+        duplicates = num_chunks - len(unique_positions)
+        if duplicates:
+            log.info(f"{duplicates} of {num_chunks} chunks are duplicates, sending {len(unique_positions)} unique chunks.")
+
+    if chunker is not None:
+        # Chunks are cut when map_chunks pulls them, after the replies to all but the last `jobs` chunks
+        results = map_chunks(run_chunk, chunker, jobs, log_id=lambda k: k + 1)
+    else:
+        results = map_chunks(
+            lambda k, i: run_chunk(i, stdin_chunks[i]), unique_positions, jobs,
+            log_id=lambda k: unique_positions[k] + 1,
+        )
+        if len(unique_positions) < num_chunks:
+            results = _fan_out(results, unique_positions, first_positions)
+
+    # Each chunk's stdout is written as soon as it (and every chunk before it) is done,
+    # merged with the previous ones into a single document of the output format
+    sink, exit_code = open_output_sink(config)
+    merger = OutputMerger(config.output_format if num_chunks > 1 else "text")
+
+    for i, parsed_response in enumerate(results):
+        if parsed_response is None:
+            sink.abort()
+            return 1 # Exit on first error encountered
+        last_response_parsed = parsed_response
+
+        # Retrieve stderr content using the new block name constant
+        if block_exists(parsed_response, constants.BLOCK_STDERR):
+            stderr_content = block_content(parsed_response, constants.BLOCK_STDERR)
+            if stderr_content:
+                # With a chunker the last chunk is only known at the end
+                if i == num_chunks - 1 or chunker is not None:
+                    final_stderr_content, final_stderr_chunk = stderr_content, i
                 else:
-                     log.warning(f"{constants.TAG_REPLY_END} tag not found in the final response for chunk {chunk_num_display}. Output may be incomplete (finish_reason: '{finish_reason}').")
-
-            # Check for LLM-reported error block using the new block name constant
-            if block_is_not_empty(parsed_response, constants.BLOCK_ERROR):
-                error_msg = block_content(parsed_response, constants.BLOCK_ERROR)
-                log.error(f"LLM reported processing error for chunk {chunk_num_display}:")
-                print(f"Tulp Error: {error_msg}", file=sys.stderr)
-                return 1 # Exit on first error encountered
-
-            # Process valid blocks
-            # Retrieve stderr content using the new block name constant
-            if block_exists(parsed_response, constants.BLOCK_STDERR):
-                stderr_content = block_content(parsed_response, constants.BLOCK_STDERR)
-                if stderr_content:
-                    if is_last_chunk:
-                        final_stderr_content = stderr_content
-                    else:
-                        log.debug(f"Stderr from chunk {chunk_num_display}:\n{stderr_content}")
-
-            # Collect stdout content using the new block name constant
-            if block_exists(parsed_response, constants.BLOCK_STDOUT):
-                # Get raw content (parser already strips outer whitespace)
-                chunk_stdout = parsed_response.get(constants.BLOCK_STDOUT, "")
-                if chunk_stdout:
-                    full_response_stdout.append(chunk_stdout)
-                    log.info(f"Processed {constants.BLOCK_STDOUT} block for chunk {chunk_num_display} ({len(chunk_stdout)} chars).")
-            else:
-                 # Log warning if neither stdout nor error block is present
-                 if not block_exists(parsed_response, constants.BLOCK_ERROR):
-                     log.warning(f"No '{constants.BLOCK_STDOUT}' block found in response for chunk {chunk_num_display}.")
-
-        except Exception as e:
-            log.error(f"An unexpected error occurred during processing chunk {chunk_num_display}: {e}")
-            import traceback
-            log.debug(traceback.format_exc())
-            return 1
-        # --- End Chunk Processing Try-Except ---
+                    log.debug(f"Stderr from chunk {i + 1}/{num_chunks}:\n{stderr_content}")
+
+        # Write stdout content (parser already strips outer whitespace), without wrapping code fences
+        chunk_stdout = strip_code_fences(parsed_response.get(constants.BLOCK_STDOUT, ""))
+        with metrics.timed(f"chunk_{i}", "write"):
+            sink.write(merger.feed(restore_output(chunk_stdout, layout, config.restore_format)))
+        if chunker is None and first_positions[i] != i:
+            metrics.record_duplicate(f"chunk_{i}", f"chunk_{first_positions[i]}")
+        metrics.set_chunk(f"chunk_{i}", input_chars=len(stdin_chunks[i] or ""), output_chars=len(chunk_stdout))
     # --- End Chunk Loop ---
-
-
-    # --- Final Output Aggregation and Writing ---
-    final_output_raw = "".join(full_response_stdout)
-    final_output_cleaned = cleanup_output(final_output_raw)
+    sink.write(merger.finish())
+    if num_chunks > 1:
+        metrics.set_run_info(output_format=merger.output_format)
+    if chunker is not None:
+        metrics.set_run_info(num_chunks=len(stdin_chunks))
 
     # Check for empty output conditions
-    if not final_output_cleaned and not block_exists(last_response_parsed, constants.BLOCK_ERROR):
+    if not sink.chars_written and not block_exists(last_response_parsed, constants.BLOCK_ERROR):
          if len(stdin_chunks) > 0 and stdin_chunks[0] is not None:
              log.warning("Processing finished, but the combined stdout content is empty after cleaning.")
          elif len(stdin_chunks) == 1 and stdin_chunks[0] is None:
               log.warning("Request finished, but the stdout content is empty after cleaning.")
 
     # Print final stderr if collected
-    if final_stderr_content:
+    if final_stderr_content and final_stderr_chunk == len(stdin_chunks) - 1:
         print_stderr(final_stderr_content)
 
-    # Write or print the final stdout
-    exit_code = 0
-    if config.write_file:
-        writer = OutputFileWriter()
-        ok, msg = writer.write_to_file(config.write_file, final_output_cleaned)
-        if not ok:
-            log.error(f"Failed to write final output to file: {msg}")
-            print_stdout(final_output_cleaned)
-            exit_code = 1
-        else:
-            log.info(f"Final output successfully written to {msg}")
-    else:
-        print_stdout(final_output_cleaned)
-
-    return exit_code
+    return close_output_sink(sink) or exit_code
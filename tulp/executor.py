@@ -8,11 +8,15 @@ from . import constants
 # Import the UPDATED parser functions and relevant constants
 from .response_parser import parse_response, has_reply_end, block_exists, block_content, block_is_not_empty
 from .output_handler import cleanup_output, OutputFileWriter
+from .metrics import metrics
+from .core import timed_generate, budget_exceeded
+from .sampler import sample_input
+from .pricing import format_cost
 
 # Type hints
 if TYPE_CHECKING:
     from .config import TulpConfig
-    from .promptSerializer import RequestMessageSerializer
+    from .inspect_log import InspectLog
     LlmClientType = Any
     PromptFactoryType = Any
 
@@ -50,21 +54,29 @@ def handle_execution_request(
     llm_client: 'LlmClientType',
     prompt_factory: 'PromptFactoryType',
     user_request: str,
-    stdin_chunks: List[str],
+    input_text: str,
     config: 'TulpConfig',
     args: Any,
-    inspect_manager: 'RequestMessageSerializer | None'
+    inspect_manager: 'InspectLog | None',
+    input_format: str = "auto",
 ) -> int:
-    """Handles code generation and execution using the new tag format."""
+    """
+    Handles code generation and execution using the new tag format.
+    The prompt shows a representative sample of the input (see sampler.sample_input),
+    the generated program runs on the whole input.
+    """
     retries = 0
     max_retries = constants.MAX_EXECUTION_RETRIES
-    combined_stdin = "".join(stdin_chunks) if stdin_chunks else ""
-    stdin_context_chunk = stdin_chunks[0] if stdin_chunks else ""
 
-    request_messages = prompt_factory.getMessages(user_request, stdin_context_chunk)
+    with metrics.timed("exec_attempt_0", "prompt_build"):
+        input_summary, stdin_sample = sample_input(input_text, config.sample_chars, input_format) if input_text else ("", "")
+        request_messages = prompt_factory.getMessages(user_request, stdin_sample, input_summary=input_summary)
     last_llm_response = None
 
     while retries < max_retries:
+        if budget_exceeded(config):
+            log.error(f"Cost budget reached ({format_cost(metrics.total_cost)} of {format_cost(config.max_cost)}). Stopping code generation.")
+            return 1
         log.info(f"Attempt {retries + 1}/{max_retries} to generate and execute code...")
 
         # Log request messages if needed
@@ -74,20 +86,18 @@ def handle_execution_request(
                 log.debug(f"Request Message {i+1} Role: {req.get('role', 'N/A')}\nContent:\n-------\n{content_preview}\n-------")
 
         log.debug("Sending request to LLM for code generation...")
+        attempt_tag = f"exec_attempt_{retries}"
         try:
-            response = llm_client.generate(request_messages)
+            response = timed_generate(llm_client, request_messages, config, attempt_tag, inspect_manager)
             last_llm_response = response
-            log.debug(f"LLM Response: {response}")
-
-            if inspect_manager:
-                inspect_manager.save(request_messages, response, f"exec_attempt_{retries}")
+            log.debug("LLM Response: %s", response)
 
             response_text = response.get("content", "")
             if not response_text:
                  log.warning("LLM returned an empty response content.")
                  if retries < max_retries -1:
                       log.warning("Retrying due to empty LLM response.")
-                      request_messages.append(response)
+                      request_messages.append({"role": response.get("role", "assistant"), "content": response_text})
                       # Use new constants in retry message
                       request_messages.append({"role": "user", "content": f"You returned an empty response. Please provide the Python code in the {constants.TAG_STDOUT_START}/{constants.TAG_FILE_END} block as requested."})
                       retries += 1
@@ -97,7 +107,8 @@ def handle_execution_request(
                       return 1
 
             # Parse using the new parser
-            blocks = parse_response(response_text)
+            with metrics.timed(attempt_tag, "parse"):
+                blocks = parse_response(response_text)
 
             # Check for reply end tag - less critical here, but good practice
             if not has_reply_end(blocks):
@@ -118,7 +129,7 @@ def handle_execution_request(
                 log.error(f"LLM did not provide Python code in the '{constants.BLOCK_STDOUT}' block.")
                 if retries < max_retries - 1:
                     log.warning(f"Retrying code generation as '{constants.BLOCK_STDOUT}' block was missing or empty.")
-                    request_messages.append(response)
+                    request_messages.append({"role": response.get("role", "assistant"), "content": response_text})
                     # Use constants.BLOCK_STDOUT in the explanation part of the user message
                     request_messages.append({
                         "role": "user",
@@ -137,14 +148,15 @@ def handle_execution_request(
 
             # Optionally write the generated code to a file
             if config.write_file:
-                writer = OutputFileWriter()
+                writer = OutputFileWriter(config.max_backups)
                 ok, msg = writer.write_to_file(config.write_file, generated_code)
                 if ok: log.info(f"Generated code written to: {msg}")
                 else: log.error(f"Failed to write generated code: {msg}")
 
             # --- Execute the generated code ---
             log.info("Executing the generated Python code...")
-            code_stdout, code_stderr, exit_code = execute_python_code(generated_code, combined_stdin)
+            with metrics.timed(attempt_tag, "execute"):
+                code_stdout, code_stderr, exit_code = execute_python_code(generated_code, input_text)
 
             if exit_code == 0:
                 log.info("Code executed successfully.")
@@ -172,7 +184,7 @@ def handle_execution_request(
 
                 # --- Prepare messages for the retry attempt ---
                 log.info("Asking LLM to fix the code based on the execution error...")
-                request_messages.append(response) # Append the response that generated the failing code
+                request_messages.append({"role": response.get("role", "assistant"), "content": response_text}) # Append the response that generated the failing code
                 # User message for code execution failure - uses constants.BLOCK_STDOUT correctly
                 request_messages.append({
                     "role": "user",
@@ -0,0 +1,85 @@
+# failover.py
+import threading
+import time
+from typing import List, Dict, Any
+from . import constants
+from .logger import log
+from .metrics import metrics
+
+
+class FailoverClient:
+    """
+    Ordered chain of LLM clients for --failover: the first available one answers.
+
+    A provider is marked down for the cool-down period after a connection error, a
+    5xx error or a timeout, or after FAILOVER_RATE_LIMIT_THRESHOLD consecutive 429
+    errors. The failed request is sent again, unchanged, to the next provider in the
+    chain, and so are the following requests until the cool-down ends and the
+    earlier (preferred) provider is tried again.
+    """
+
+    def __init__(self, clients: List[Any], cooldown: float = constants.DEFAULT_FAILOVER_COOLDOWN):
+        if not clients:
+            raise ValueError("A failover chain needs at least one model.")
+        self.clients = clients
+        self.cooldown = cooldown
+        self.model_name = getattr(clients[0], "model_name", None)
+        # Continuations may be answered by any provider of the chain
+        self.supports_prefill = all(getattr(client, "supports_prefill", False) for client in clients)
+        self._lock = threading.Lock()
+        self._down_until = [0.0] * len(clients)
+        self._rate_limits = [0] * len(clients)
+        self._active = 0
+
+    def _available(self) -> List[int]:
+        """Indexes of the providers not in cool-down, in chain order."""
+        now = time.monotonic()
+        with self._lock:
+            return [i for i, down_until in enumerate(self._down_until) if down_until <= now]
+
+    def _mark_down(self, index: int, reason: str):
+        with self._lock:
+            self._down_until[index] = time.monotonic() + self.cooldown
+            self._rate_limits[index] = 0
+        log.warning(f"Provider {self.clients[index].model_name} unavailable ({reason}), skipping it for {self.cooldown:g}s.")
+        metrics.add_counter("failovers")
+
+    def _record_result(self, index: int, response: Dict[str, Any]) -> bool:
+        """Updates the provider state with a response. Returns True if the request should go to the next provider."""
+        finish_reason = response.get("finish_reason")
+        if response.get("role") != "error":
+            with self._lock:
+                self._rate_limits[index] = 0
+                if self._active != index:
+                    log.info(f"Requests are now served by {self.clients[index].model_name}.")
+                    self._active = index
+            return False
+        if finish_reason in constants.FAILOVER_FINISH_REASONS:
+            self._mark_down(index, finish_reason)
+            return True
+        if finish_reason == "rate_limit":
+            with self._lock:
+                self._rate_limits[index] += 1
+                repeated = self._rate_limits[index] >= constants.FAILOVER_RATE_LIMIT_THRESHOLD
+            if repeated:
+                self._mark_down(index, f"{constants.FAILOVER_RATE_LIMIT_THRESHOLD} consecutive rate limit errors")
+            return True
+        return False
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        candidates = self._available() or list(range(len(self.clients))) # All down: try them all anyway
+        response: Dict[str, Any] = {}
+        for index in candidates:
+            client = self.clients[index]
+            try:
+                response = client.generate(messages)
+            except ConnectionError as e:
+                response = {"role": "error", "content": f"Connection error: {e}", "finish_reason": "connection_error"}
+            if not self._record_result(index, response):
+                break
+            if index != candidates[-1]:
+                log.info("Retrying the request on the next provider of the failover chain.")
+        if index and response.get("role") != "error":
+            # Price the reply with the model that produced it (see core.timed_generate)
+            response = dict(response, model=client.model_name)
+        return response
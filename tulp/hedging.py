@@ -0,0 +1,114 @@
+# hedging.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError, wait
+from typing import List, Dict, Any, Tuple
+from . import constants
+from .logger import log
+from .metrics import metrics, _percentile
+from .pricing import estimate_cost
+
+
+def _is_error(future: Future) -> bool:
+    """True if the request behind future raised or returned an error response."""
+    if future.exception() is not None:
+        return True
+    response, _latency = future.result()
+    return response.get("role") == "error"
+
+
+class HedgedClient:
+    """
+    Wraps an LLM client to mitigate stragglers (--hedge).
+
+    Once enough latencies have been observed, a request that is still running after
+    the configured percentile of them is duplicated on the hedge client (the same
+    model by default, or --hedge-model). The first successful reply is returned.
+    The other request cannot be interrupted: it runs to completion in a daemon
+    thread, its result is discarded and its estimated cost is added to the run.
+    """
+
+    def __init__(self, client: Any, hedge_client: Any = None, percentile: float = 95.0):
+        self.client = client
+        self.hedge_client = hedge_client or client
+        self.model_name = getattr(client, "model_name", None)
+        # Continuations must be understood by whichever client answers
+        self.supports_prefill = bool(getattr(client, "supports_prefill", False)) and bool(getattr(self.hedge_client, "supports_prefill", False))
+        self.percentile = percentile
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=constants.HEDGE_LATENCY_WINDOW)
+
+    def _observe(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def _hedge_delay(self) -> float | None:
+        """Seconds to wait before hedging, None until enough latencies were observed."""
+        with self._lock:
+            if len(self._latencies) < constants.HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return _percentile(latencies, self.percentile / 100.0)
+
+    def _start(self, client: Any, messages: List[Dict[str, Any]]) -> Future:
+        """Runs client.generate(messages) in a daemon thread (a stalled request must not block exit)."""
+        future: Future = Future()
+        def run():
+            start = time.perf_counter()
+            try:
+                response = client.generate(messages)
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            future.set_result((response, time.perf_counter() - start))
+        threading.Thread(target=run, name="tulp-hedge", daemon=True).start()
+        return future
+
+    def _account_discarded(self, client: Any, future: Future):
+        """Adds the estimated cost of a discarded reply to the run once it arrives."""
+        def done(finished: Future):
+            if finished.exception() is not None:
+                return
+            response, _latency = finished.result()
+            cost = estimate_cost(getattr(client, "model_name", None) or self.model_name or "", response.get("usage"))
+            if cost:
+                metrics.add_cost(cost)
+        future.add_done_callback(done)
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        delay = self._hedge_delay()
+        start = time.perf_counter()
+        if delay is None:
+            response = self.client.generate(messages)
+            self._observe(time.perf_counter() - start)
+            return response
+
+        primary = self._start(self.client, messages)
+        try:
+            response, latency = primary.result(timeout=delay)
+            self._observe(latency)
+            return response
+        except FuturesTimeoutError:
+            pass
+
+        log.info(f"Request still running after {delay:.2f}s (p{self.percentile:g} latency), sending a hedged request to {getattr(self.hedge_client, 'model_name', None)}")
+        metrics.add_counter("hedged_requests")
+        hedge = self._start(self.hedge_client, messages)
+        done, _pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner, loser, loser_client = (primary, hedge, self.hedge_client) if primary in done else (hedge, primary, self.client)
+        if _is_error(winner):
+            # Prefer the other request if it succeeds
+            wait([loser])
+            if not _is_error(loser):
+                winner, loser, loser_client = loser, winner, (self.client if loser is primary else self.hedge_client)
+        self._account_discarded(loser_client, loser)
+
+        self._observe(time.perf_counter() - start)
+        if winner is hedge:
+            metrics.add_counter("hedge_wins")
+        response, _latency = winner.result() # Re-raises the exception if both requests failed
+        if winner is hedge and self.hedge_client is not self.client:
+            # Price the reply with the model that produced it (see core.timed_generate)
+            response = dict(response, model=getattr(self.hedge_client, "model_name", None))
+        return response
@@ -1,7 +1,11 @@
 # input_handler.py
 import sys
-import math
-from typing import List, TYPE_CHECKING
+import csv
+import io
+import json
+import re
+from typing import List, Tuple, Callable, Iterator, TYPE_CHECKING
+from . import constants
 from .logger import log
 
 # Use TYPE_CHECKING to avoid circular import for type hints
@@ -23,29 +27,244 @@ def read_stdin() -> str:
         log.debug("No stdin detected (tty).")
     return input_text
 
-def chunk_stdin(input_text: str, config: 'TulpConfig') -> List[str]:
+# Log lines starting a new entry: a date/time, a bracketed level or a syslog-style month
+LOG_ENTRY_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}|\d{2}:\d{2}:\d{2}|\[|[A-Z][a-z]{2} [ \d]\d |(DEBUG|INFO|WARN|WARNING|ERROR|CRITICAL|FATAL|TRACE)\b)")
+CSV_DELIMITERS = ",\t;|"
+
+
+def _sample_lines(input_text: str) -> List[str]:
+    """The first non-empty lines of the input, used for format detection."""
+    lines = []
+    start = 0
+    end = min(len(input_text), constants.FORMAT_DETECTION_CHARS)
+    while start < end and len(lines) < constants.FORMAT_DETECTION_LINES:
+        newline = input_text.find("\n", start, end)
+        if newline < 0:
+            newline = end
+        line = input_text[start:newline].rstrip("\r")
+        if line.strip():
+            lines.append(line)
+        start = newline + 1
+    return lines
+
+def _is_json_value(line: str) -> bool:
+    try:
+        return isinstance(json.loads(line), (dict, list))
+    except ValueError:
+        return False
+
+def csv_delimiter(input_text: str) -> str | None:
+    """
+    The delimiter splitting the first records of the input into the same number
+    (>= 2) of fields, if any. Records are parsed as CSV, so quoted fields may span lines.
+    """
+    sample = input_text[:constants.FORMAT_DETECTION_CHARS]
+    first_line = sample.split("\n", 1)[0]
+    for delimiter in CSV_DELIMITERS:
+        if delimiter not in first_line:
+            continue
+        try:
+            rows = csv.reader(io.StringIO(sample), delimiter=delimiter)
+            records = [row for _i, row in zip(range(constants.FORMAT_DETECTION_LINES), rows) if row]
+        except csv.Error:
+            continue
+        if len(records) < constants.FORMAT_DETECTION_LINES and len(sample) < len(input_text):
+            records = records[:-1] # The last record of the sample may be cut at the detection limit
+        widths = {len(row) for row in records}
+        # Prose ("Hello, world.") puts a space after the delimiter, CSV rarely does
+        fields = [field for row in records for field in row[1:]]
+        spaced = sum(1 for field in fields if field.startswith(" "))
+        if len(records) >= 2 and len(widths) == 1 and widths.pop() >= 2 and spaced * 2 <= len(fields):
+            return delimiter
+    return None
+
+def detect_format(input_text: str) -> str:
+    """
+    Guesses the input format from its beginning: json (a top-level array), jsonl,
+    csv, log or text (the fallback).
+    """
+    if input_text.lstrip().startswith("[") and _starts_json_array(input_text):
+        return "json"
+    lines = _sample_lines(input_text)
+    if not lines:
+        return "text"
+    if len(lines) >= 2 and all(_is_json_value(line) for line in lines[:-1]):
+        # The last sample line may be cut at the detection limit
+        return "jsonl"
+    if len(lines) >= 3 and csv_delimiter(input_text):
+        return "csv"
+    # Continuation lines (stack traces...) do not start with a timestamp, only entries do
+    if LOG_ENTRY_RE.match(lines[0]) and sum(1 for line in lines if LOG_ENTRY_RE.match(line)) >= 2:
+        return "log"
+    return "text"
+
+
+def _starts_json_array(input_text: str) -> bool:
+    """True if the text opens a JSON array: "[" followed by a valid first element and "," or "]" (not "[INFO] ..." or "[ ] task")."""
+    whitespace = re.compile(r"\s*")
+    pos = whitespace.match(input_text, input_text.find("[") + 1).end()
+    if input_text[pos:pos + 1] == "]":
+        return not input_text[pos + 1:].strip()
+    try:
+        _value, end = json.JSONDecoder().raw_decode(input_text, pos)
+    except ValueError:
+        return False
+    return input_text[whitespace.match(input_text, end).end():][:1] in (",", "]")
+
+def _split_json_array(input_text: str) -> List[str]:
+    """Splits a top-level JSON array into the raw text of its elements. Raises ValueError if it is not one."""
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"\s*")
+    pos = whitespace.match(input_text, 0).end()
+    if input_text[pos:pos + 1] != "[":
+        raise ValueError("not a JSON array")
+    pos = whitespace.match(input_text, pos + 1).end()
+    elements = []
+    if input_text[pos:pos + 1] == "]":
+        return elements
+    while True:
+        _value, end = decoder.raw_decode(input_text, pos)
+        elements.append(input_text[pos:end])
+        pos = whitespace.match(input_text, end).end()
+        if input_text[pos:pos + 1] == "]":
+            if input_text[pos + 1:].strip():
+                raise ValueError("extra data after the JSON array")
+            return elements
+        if input_text[pos:pos + 1] != ",":
+            raise ValueError(f"expected ',' or ']' at position {pos}")
+        pos = whitespace.match(input_text, pos + 1).end()
+
+def _split_csv(input_text: str) -> Tuple[str, List[str]]:
+    """Splits CSV into its header and the raw text of every record (quoted fields may span lines)."""
+    lines = input_text.splitlines(keepends=True)
+    consumed: List[str] = []
+    def line_iter() -> Iterator[str]:
+        for line in lines:
+            consumed.append(line)
+            yield line
+    reader = csv.reader(line_iter(), delimiter=csv_delimiter(input_text) or ",")
+    records = []
+    for _row in reader:
+        records.append("".join(consumed).rstrip("\r\n"))
+        consumed.clear()
+    if consumed: # Unterminated quote at the end: keep the text as the last record
+        records.append("".join(consumed).rstrip("\r\n"))
+    return (records[0], records[1:]) if records else ("", [])
+
+def _split_log(input_text: str) -> List[str]:
+    """Splits a log into entries: a line matching LOG_ENTRY_RE plus its continuation lines (stack traces...)."""
+    entries: List[List[str]] = []
+    for line in input_text.splitlines():
+        if entries and not LOG_ENTRY_RE.match(line):
+            entries[-1].append(line)
+        else:
+            entries.append([line])
+    return ["\n".join(entry) for entry in entries]
+
+def split_records(input_text: str, input_format: str) -> Tuple[str, str, List[str], Callable[[str, List[str]], str]]:
+    """
+    Splits the input into records that must not be cut: lines, log entries, CSV
+    records, JSON array elements or rows of the compact table form.
+
+    Returns:
+        A tuple (input_format, header, records, join): the format actually used
+        (text if the input is not a valid JSON array), and join(header, records)
+        rebuilds a valid document of that format from a subset of the records.
+    """
+    if input_format == "json":
+        try:
+            return "json", "", _split_json_array(input_text), lambda header, records: "[\n" + ",\n".join(records) + "\n]"
+        except ValueError as e:
+            log.warning(f"Input is not a valid JSON array ({e}), splitting it as plain text.")
+            input_format = "text"
+    if input_format == "table":
+        # Compacted array of objects (see compaction.compact_input): a header line, then one line per object
+        header, _newline, rest = input_text.partition("\n")
+        return "table", header, rest.splitlines(), lambda header, records: "\n".join([header] + records)
+    if input_format == "csv":
+        header, records = _split_csv(input_text)
+        # Every chunk repeats the header so it parses on its own
+        return "csv", header, records, lambda header, records: "\n".join([header] + records)
+    records = _split_log(input_text) if input_format == "log" else input_text.splitlines()
+    return input_format, "", records, lambda header, records: "\n".join(records)
+
+def pack_records(
+    records: List[str],
+    max_chars: int,
+    header: str = "",
+    join: Callable[[str, List[str]], str] = lambda header, records: "\n".join(records),
+    split_long: bool = True,
+) -> List[str]:
+    """
+    Packs consecutive records into chunks of at most max_chars characters (header included).
+    A record longer than a chunk is split by character count if split_long is set,
+    otherwise it is kept whole in a chunk of its own.
+    """
+    budget = max(1, max_chars - len(header) - (1 if header else 0))
+    chunks: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    for record in records:
+        if len(record) > budget:
+            if current:
+                chunks.append(join(header, current))
+                current, current_len = [], 0
+            if split_long:
+                log.warning(f"A single record ({len(record)} chars) exceeds max_chars ({max_chars}). Splitting it.")
+                chunks.extend(join(header, [record[start:start + budget]]) for start in range(0, len(record), budget))
+            else:
+                log.warning(f"A single record ({len(record)} chars) exceeds max_chars ({max_chars}). Sending it whole to keep it valid.")
+                chunks.append(join(header, [record]))
+            continue
+        # The separator between records is counted for every record after the first
+        if current and current_len + 1 + len(record) > budget:
+            chunks.append(join(header, current))
+            current, current_len = [], 0
+        current_len += len(record) + (1 if current else 0)
+        current.append(record)
+    if current:
+        chunks.append(join(header, current))
+    return chunks
+
+
+def chunk_stdin(input_text: str, config: 'TulpConfig', input_format: str | None = None) -> Tuple[List[str], str]:
     """
     Splits the input text into chunks based on max_chars configuration.
-    Tries to split by lines first, then by character count if a line is too long.
+    Chunks are cut only at record boundaries of the input format (detected unless
+    given): lines for text and JSONL, entries for logs, records for CSV (the header
+    is repeated in every chunk) and elements for JSON arrays, so every chunk of a
+    structured input is a valid document on its own. Only plain text and log
+    records longer than max_chars are split by character count.
+
+    Returns:
+        A tuple (chunks, input_format): the format actually used is text when a
+        json input is not a valid JSON array.
     """
     if not input_text:
-        return []
+        return [], input_format or "text"
 
     max_chars = config.max_chars
-    stdin_chunks = []
+    if input_format is None:
+        input_format = getattr(config, "input_format", "auto")
+    if input_format == "auto":
+        input_format = detect_format(input_text)
 
     if len(input_text) <= max_chars:
         log.debug(f"Input text fits within max_chars ({len(input_text)} <= {max_chars}). No chunking needed.")
-        return [input_text]
+        if input_format == "json":
+            input_format = split_records(input_text, input_format)[0] # Validates the array
+        return [input_text], input_format
 
     # Log warning about large input
     warnMsg = f"""
 Input is large ({len(input_text)} characters). Tulp will divide the input into
-chunks of fewer than {max_chars} characters and attempt to process them sequentially.
+chunks of fewer than {max_chars} characters and process them independently.
 
 Please be aware that the quality of the final result may vary. Tasks that are
 line-based and don't require context across chunks may work well, while tasks
-requiring an overall view of the document (like summarization) may perform poorly.
+requiring an overall view of the document (like summarization) may perform poorly
+unless you use --reduce, which combines the partial results of every chunk into
+a single answer.
 
 You can adjust the chunk size via the --max-chars argument or the
 TULP_MAX_CHARS environment variable. Using a model with a larger context
@@ -54,43 +273,11 @@ context-dependent tasks.
 """
     log.warning(warnMsg)
 
-    # Attempt to split by lines first
-    compressed_lines = [""]
-    input_lines = input_text.splitlines() # Use splitlines() to handle different newline types
-
-    for line in input_lines:
-        current_chunk_index = len(compressed_lines) - 1
-        current_chunk_len = len(compressed_lines[current_chunk_index])
-
-        # Check if adding the new line (plus a newline char) exceeds max_chars
-        # Need to account for the newline character only if the chunk isn't empty
-        line_len_with_newline = len(line) + (1 if current_chunk_len > 0 else 0)
-
-        if current_chunk_len == 0 or (current_chunk_len + line_len_with_newline <= max_chars):
-             # Add line to current chunk (add newline if chunk not empty)
-            separator = "\n" if current_chunk_len > 0 else ""
-            compressed_lines[current_chunk_index] += separator + line
-        else:
-            # Current chunk is full, start a new one or split the line
-            if len(line) <= max_chars:
-                # Line fits in a new chunk by itself
-                compressed_lines.append(line)
-            else:
-                # Line itself is too long, split it by character count
-                log.warning(f"A single line ({len(line)} chars) exceeds max_chars ({max_chars}). Splitting the line.")
-                start_index = 0
-                while start_index < len(line):
-                    end_index = start_index + max_chars
-                    line_chunk = line[start_index:end_index]
-                    compressed_lines.append(line_chunk)
-                    start_index = end_index
-
-
-    # Final list of chunks - filter out potential empty strings if any were created
-    stdin_chunks = [chunk for chunk in compressed_lines if chunk]
+    input_format, header, records, join = split_records(input_text, input_format)
+    stdin_chunks = pack_records(records, max_chars, header, join, split_long=input_format in ("text", "log"))
 
-    log.info(f"Input text split into {len(stdin_chunks)} chunks.")
+    log.info(f"Input text ({input_format}) split into {len(stdin_chunks)} chunks.")
     for i, chunk in enumerate(stdin_chunks):
         log.debug(f"Chunk {i+1} size: {len(chunk)} chars")
 
-    return stdin_chunks
+    return stdin_chunks, input_format
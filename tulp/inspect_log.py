@@ -0,0 +1,156 @@
+# inspect_log.py
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional
+from .logger import log
+
+# Optional zstd compression
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+INSPECT_LOG_BASENAME = "inspect.jsonl"
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+def message_id(message: Dict[str, Any]) -> str:
+    """Stable id of a message, derived from its role and content."""
+    payload = f"{message.get('role', '')}\x00{message.get('content', '')}".encode("utf-8", errors="replace")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+def request_hash(request_messages: List[Dict[str, Any]]) -> str:
+    """Stable hash of a whole request, derived from the ids of its messages."""
+    return hashlib.sha1("".join(message_id(m) for m in request_messages).encode("ascii")).hexdigest()[:16]
+
+
+def _open_log(path: str, mode: str):
+    """Opens an inspect log for text appending ('a') or reading ('r'), based on its suffix."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard library not found. Install it with: pip install zstandard")
+        raw = open(path, mode + "b")
+        if mode == "a":
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class InspectLog:
+    """
+    Append-only inspect log: one JSON line per record in a single file.
+
+    Each distinct message is written once ({"type": "message", "id", "role", "content"});
+    exchanges reference the request messages by id and hold the response, so
+    continuations and retries that resend the same prompt cost almost nothing.
+    Serialization, hashing and file I/O run in a background writer thread.
+    """
+
+    def __init__(self, folder_path: str, compression: str = "none"):
+        if compression == "zstd" and not ZSTD_AVAILABLE:
+            log.warning("zstandard library not found, compressing the inspect log with gzip instead. Install it with: pip install zstandard")
+            compression = "gzip"
+        self.path = os.path.join(folder_path, INSPECT_LOG_BASENAME + COMPRESSION_SUFFIXES.get(compression, ""))
+        self.counter = 0
+        self._seen_ids: set = set()
+        self._file = _open_log(self.path, "a")
+        self._queue: "queue.Queue[tuple | None]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="tulp-inspect-writer", daemon=True)
+        self._writer.start()
+
+    def save(self, request_messages: List[Dict[str, Any]], response: Optional[Dict[str, Any]] = None, suffix: str = "", latency: float | None = None):
+        """Queues one request/response exchange. Returns immediately."""
+        self.counter += 1
+        # Copy the list (not the messages): callers keep appending to their history
+        self._queue.put((list(request_messages), response, suffix, time.time(), latency))
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_exchange(*item)
+            except Exception as e:
+                log.error(f"Failed to write inspection data to {self.path}: {e}")
+
+    def _write_message(self, message: Dict[str, Any]) -> str:
+        msg_id = message_id(message)
+        if msg_id not in self._seen_ids:
+            self._seen_ids.add(msg_id)
+            record = {"type": "message", "id": msg_id, "role": message.get("role"), "content": message.get("content", "")}
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return msg_id
+
+    def _write_exchange(self, request_messages, response, tag, timestamp, latency):
+        record = {
+            "type": "exchange",
+            "tag": tag,
+            "ts": round(timestamp, 3),
+            "latency": round(latency, 4) if latency is not None else None,
+            "request": [self._write_message(m) for m in request_messages],
+            "request_hash": request_hash(request_messages),
+        }
+        if isinstance(response, dict):
+            record["response"] = self._write_message(response)
+            record["finish_reason"] = response.get("finish_reason")
+            record["usage"] = response.get("usage")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        """Writes everything still queued and closes the file."""
+        if self._file is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        self._file = None
+        log.debug(f"Inspection log closed: {self.path} ({self.counter} exchanges)")
+
+
+def find_inspect_logs(path: str) -> List[str]:
+    """Returns the inspect log files at path (a log file, or a directory searched recursively)."""
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, _dirs, files in os.walk(path):
+        for name in sorted(files):
+            if name.startswith(INSPECT_LOG_BASENAME):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+def read_exchanges(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the exchanges of an inspect log with message ids resolved:
+    {"tag", "ts", "latency", "request_hash", "request": [messages], "response": message | None, ...}
+    """
+    messages: Dict[str, Dict[str, Any]] = {}
+    with _open_log(path, "r") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run that was killed can leave a partial last line
+                log.warning(f"Skipping malformed line {line_num} in {path}")
+                continue
+            if record.get("type") == "message":
+                messages[record["id"]] = {"role": record["role"], "content": record["content"]}
+            elif record.get("type") == "exchange":
+                exchange = dict(record)
+                exchange["request"] = [messages[i] for i in record["request"] if i in messages]
+                response_id = record.get("response")
+                exchange["response"] = dict(messages[response_id]) if response_id in messages else None
+                yield exchange
@@ -4,6 +4,7 @@ from typing import List, Dict, Any, Tuple, Optional # Added Tuple, Optional
 from ..logger import log
 from ..config import TulpConfig # Use TulpConfig for type hint
 from .. import constants # Import constants
+from ..capabilities import get_capabilities, reply_token_limit
 
 # Conditional import
 try:
@@ -14,12 +15,22 @@ except ImportError:
     ANTHROPIC_AVAILABLE = False
     # Warning logged when getModels or getArguments is called, or during Client init
 
+# Capabilities of the Claude models, first match wins (https://docs.anthropic.com/en/docs/about-claude/models).
+# Output caps are those of non-streaming requests: the SDK refuses requests that may run over 10 minutes.
+CLAUDE_FEATURES = {"streaming": True, "prefill": True, "json_mode": False}
+CAPABILITIES = [
+    {**CLAUDE_FEATURES, "idRe": r"claude-(opus-4|4-opus).*", "context_window": 200000, "max_output_tokens": 8192},
+    {**CLAUDE_FEATURES, "idRe": r"claude-(3-7-sonnet|sonnet-4|4-sonnet|haiku-4).*", "context_window": 200000, "max_output_tokens": 16384},
+    {**CLAUDE_FEATURES, "idRe": r"claude-3-5-(sonnet|haiku).*", "context_window": 200000, "max_output_tokens": 8192},
+    {**CLAUDE_FEATURES, "idRe": r"claude-.*", "context_window": 200000, "max_output_tokens": 4096},
+]
+
 def getModels() -> List[Dict[str, str]]:
    """Returns model definitions for Anthropic."""
    if not ANTHROPIC_AVAILABLE:
         return []
    # Use raw string r"" for regex patterns
-   return [ { "idRe": r"claude-.*", "description": "Any Anthropic Claude model (https://docs.anthropic.com/claude/docs/models-overview), requires ANTHROPIC_API_KEY"} ]
+   return [ { "idRe": r"claude-.*", "description": "Any Anthropic Claude model (https://docs.anthropic.com/claude/docs/models-overview), requires ANTHROPIC_API_KEY", "capabilities": CAPABILITIES} ]
 
 def getArguments() -> List[Dict[str, Any]]:
    """Returns argument definitions specific to Anthropic."""
@@ -30,9 +41,14 @@ def getArguments() -> List[Dict[str, Any]]:
 
 class Client:
     """Client for interacting with Anthropic's Claude models."""
-    def __init__(self, config: TulpConfig):
-        """Initializes the Anthropic client."""
+
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        """Initializes the Anthropic client for model_name (config.model by default)."""
         self.config = config
+        self.model_name = model_name or config.model
+        self.capabilities = get_capabilities(self.model_name)
+        # A trailing assistant message is continued by the model (used for cheap continuations)
+        self.supports_prefill = self.capabilities["prefill"]
         if not ANTHROPIC_AVAILABLE:
              raise ImportError("Anthropic library is not installed. Cannot use Anthropic client.")
 
@@ -133,16 +149,16 @@ class Client:
              return {"role": "error", "content": "Message list for Anthropic is empty or invalid.", "finish_reason": "error"}
 
         try:
-            log.debug(f"Sending request to Anthropic model: {self.config.model}")
+            log.debug(f"Sending request to Anthropic model: {self.model_name}")
             # Ensure anthropic is imported before using it
             assert anthropic is not None
             api_response = self.client.messages.create(
-                model=self.config.model,
+                model=self.model_name,
                 messages=anthropic_messages,
                 system=system_prompt, # Pass system prompt here
-                max_tokens=4096 # Consider making this configurable via TULP_MAX_TOKENS_OUT or similar
+                max_tokens=reply_token_limit(self.capabilities, messages) or 4096
             )
-            log.debug(f"Anthropic raw response: {api_response}")
+            log.debug("Anthropic raw response: %s", api_response)
 
             # Extract necessary information safely
             response_role = getattr(api_response, 'role', 'assistant') # Default to assistant
@@ -168,10 +184,17 @@ class Client:
 
             log.debug(f"Anthropic mapped finish reason: {mapped_reason}")
 
+            # Normalized token usage (None when not reported)
+            usage = getattr(api_response, 'usage', None)
+
             return {
                 "role": response_role,
                 "content": response_content,
-                "finish_reason": mapped_reason # Return the mapped reason
+                "finish_reason": mapped_reason, # Return the mapped reason
+                "usage": {
+                    "input_tokens": getattr(usage, 'input_tokens', None),
+                    "output_tokens": getattr(usage, 'output_tokens', None),
+                }
             }
         # Use specific exceptions from the library if available
         except anthropic.APIStatusError as e:
@@ -182,13 +205,14 @@ class Client:
                 content = f"Anthropic Authentication Error ({e.status_code}). Check your API key."
             elif e.status_code == 404:
                  content = f"Anthropic API endpoint/model not found ({e.status_code}). Check model name."
-            return {"role": "error", "content": content, "finish_reason": "error"}
+            finish_reason = "rate_limit" if e.status_code == 429 else "server_error" if e.status_code >= 500 else "error"
+            return {"role": "error", "content": content, "finish_reason": finish_reason}
         except anthropic.APITimeoutError as e:
             log.error(f"Anthropic API timeout error: {e}")
             return {"role": "error", "content": "Anthropic API request timed out.", "finish_reason": "timeout"}
         except anthropic.APIConnectionError as e:
             log.error(f"Anthropic API connection error: {e}")
-            return {"role": "error", "content": "Anthropic Connection Error", "finish_reason": "error"}
+            return {"role": "error", "content": "Anthropic Connection Error", "finish_reason": "connection_error"}
         except Exception as e:
             log.error(f"Unexpected error during Anthropic generation: {e}")
             import traceback
@@ -1,14 +1,20 @@
 # tulp/llms/LlmGemini.py
 import sys
-from typing import List, Dict, Any, Optional
+import datetime
+import hashlib
+import threading
+import time
+from typing import List, Dict, Any, Optional, Callable, Hashable, Tuple
 from ..logger import log
 from ..config import TulpConfig
 from .. import constants
+from ..capabilities import get_capabilities, reply_token_limit
 
 # Conditional import for google-generativeai
 try:
     import google.generativeai as genai
     from google.generativeai.types import HarmCategory, HarmBlockThreshold, GenerationConfig
+    from google.generativeai import caching # Context caching (google-generativeai >= 0.7)
     # Import specific exceptions if available/needed
     # from google.api_core import exceptions as google_exceptions
     GEMINI_AVAILABLE = True
@@ -17,6 +23,7 @@ except ImportError:
     HarmCategory = None
     HarmBlockThreshold = None
     GenerationConfig = None
+    caching = None
     GEMINI_AVAILABLE = False
     # Warning logged during Client init or getModels/getArguments
 
@@ -32,6 +39,100 @@ DEFAULT_TEMPERATURE = 1.0 # Gemini's default is often 0.9 or 1.0
 MAX_TEMPERATURE = 2.0 # Check Gemini docs for actual max, might be 1.0 for some models
 TEMPERATURE_INCREMENT = 0.33
 REQUEST_TIMEOUT = 900 # seconds
+# Context caching: Gemini only caches prompts of at least 32,768 tokens (about 4 chars per token)
+CONTEXT_CACHE_MIN_CHARS = 32768 * 4
+CONTEXT_CACHE_TTL = 600 # seconds a cached prefix is kept by Gemini
+CONTEXT_CACHE_MIN_USES = 2 # A prefix is cached the second time it is sent
+
+
+def _digest(*parts: Any) -> str:
+    """Stable hash of prompt parts (system instruction, contents), used in cache keys."""
+    return hashlib.sha256(repr(parts).encode("utf-8", errors="replace")).hexdigest()
+
+
+class ModelInstances:
+    """
+    Thread-safe memo of GenerativeModel instances, keyed by (model name, system
+    instruction hash, generation settings): every prompt factory sends a system
+    message, so without it each call would build a new model instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._instances: Dict[Hashable, Any] = {}
+        self.created = 0
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = self._instances[key] = factory()
+                self.created += 1
+            return instance
+
+
+class ContextCaches:
+    """
+    Gemini context caches of repeated prompt prefixes: the system instruction plus the
+    messages before the first model reply (the document resent with every
+    continuation), while the continuation anchor and follow-up, which change every
+    time, are sent after it. A prefix of at least min_chars is cached the
+    CONTEXT_CACHE_MIN_USES-th time it is sent (the first request of a chunk counts);
+    later requests only send the rest.
+    Caches are recreated when their TTL is about to expire, and a prefix whose
+    cache cannot be created (model or library without support) is not tried again.
+    """
+
+    def __init__(self, create: Callable[[str | None, List[Dict[str, Any]], int], Any], min_chars: int = CONTEXT_CACHE_MIN_CHARS, ttl: int = CONTEXT_CACHE_TTL):
+        self.create = create
+        self.min_chars = min_chars
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._uses: Dict[str, int] = {}
+        self._caches: Dict[str, Tuple[Any, float]] = {}
+        self._failed: set = set()
+
+    def lookup(self, system_instruction: str | None, contents: List[Dict[str, Any]]) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        Returns (cached_content, remaining contents): the cache of the prefix and the
+        contents to send after it, or (None, contents) if the prefix is not cached.
+        """
+        first_reply = next((i for i, content in enumerate(contents) if content.get("role") == "model"), len(contents))
+        prefix = contents[:first_reply]
+        size = len(system_instruction or "") + sum(len(part) for content in prefix for part in content.get("parts", []))
+        if size < self.min_chars:
+            return None, contents
+        key = _digest(system_instruction, prefix)
+        with self._lock:
+            if key in self._failed:
+                return None, contents
+            self._uses[key] = self._uses.get(key, 0) + 1
+            if first_reply == len(contents):
+                return None, contents # Nothing would be left to send after a cache
+            cached = self._caches.get(key)
+            # Leave a margin so the cache does not expire while the request is in flight
+            if cached and time.monotonic() - cached[1] < self.ttl * 0.9:
+                return cached[0], contents[len(prefix):]
+            if self._uses[key] < CONTEXT_CACHE_MIN_USES:
+                return None, contents
+            try:
+                cache = self.create(system_instruction, prefix, self.ttl)
+            except Exception as e:
+                log.info(f"Gemini context caching unavailable for this prompt ({e}), sending it in full.")
+                self._failed.add(key)
+                return None, contents
+            self._caches[key] = (cache, time.monotonic())
+            log.debug(f"Created a Gemini context cache for a {size} chars prompt prefix.")
+            return cache, contents[len(prefix):]
+
+# Capabilities of the Gemini models, first match wins (https://ai.google.dev/gemini-api/docs/models).
+GEMINI_FEATURES = {"streaming": True, "prefill": False, "json_mode": True}
+CAPABILITIES = [
+    {**GEMINI_FEATURES, "idRe": r"gemini-2\.5-.*", "context_window": 1048576, "max_output_tokens": 65536},
+    {**GEMINI_FEATURES, "idRe": r"gemini-1\.5-pro.*", "context_window": 2097152, "max_output_tokens": 8192},
+    {**GEMINI_FEATURES, "idRe": r"gemini-(1\.5|2\.0)-flash.*", "context_window": 1048576, "max_output_tokens": 8192},
+    {**GEMINI_FEATURES, "idRe": r"gemini.*", "max_output_tokens": 8192},
+]
 
 def getModels() -> List[Dict[str, str]]:
    """Returns model definitions for Google Gemini."""
@@ -39,7 +140,7 @@ def getModels() -> List[Dict[str, str]]:
         log.warning("Google GenerativeAI library not found. Gemini models unavailable.")
         return []
    # Use raw string for regex
-   return [ { "idRe": r"gemini.*", "description": "Any Google Gemini model (https://ai.google.dev/gemini-api/docs/models/gemini), requires GEMINI_API_KEY"} ]
+   return [ { "idRe": r"gemini.*", "description": "Any Google Gemini model (https://ai.google.dev/gemini-api/docs/models/gemini), requires GEMINI_API_KEY", "capabilities": CAPABILITIES} ]
 
 def getArguments() -> List[Dict[str, Any]]:
    """Returns argument definitions specific to Gemini."""
@@ -50,9 +151,12 @@ def getArguments() -> List[Dict[str, Any]]:
 
 class Client:
     """Client for interacting with Google's Gemini models."""
-    def __init__(self, config: TulpConfig):
-        """Initializes the Gemini client."""
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        """Initializes the Gemini client for model_name (config.model by default)."""
         self.config = config
+        self.model_name = model_name or config.model
+        self.capabilities = get_capabilities(self.model_name)
+        self.supports_prefill = self.capabilities["prefill"]
         if not GEMINI_AVAILABLE:
             raise ImportError("Google GenerativeAI library is not installed. Cannot use Gemini client.")
 
@@ -66,23 +170,52 @@ class Client:
             # Ensure genai is imported and configured
             assert genai is not None
             genai.configure(api_key=api_key)
-            # Initialize model instance without system instruction initially
-            # It will be re-initialized in generate() if a system prompt is present
-            self.model_instance = genai.GenerativeModel(self.config.model)
+            # Model instances are built on first use for every (system instruction, generation settings)
+            self._model_instances = ModelInstances()
+            self._context_caches = ContextCaches(self._create_context_cache)
             log.info("Gemini client initialized and configured.")
         except Exception as e:
             # Catch potential configuration errors or model validation issues
-            log.error(f"Failed to initialize Gemini client or configure API key for model '{self.config.model}': {e}")
+            log.error(f"Failed to initialize Gemini client or configure API key for model '{self.model_name}': {e}")
             # Provide more specific feedback if possible
             if "API key not valid" in str(e):
                  log.error("Please check if your Gemini API key is correct.")
             elif "permission denied" in str(e).lower():
                   log.error("Permission denied. Check API key permissions or project setup.")
             elif "model" in str(e).lower() and "not found" in str(e).lower():
-                  log.error(f"Model '{self.config.model}' might not be available or name is incorrect.")
+                  log.error(f"Model '{self.model_name}' might not be available or name is incorrect.")
 
             raise ValueError(f"Gemini client initialization failed: {e}") from e
 
+    def _model_instance(self, system_instruction: str | None, cached_content: Any = None) -> Any:
+        """The (memoized) model instance for a system instruction, or for a context cache."""
+        assert genai is not None and GenerationConfig is not None
+        if cached_content is not None:
+            return self._model_instances.get(
+                ("cached", cached_content.name),
+                lambda: genai.GenerativeModel.from_cached_content(cached_content=cached_content),
+            )
+        generation_settings = (("candidate_count", 1), ("temperature", DEFAULT_TEMPERATURE))
+        return self._model_instances.get(
+            (self.model_name, _digest(system_instruction) if system_instruction else None, generation_settings),
+            lambda: genai.GenerativeModel(
+                self.model_name,
+                system_instruction=system_instruction,
+                generation_config=GenerationConfig(**dict(generation_settings)),
+                safety_settings=SAFETY_SETTINGS_BLOCK_NONE,
+            ),
+        )
+
+    def _create_context_cache(self, system_instruction: str | None, contents: List[Dict[str, Any]], ttl: int) -> Any:
+        """Creates a Gemini context cache holding the system instruction and contents."""
+        assert caching is not None
+        return caching.CachedContent.create(
+            model=self.model_name,
+            system_instruction=system_instruction,
+            contents=contents,
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+
     def _convert_messages(self, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
         """
         Converts OpenAI message format to Gemini's Content format.
@@ -154,15 +287,6 @@ class Client:
             system_instruction = messages[0]['content']
             openai_msgs_to_process = messages[1:]
             log.debug("Using first message content as Gemini system instruction.")
-            # Re-initialize model with system instruction
-            try:
-                # Ensure necessary imports are available
-                assert genai is not None
-                self.model_instance = genai.GenerativeModel(self.config.model, system_instruction=system_instruction)
-            except Exception as e:
-                log.error(f"Failed to re-initialize Gemini model with system instruction: {e}")
-                # Fallback to model without system instruction? Or fail? Let's fail.
-                return {"role": "error", "content": f"Failed to set system instruction: {e}", "finish_reason": "error"}
 
         gemini_history = self._convert_messages(openai_msgs_to_process)
 
@@ -173,22 +297,27 @@ class Client:
              log.error("Cannot send empty message history to Gemini.")
              return {"role": "error", "content": "Empty message history.", "finish_reason": "error"}
 
+        # Repeated large prefixes are sent once, as a context cache
+        cached_content, gemini_history = self._context_caches.lookup(system_instruction, gemini_history)
+        try:
+            model_instance = self._model_instance(system_instruction, cached_content)
+        except Exception as e:
+            log.error(f"Failed to initialize Gemini model with system instruction: {e}")
+            return {"role": "error", "content": f"Failed to set system instruction: {e}", "finish_reason": "error"}
+
         current_temperature = DEFAULT_TEMPERATURE
         # Ensure GenerationConfig is available
         assert GenerationConfig is not None
         generation_config = GenerationConfig(
             candidate_count=1,
-            temperature=current_temperature
-            # Consider adding max_output_tokens from config if available
-            # max_output_tokens=self.config.max_output_tokens or 8192 # Example
+            temperature=current_temperature,
+            max_output_tokens=reply_token_limit(self.capabilities, messages),
         )
 
         while True: # Loop for retrying on recitation
-            log.debug(f"Sending request to Gemini model {self.config.model} with temp {current_temperature:.2f}...")
+            log.debug(f"Sending request to Gemini model {self.model_name} with temp {current_temperature:.2f}...")
             try:
-                # Ensure model_instance is valid
-                assert self.model_instance is not None
-                response = self.model_instance.generate_content(
+                response = model_instance.generate_content(
                     gemini_history, # Pass the converted history
                     safety_settings=SAFETY_SETTINGS_BLOCK_NONE,
                     request_options={"timeout": REQUEST_TIMEOUT},
@@ -261,10 +390,17 @@ class Client:
                 elif finish_reason == "MAX_TOKENS": mapped_reason = "length"
                 # Other reasons: SAFETY, RECITATION, OTHER
 
+                # Normalized token usage (None when not reported)
+                usage = getattr(response, 'usage_metadata', None)
+
                 return {
                     "role": response_role,
                     "content": response_text,
-                    "finish_reason": mapped_reason # Return mapped reason
+                    "finish_reason": mapped_reason, # Return mapped reason
+                    "usage": {
+                        "input_tokens": getattr(usage, 'prompt_token_count', None),
+                        "output_tokens": getattr(usage, 'candidates_token_count', None),
+                    }
                 }
 
             # Handle potential API errors during the request
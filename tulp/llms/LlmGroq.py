@@ -4,6 +4,7 @@ from typing import List, Dict, Any
 from ..logger import log
 from ..config import TulpConfig
 from .. import constants
+from ..capabilities import get_capabilities, reply_token_limit
 
 # Conditional import for groq
 try:
@@ -17,6 +18,15 @@ except ImportError:
     GROQ_AVAILABLE = False
     # Warning logged during Client init or getModels/getArguments
 
+# Capabilities of the Groq models, first match wins (https://console.groq.com/docs/models).
+GROQ_FEATURES = {"streaming": True, "prefill": False, "json_mode": True}
+CAPABILITIES = [
+    {**GROQ_FEATURES, "idRe": r"groq\.llama-3\.1-8b-instant", "context_window": 131072, "max_output_tokens": 131072},
+    {**GROQ_FEATURES, "idRe": r"groq\.llama-3\.3-70b-versatile", "context_window": 131072, "max_output_tokens": 32768},
+    {**GROQ_FEATURES, "idRe": r"groq\.(llama3-(8b|70b)-8192|gemma2-9b-it)", "context_window": 8192, "max_output_tokens": 8192},
+    {**GROQ_FEATURES, "idRe": r"groq\..*", "max_output_tokens": 4096}, # Unlisted models keep the former fixed limit
+]
+
 def getModels() -> List[Dict[str, str]]:
    """Returns model definitions for Groq."""
    if not GROQ_AVAILABLE:
@@ -24,7 +34,7 @@ def getModels() -> List[Dict[str, str]]:
         log.warning("Install it with: pip install groq")
         return []
    # Use raw string for regex
-   return [ { "idRe": r"groq\..*", "description": "Any Groq model id using the prefix 'groq.', requires GROQ_API_KEY. Check available models at https://console.groq.com/docs/models" }]
+   return [ { "idRe": r"groq\..*", "description": "Any Groq model id using the prefix 'groq.', requires GROQ_API_KEY. Check available models at https://console.groq.com/docs/models", "capabilities": CAPABILITIES }]
 
 def getArguments() -> List[Dict[str, Any]]:
    """Returns argument definitions specific to Groq."""
@@ -35,9 +45,12 @@ def getArguments() -> List[Dict[str, Any]]:
 
 class Client:
     """Client for interacting with Groq's language models."""
-    def __init__(self, config: TulpConfig):
-        """Initializes the Groq client."""
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        """Initializes the Groq client for model_name (config.model by default)."""
         self.config = config
+        self.model_name = model_name or config.model
+        self.capabilities = get_capabilities(self.model_name)
+        self.supports_prefill = self.capabilities["prefill"]
         if not GROQ_AVAILABLE:
             raise ImportError("Groq library is not installed. Cannot use Groq client.")
 
@@ -61,7 +74,7 @@ class Client:
 
     def _get_model_name(self) -> str:
         """Extracts the actual model name from the configured name (strips 'groq.')."""
-        model_config_name = self.config.model
+        model_config_name = self.model_name
         if model_config_name.startswith("groq."):
             model_name = model_config_name[5:]
             log.debug(f"Using Groq model: {model_name}")
@@ -95,12 +108,12 @@ class Client:
                 model=model_name,
                 # Optional parameters (adjust as needed, keep defaults minimal for now)
                 temperature=0.7, # A common default, adjust if needed
-                max_tokens=4096, # Groq models often have large contexts, set a reasonable limit
+                max_tokens=reply_token_limit(self.capabilities, messages),
                 # top_p=1,
                 # stop=None,
                 # stream=False, # Streaming not implemented in this core loop
             )
-            log.debug(f"Groq raw response object: {api_response}")
+            log.debug("Groq raw response object: %s", api_response)
 
             if not api_response.choices:
                  log.error("Groq response contained no choices.")
@@ -129,10 +142,17 @@ class Client:
             elif finish_reason == "length":
                  log.warning("Groq response truncated due to length limit (max_tokens).")
 
+            # Normalized token usage (None when not reported)
+            usage = getattr(api_response, 'usage', None)
+
             return {
                 "role": response_role,
                 "content": response_content,
-                "finish_reason": finish_reason # Return Groq's reason directly
+                "finish_reason": finish_reason, # Return Groq's reason directly
+                "usage": {
+                    "input_tokens": getattr(usage, 'prompt_tokens', None),
+                    "output_tokens": getattr(usage, 'completion_tokens', None),
+                }
             }
         # Catch specific Groq/OpenAI-like errors
         except APIStatusError as e:
@@ -141,13 +161,14 @@ class Client:
             if e.status_code == 401: content = f"Groq Authentication Error ({e.status_code}). Check API key."
             elif e.status_code == 404: content = f"Groq Model '{model_name}' not found ({e.status_code})."
             elif e.status_code == 429: content = f"Groq Rate Limit Exceeded ({e.status_code})."
-            return {"role": "error", "content": content, "finish_reason": "error"}
+            finish_reason = "rate_limit" if e.status_code == 429 else "server_error" if e.status_code >= 500 else "error"
+            return {"role": "error", "content": content, "finish_reason": finish_reason}
         except RateLimitError as e: # Catch separately if needed
             log.error(f"Groq API rate limit exceeded: {e}")
             return {"role": "error", "content": "Groq Rate Limit Exceeded", "finish_reason": "rate_limit"}
         except APIConnectionError as e:
             log.error(f"Groq API connection error: {e}")
-            return {"role": "error", "content": f"Groq Connection Error: {e}", "finish_reason": "error"}
+            return {"role": "error", "content": f"Groq Connection Error: {e}", "finish_reason": "connection_error"}
         except Exception as e:
             log.error(f"Unexpected error during Groq generation: {e}")
             import traceback
@@ -0,0 +1,227 @@
+# tulp/llms/LlmMock.py
+import math
+import random
+import re
+import threading
+import time
+from typing import List, Dict, Any, Callable
+from ..logger import log
+from ..config import TulpConfig
+from .. import constants
+from ..inspect_log import request_hash
+
+# Deterministic transformations applied to the stdin content, selected with mock:<name>
+TRANSFORMS: Dict[str, Callable[[str], str]] = {
+    "echo": lambda text: text,
+    "upper": lambda text: text.upper(),
+    "lower": lambda text: text.lower(),
+}
+# Python expression used for -x (program generation) requests, per transformation
+TRANSFORM_CODE = {
+    "echo": "sys.stdin.read()",
+    "upper": "sys.stdin.read().upper()",
+    "lower": "sys.stdin.read().lower()",
+}
+FILLER_WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo", "lima"]
+
+
+def getModels() -> List[Dict[str, str]]:
+   """Returns model definitions for the mock backend (always available)."""
+   return [ { "idRe": r"mock(:.*)?$", "description": f"Offline mock LLM for tests and benchmarks: 'mock' echoes stdin, 'mock:<{'|'.join(TRANSFORMS)}>' transforms it. See the --mock_* arguments.",
+              "capabilities": [{"idRe": r"mock(:.*)?", "prefill": True}]} ]
+
+def getArguments() -> List[Dict[str, Any]]:
+   """Returns argument definitions specific to the mock backend."""
+   return [
+       {"name": "mock_latency", "description": "Mock response latency in seconds: a number, uniform:MIN:MAX, normal:MEAN:STD, lognormal:MEDIAN:SIGMA or exp:MEAN (default: 0)", "default": "0"},
+       {"name": "mock_output_chars", "description": "Pad or cut the mock stdout block to exactly N chars, 0 keeps the transformed input (default: 0)", "default": "0"},
+       {"name": "mock_max_output_chars", "description": "Cut every mock reply longer than N chars with finish_reason 'length', like a model output limit, 0 disables it (default: 0)", "default": "0"},
+       {"name": "mock_truncate_rate", "description": "Probability that a mock reply is cut off with finish_reason 'length' (default: 0)", "default": "0"},
+       {"name": "mock_error_rate", "description": "Probability that a mock request is answered with an error block (default: 0)", "default": "0"},
+       {"name": "mock_rate_limit_rate", "description": "Probability that a mock call fails with a 429 rate limit error (default: 0)", "default": "0"},
+       {"name": "mock_seed", "description": "Random seed of the mock backend (default: 0)", "default": "0"},
+   ]
+
+
+def _parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Parses a latency distribution spec into a sampler returning seconds (never negative)."""
+    name, _, params = spec.partition(":")
+    try:
+        values = [float(v) for v in params.split(":")] if params else []
+        if not params:
+            fixed = float(name)
+            return lambda rng: max(0.0, fixed)
+        if name == "uniform" and len(values) == 2:
+            return lambda rng: max(0.0, rng.uniform(values[0], values[1]))
+        if name == "normal" and len(values) == 2:
+            return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+        if name == "lognormal" and len(values) == 2:
+            return lambda rng: values[0] * math.exp(rng.gauss(0.0, values[1]))
+        if name == "exp" and len(values) == 1 and values[0] > 0:
+            return lambda rng: rng.expovariate(1.0 / values[0])
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid mock_latency '{spec}'. Use a number, uniform:MIN:MAX, normal:MEAN:STD, lognormal:MEDIAN:SIGMA or exp:MEAN.")
+
+def _parse_rate(config: TulpConfig, name: str) -> float:
+    value = config.get_llm_argument(name)
+    try:
+        rate = float(value or 0)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}': expected a probability between 0 and 1.")
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError(f"Invalid {name} '{value}': expected a probability between 0 and 1.")
+    return rate
+
+def _between(text: str, start: str, end: str) -> str | None:
+    start_pos = text.find(start)
+    if start_pos < 0:
+        return None
+    end_pos = text.find(end, start_pos + len(start))
+    return text[start_pos + len(start):end_pos if end_pos >= 0 else len(text)].strip("\n")
+
+
+class Client:
+    """
+    Offline LLM client producing well-formed tulp replies from the prompt itself.
+
+    The full reply for a request is deterministic (seeded by the request hash), so
+    truncated replies can be continued: the continuation anchor is located in the
+    full reply and the rest is returned. Latency, truncation and 429 errors are
+    sampled per call from a seeded generator.
+    """
+    # Continuations are served from the anchor sent as a trailing assistant message
+    supports_prefill = True
+
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        self.config = config
+        self.model_name = model_name or config.model
+        transform_name = self.model_name.partition(":")[2] or "echo"
+        if transform_name not in TRANSFORMS:
+            raise ValueError(f"Unknown mock transformation '{transform_name}'. Use one of: {', '.join(TRANSFORMS)}.")
+        self.transform_name = transform_name
+        self.transform = TRANSFORMS[transform_name]
+
+        self.sample_latency = _parse_latency(str(config.get_llm_argument("mock_latency") or "0").strip())
+        try:
+            self.output_chars = max(0, int(config.get_llm_argument("mock_output_chars") or 0))
+        except ValueError:
+            raise ValueError(f"Invalid mock_output_chars '{config.get_llm_argument('mock_output_chars')}': expected an integer.")
+        try:
+            self.max_output_chars = max(0, int(config.get_llm_argument("mock_max_output_chars") or 0))
+        except ValueError:
+            raise ValueError(f"Invalid mock_max_output_chars '{config.get_llm_argument('mock_max_output_chars')}': expected an integer.")
+        self.truncate_rate = _parse_rate(config, "mock_truncate_rate")
+        self.error_rate = _parse_rate(config, "mock_error_rate")
+        self.rate_limit_rate = _parse_rate(config, "mock_rate_limit_rate")
+        self.seed = str(config.get_llm_argument("mock_seed") or "0")
+
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.seed)
+        self._emitted: Dict[str, int] = {} # request hash -> chars of the full reply already returned
+        log.debug(f"Mock client initialized (transform: {transform_name}, truncate: {self.truncate_rate}, error: {self.error_rate}, rate limit: {self.rate_limit_rate})")
+
+    def _stdout_content(self, system_prompt: str, user_prompt: str, request_rng: random.Random) -> str:
+        """Builds the stdout block content from the prompt."""
+        stdin_content = _between(user_prompt, constants.TAG_STDIN_PROMPT_DELIMITER_START, constants.TAG_STDIN_PROMPT_DELIMITER_END)
+
+        if "Python program generation" in system_prompt:
+            if stdin_content is not None:
+                content = f"import sys\nsys.stdout.write({TRANSFORM_CODE[self.transform_name]})\n"
+            else:
+                request = _between(user_prompt, "# Request:\n", "\n\n#") or ""
+                content = f"print({self.transform(request.strip())!r})\n"
+        elif stdin_content is not None:
+            # Reduce prompts separate the partial results with header lines
+            partials = re.split(r"\n*^## Partial result \d+/\d+\n", stdin_content, flags=re.MULTILINE)
+            content = self.transform("\n".join(p for p in partials if p))
+        else:
+            content = self.transform((_between(user_prompt, "# Request:\n", "\n\n#") or user_prompt).strip())
+
+        if self.output_chars:
+            # Pad with non-periodic filler so continuation overlap detection behaves like with real text
+            filler = []
+            filler_len = len(content)
+            while filler_len < self.output_chars:
+                word = request_rng.choice(FILLER_WORDS)
+                filler.append(word)
+                filler_len += len(word) + 1
+            content = (content + "\n" + " ".join(filler))[:self.output_chars] if filler else content[:self.output_chars]
+        return content
+
+    def _full_reply(self, base_messages: List[Dict[str, Any]], key: str) -> str:
+        """The complete, deterministic reply for the request."""
+        request_rng = random.Random(f"{self.seed}:{key}")
+        system_prompt = next((m.get("content", "") for m in base_messages if m.get("role") == "system"), "")
+        user_prompt = next((m.get("content", "") for m in reversed(base_messages) if m.get("role") == "user"), "")
+
+        parts = [constants.TAG_REPLY_START]
+        if request_rng.random() < self.error_rate:
+            parts += [constants.TAG_ERROR_START, "Mock error: injected by mock_error_rate.", constants.TAG_FILE_END]
+        else:
+            parts += [constants.TAG_STDOUT_START, self._stdout_content(system_prompt, user_prompt, request_rng), constants.TAG_FILE_END]
+            if constants.TAG_CONTEXT_START in system_prompt:
+                parts += [constants.TAG_CONTEXT_START, f"Mock context for request {key}.", constants.TAG_FILE_END]
+            parts += [constants.TAG_STDERR_START, f"Mock reply (transform: {self.transform_name}).", constants.TAG_FILE_END]
+        parts.append(constants.TAG_REPLY_END)
+        return "\n".join(parts)
+
+    def _resume_offset(self, full_reply: str, key: str, anchor: str) -> int | None:
+        """Finds where the continuation anchor ends in the full reply."""
+        # Non-prefill continuations prefix the anchor with a note about the omitted part
+        if anchor.startswith("[... ") and "omitted ...]\n" in anchor:
+            anchor = anchor.split("omitted ...]\n", 1)[1]
+        emitted = self._emitted.get(key)
+        if emitted is not None:
+            if full_reply[:emitted].endswith(anchor):
+                return emitted
+            stripped = full_reply[:emitted].rstrip()
+            if stripped.endswith(anchor):
+                return len(stripped)
+        position = full_reply.rfind(anchor)
+        return position + len(anchor) if position >= 0 and anchor else None
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Generates a mock reply (or a continuation of one)."""
+        first_assistant = next((i for i, m in enumerate(messages) if m.get("role") == "assistant"), len(messages))
+        base_messages = messages[:first_assistant]
+        key = request_hash(base_messages)
+        full_reply = self._full_reply(base_messages, key)
+
+        with self._lock:
+            latency = self.sample_latency(self._rng)
+            rate_limited = self._rng.random() < self.rate_limit_rate
+            truncated = self._rng.random() < self.truncate_rate
+            cut_fraction = self._rng.uniform(0.3, 0.8)
+
+        if rate_limited:
+            log.error("Mock rate limit exceeded (injected 429).")
+            return {"role": "error", "content": "Mock Rate Limit Exceeded (429)", "finish_reason": "rate_limit"}
+        if latency > 0:
+            time.sleep(latency)
+
+        with self._lock:
+            start = 0
+            if first_assistant < len(messages):
+                start = self._resume_offset(full_reply, key, messages[first_assistant].get("content", ""))
+                if start is None:
+                    log.warning("Mock continuation anchor not found in the reply, restarting it.")
+                    start = 0
+            remaining = full_reply[start:]
+            if truncated and len(remaining) > 1:
+                content, finish_reason = remaining[:max(1, int(len(remaining) * cut_fraction))], "length"
+            else:
+                content, finish_reason = remaining, "stop"
+            if self.max_output_chars and len(content) > self.max_output_chars:
+                content, finish_reason = content[:self.max_output_chars], "length"
+            self._emitted[key] = start + len(content)
+
+        return {
+            "role": "assistant",
+            "content": content,
+            "finish_reason": finish_reason,
+            "usage": {
+                "input_tokens": sum(len(str(m.get("content", ""))) for m in messages) // 4,
+                "output_tokens": len(content) // 4,
+            }
+        }
@@ -1,9 +1,12 @@
 # tulp/llms/LlmOllama.py
 import sys
-from typing import List, Dict, Any
+import math
+import threading
+from typing import List, Dict, Any, Tuple
 from ..logger import log
 from ..config import TulpConfig
 from .. import constants
+from ..capabilities import get_capabilities
 
 # Conditional import for ollama
 try:
@@ -16,6 +19,17 @@ except ImportError:
     OLLAMA_AVAILABLE = False
     # Warning logged during Client init or getModels/getArguments
 
+DEFAULT_KEEP_ALIVE = "30m" # How long the server keeps the model loaded after a request
+# Context sizing: computed once from --max-chars, so every request uses the same options.
+# Changing num_ctx reloads the model and drops the server's cached prompt prefix.
+CHARS_PER_TOKEN = 3 # Conservative estimate, so a full chunk fits the context
+PROMPT_OVERHEAD_TOKENS = 1024 # System prompt, instructions and reply tags
+MIN_NUM_CTX = 2048 # Ollama's own default
+MAX_NUM_CTX = 32768 # Upper bound unless ollama_num_ctx is set: the KV cache grows with num_ctx
+NUM_CTX_STEP = 1024
+# The context window comes from the model metadata (see _model_context_length), the output cap from num_ctx
+CAPABILITIES = [{"idRe": r"ollama\..*", "streaming": True, "prefill": True, "json_mode": True}]
+
 
 def getModels() -> List[Dict[str, str]]:
    """Returns model definitions for Ollama."""
@@ -24,7 +38,7 @@ def getModels() -> List[Dict[str, str]]:
         log.warning("Install it with: pip install ollama")
         return []
    # Use raw string for regex
-   return [ { "idRe": r"ollama\..*", "description": "Any Ollama model prefixed with 'ollama.', requires Ollama service running (check --ollama_host)."}]
+   return [ { "idRe": r"ollama\..*", "description": "Any Ollama model prefixed with 'ollama.', requires Ollama service running (check --ollama_host).", "capabilities": CAPABILITIES}]
 
 def getArguments() -> List[Dict[str, Any]]:
    """Returns argument definitions specific to Ollama."""
@@ -32,14 +46,51 @@ def getArguments() -> List[Dict[str, Any]]:
        return []
    # Provide the default value directly from constants or a sensible default
    default_host = "http://127.0.0.1:11434"
-   return [{"name": "ollama_host", "description": f"Ollama host URL (default: {default_host})", "default": default_host}]
+   return [
+       {"name": "ollama_host", "description": f"Ollama host URL (default: {default_host})", "default": default_host},
+       {"name": "ollama_keep_alive", "description": f"How long Ollama keeps the model loaded between requests, e.g. 30m, or -1 for ever (default: {DEFAULT_KEEP_ALIVE})", "default": DEFAULT_KEEP_ALIVE},
+       {"name": "ollama_num_ctx", "description": f"Context window (num_ctx) of every request, sized from --max-chars by default (at most {MAX_NUM_CTX} or the model's context length)", "default": None},
+   ]
+
+
+def parse_keep_alive(value: Any) -> str | int:
+    """
+    The keep_alive to send: a number (seconds, -1 for ever) as an int, since the server
+    parses strings as durations and rejects one without a unit; a duration (30m) as is.
+    """
+    text = str(value).strip()
+    return int(text) if text.lstrip("-").isdigit() else text
+
+
+def plan_context(max_chars: int, model_context: int | None = None, num_ctx: int | None = None) -> Tuple[int, int]:
+    """
+    Sizes the context window for chunks of up to max_chars characters: room for the
+    prompt overhead, the chunk and a reply as long as the chunk (filters rewrite their input).
+
+    Returns:
+        A tuple (num_ctx, num_predict). An explicit num_ctx is used as is; otherwise the
+        context is capped at the model's context length and MAX_NUM_CTX.
+    """
+    chunk_tokens = math.ceil(max_chars / CHARS_PER_TOKEN)
+    reply_tokens = chunk_tokens + PROMPT_OVERHEAD_TOKENS
+    if not num_ctx:
+        needed = PROMPT_OVERHEAD_TOKENS + chunk_tokens + reply_tokens
+        num_ctx = max(MIN_NUM_CTX, math.ceil(needed / NUM_CTX_STEP) * NUM_CTX_STEP)
+        num_ctx = min(num_ctx, MAX_NUM_CTX, model_context or MAX_NUM_CTX)
+    # Never let the reply crowd out the prompt
+    return num_ctx, min(reply_tokens, max(num_ctx // 2, num_ctx - PROMPT_OVERHEAD_TOKENS - chunk_tokens))
 
 
 class Client:
     """Client for interacting with local Ollama models."""
-    def __init__(self, config: TulpConfig):
-        """Initializes the Ollama client."""
+
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        """Initializes the Ollama client for model_name (config.model by default)."""
         self.config = config
+        self.model_name = model_name or config.model
+        self.capabilities = get_capabilities(self.model_name)
+        # The chat endpoint continues a trailing assistant message (used for cheap continuations)
+        self.supports_prefill = self.capabilities["prefill"]
         if not OLLAMA_AVAILABLE:
             raise ImportError("Ollama library is not installed. Cannot use Ollama client.")
 
@@ -57,6 +108,8 @@ class Client:
             log.debug(f"Testing connection to Ollama host: {ollama_host}")
             self.client.list() # This will raise RequestError if connection fails
             log.info(f"Ollama client initialized and connected to: {ollama_host}")
+            self.keep_alive = parse_keep_alive(config.get_llm_argument("ollama_keep_alive") or DEFAULT_KEEP_ALIVE)
+            self.num_ctx, self.num_predict = self._plan_options(config)
         except RequestError as e:
              log.error(f"Failed to connect to Ollama host '{ollama_host}'. Is the Ollama service running and accessible? Error: {e}")
              # Raise a standard ConnectionError for cli.py to catch
@@ -65,9 +118,49 @@ class Client:
             log.error(f"Failed to initialize Ollama client: {e}")
             raise ValueError(f"Ollama client initialization failed: {e}") from e
 
+        # Load the model while stdin is still being read, so the first chunk does not wait for it
+        threading.Thread(target=self._preload, name="tulp-ollama-preload", daemon=True).start()
+
+    def _model_context_length(self) -> int | None:
+        """The model's maximum context length, from its metadata (None if unknown)."""
+        try:
+            info = self.client.show(self._get_model_name())
+            model_info = info.get("modelinfo") or info.get("model_info") or {} # Response model or plain dict
+            for key, value in model_info.items():
+                if key.endswith(".context_length"):
+                    return int(value)
+        except Exception as e:
+            log.debug(f"Could not read the Ollama model's context length: {e}")
+        return None
+
+    def _plan_options(self, config: TulpConfig) -> Tuple[int, int]:
+        """Sizes num_ctx/num_predict once for the run (see plan_context)."""
+        explicit = config.get_llm_argument("ollama_num_ctx")
+        # A context window set with --capabilities-file wins over the model metadata
+        model_context = self.capabilities["context_window"] or self._model_context_length()
+        num_ctx, num_predict = plan_context(config.max_chars, model_context, int(explicit) if explicit else None)
+        chunk_chars = (num_ctx - PROMPT_OVERHEAD_TOKENS - num_predict) * CHARS_PER_TOKEN
+        if chunk_chars < config.max_chars:
+            log.warning(f"Chunks of {config.max_chars} chars may not fit the Ollama context (num_ctx {num_ctx}). "
+                           f"Use --max-chars {max(1, chunk_chars)} or less, or raise --ollama_num_ctx.")
+        log.debug(f"Ollama options: num_ctx {num_ctx}, num_predict {num_predict}, keep_alive {self.keep_alive} (model context: {model_context})")
+        return num_ctx, num_predict
+
+    def _options(self) -> Dict[str, Any]:
+        # The same options on every request: a different num_ctx would reload the model
+        return {"num_ctx": self.num_ctx, "num_predict": self.num_predict}
+
+    def _preload(self):
+        """Loads the model with the run's options (an empty prompt only loads it)."""
+        try:
+            self.client.generate(model=self._get_model_name(), prompt="", keep_alive=self.keep_alive, options=self._options())
+            log.debug(f"Ollama model {self._get_model_name()} preloaded.")
+        except Exception as e:
+            log.debug(f"Ollama model preload failed, it will load on the first request: {e}")
+
     def _get_model_name(self) -> str:
         """Extracts the actual model name from the configured name (strips 'ollama.')."""
-        model_config_name = self.config.model
+        model_config_name = self.model_name
         if model_config_name.startswith("ollama."):
             model_name = model_config_name[7:]
             log.debug(f"Using Ollama model: {model_name}")
@@ -137,13 +230,15 @@ class Client:
         try:
              # Ensure client is valid
              assert self.client is not None
+             # The server reuses the evaluated prompt prefix (system prompt, previous turns) of the
+             # loaded model when the options are unchanged, so only the new tokens are evaluated
              response = self.client.chat(
                 model=model_name,
                 messages=ollama_messages,
-                # Add options if needed, e.g., from config
-                # options={'temperature': config.get_llm_argument('temperature', 0.8)}
+                keep_alive=self.keep_alive,
+                options=self._options(),
              )
-             log.debug(f"Ollama raw response: {response}")
+             log.debug("Ollama raw response: %s", response)
 
              # --- Extract information Robustly ---
              if not isinstance(response, dict):
@@ -164,6 +259,8 @@ class Client:
              # Map to OpenAI-like reasons if possible. Assume 'stop' if done.
              # Need to investigate how Ollama signals other reasons like length limits.
              finish_reason = "stop" if is_done else "unknown"
+             if response.get('done_reason') == "length":
+                 finish_reason = "length" # num_predict reached: the reply can be continued (--cont)
 
              # Log optional performance stats if available
              eval_count = response.get('eval_count')
@@ -174,7 +271,12 @@ class Client:
              return {
                 "role": response_role,
                 "content": response_content,
-                "finish_reason": finish_reason
+                "finish_reason": finish_reason,
+                # Normalized token usage: prompt_eval_count is missing when the prompt was fully cached
+                "usage": {
+                    "input_tokens": response.get('prompt_eval_count'),
+                    "output_tokens": eval_count,
+                }
              }
         # Catch specific Ollama errors
         except ResponseError as e:
@@ -184,11 +286,11 @@ class Client:
              content = f"Ollama Error ({e.status_code}): {err_msg}"
              if e.status_code == 404 or ("model" in err_msg.lower() and "not found" in err_msg.lower()):
                  content = f"Ollama model '{model_name}' not found locally. Pull it first: `ollama pull {model_name}`"
-             return {"role": "error", "content": content, "finish_reason": "error"}
+             return {"role": "error", "content": content, "finish_reason": "server_error" if e.status_code >= 500 else "error"}
         except RequestError as e:
             # Handle connection errors more specifically if possible
             log.error(f"Ollama connection/request error: {e}")
-            return {"role": "error", "content": f"Ollama Connection/Request Error: {e}", "finish_reason": "error"}
+            return {"role": "error", "content": f"Ollama Connection/Request Error: {e}", "finish_reason": "connection_error"}
         except Exception as e:
             log.error(f"Unexpected error during Ollama generation: {e}")
             import traceback
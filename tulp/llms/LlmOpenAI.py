@@ -4,6 +4,7 @@ from typing import List, Dict, Any
 from ..logger import log
 from ..config import TulpConfig
 from .. import constants
+from ..capabilities import get_capabilities, reply_token_limit
 
 # Conditional import for openai
 try:
@@ -20,6 +21,18 @@ except ImportError:
     # Warning logged during Client init or getModels/getArguments
 
 
+# Capabilities of the OpenAI models, first match wins (https://platform.openai.com/docs/models).
+# Unlisted models, such as those of compatible APIs, are sent no output limit.
+OPENAI_FEATURES = {"streaming": True, "prefill": False, "json_mode": True}
+CAPABILITIES = [
+    {**OPENAI_FEATURES, "idRe": r"(openai\.)?(gpt|chatgpt)-4o.*", "context_window": 128000, "max_output_tokens": 16384},
+    {**OPENAI_FEATURES, "idRe": r"(openai\.)?gpt-4\.1.*", "context_window": 1047576, "max_output_tokens": 32768},
+    {**OPENAI_FEATURES, "idRe": r"(openai\.)?gpt-4-turbo.*", "context_window": 128000, "max_output_tokens": 4096},
+    {**OPENAI_FEATURES, "idRe": r"(openai\.)?gpt-3\.5-turbo.*", "context_window": 16385, "max_output_tokens": 4096},
+    {**OPENAI_FEATURES, "idRe": r"(openai\.)?o[34]-mini.*", "context_window": 200000, "max_output_tokens": 100000},
+    {"idRe": r".*", "streaming": True},
+]
+
 def getModels() -> List[Dict[str, str]]:
     """Returns model definitions for OpenAI and compatible APIs."""
     if not OPENAI_AVAILABLE:
@@ -27,7 +40,7 @@ def getModels() -> List[Dict[str, str]]:
          log.warning("Install it with: pip install openai")
          return []
     # Allow gpt-*, chatgpt-*, and explicit openai.* prefixes. Use raw strings.
-    return [ { "idRe": r"(gpt-|chatgpt-|openai\.).*", "description": "Any OpenAI model (https://platform.openai.com/docs/models) or compatible API (e.g., local Ollama with base URL). Requires API key (openai_api_key). Use 'openai.<MODEL_ID>' for unlisted models." } ]
+    return [ { "idRe": r"(gpt-|chatgpt-|openai\.).*", "description": "Any OpenAI model (https://platform.openai.com/docs/models) or compatible API (e.g., local Ollama with base URL). Requires API key (openai_api_key). Use 'openai.<MODEL_ID>' for unlisted models.", "capabilities": CAPABILITIES } ]
 
 
 def getArguments() -> List[Dict[str, Any]]:
@@ -42,9 +55,12 @@ def getArguments() -> List[Dict[str, Any]]:
 
 class Client:
     """Client for interacting with OpenAI models or compatible APIs."""
-    def __init__(self, config: TulpConfig):
-        """Initializes the OpenAI client."""
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        """Initializes the OpenAI client for model_name (config.model by default)."""
         self.config = config
+        self.model_name = model_name or config.model
+        self.capabilities = get_capabilities(self.model_name)
+        self.supports_prefill = self.capabilities["prefill"]
         if not OPENAI_AVAILABLE:
             raise ImportError("OpenAI library is not installed. Cannot use OpenAI client.")
 
@@ -81,7 +97,7 @@ class Client:
 
     def _get_model_name(self) -> str:
         """Extracts the actual model name if 'openai.' prefix is used."""
-        model_config_name = self.config.model
+        model_config_name = self.model_name
         if model_config_name.startswith("openai."):
             model_name = model_config_name[7:]
             log.debug(f"Using explicit OpenAI model name: {model_name}")
@@ -104,17 +120,19 @@ class Client:
         # for i, req in enumerate(messages_to_send):
         #      log.debug(f"OpenAI REQ {i}: Role={req.get('role')} Content='{req.get('content', '')[:100]}...'")
 
+        # Only known models get an output limit: compatible APIs may not accept the parameter
+        max_tokens = reply_token_limit(self.capabilities, messages_to_send)
+        limits = {"max_completion_tokens": max_tokens} if max_tokens else {}
+
         try:
             # Ensure client is valid
             assert self.client is not None
             api_response = self.client.chat.completions.create(
                 model=model_name,
-                messages=messages_to_send
-                # Add other parameters like temperature, max_tokens if needed from config
-                # temperature=config.get_llm_argument('temperature', 0.7), # Example
-                # max_tokens=config.get_llm_argument('max_tokens_out', 4096) # Example
+                messages=messages_to_send,
+                **limits
             )
-            log.debug(f"OpenAI raw response object: {api_response}")
+            log.debug("OpenAI raw response object: %s", api_response)
 
             if not api_response.choices:
                  log.error("OpenAI response contained no choices.")
@@ -141,10 +159,17 @@ class Client:
                  log.warning("OpenAI response truncated due to length limit (max_tokens or context window).")
                  # Return truncated content, core logic should be aware via finish_reason
 
+            # Normalized token usage (None when the endpoint doesn't report it)
+            usage = getattr(api_response, 'usage', None)
+
             return {
                 "role": response_role,
                 "content": response_content,
-                "finish_reason": finish_reason # Return OpenAI's reason directly
+                "finish_reason": finish_reason, # Return OpenAI's reason directly
+                "usage": {
+                    "input_tokens": getattr(usage, 'prompt_tokens', None),
+                    "output_tokens": getattr(usage, 'completion_tokens', None),
+                }
             }
         # Catch specific OpenAI errors
         except AuthenticationError as e:
@@ -159,10 +184,10 @@ class Client:
         except APIStatusError as e:
             # Handle other status errors (e.g., 5xx server errors)
             log.error(f"OpenAI API status error: {e.status_code} - {getattr(e, 'message', str(e))}")
-            return {"role": "error", "content": f"OpenAI API Error ({e.status_code}): {getattr(e, 'message', str(e))}", "finish_reason": "error"}
+            return {"role": "error", "content": f"OpenAI API Error ({e.status_code}): {getattr(e, 'message', str(e))}", "finish_reason": "server_error" if e.status_code >= 500 else "error"}
         except APIConnectionError as e:
             log.error(f"OpenAI API connection error: {e}")
-            return {"role": "error", "content": f"OpenAI Connection Error: {e}", "finish_reason": "error"}
+            return {"role": "error", "content": f"OpenAI Connection Error: {e}", "finish_reason": "connection_error"}
         except Exception as e:
             # Catch unexpected errors
             log.error(f"Unexpected error during OpenAI generation: {e}")
@@ -0,0 +1,86 @@
+# tulp/llms/LlmReplay.py
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import List, Dict, Any
+from ..logger import log
+from ..config import TulpConfig
+from ..inspect_log import find_inspect_logs, read_exchanges, request_hash
+
+MODEL_PREFIX = "replay:"
+
+
+def getModels() -> List[Dict[str, str]]:
+   """Returns model definitions for the replay backend (always available)."""
+   return [ { "idRe": r"replay:.*", "description": "Replays responses recorded with --inspect-dir, use 'replay:<DIR or inspect log file>'. Offline, no API key required."} ]
+
+def getArguments() -> List[Dict[str, Any]]:
+   """Returns argument definitions specific to the replay backend."""
+   return [{"name": "replay_latency", "description": "Seconds to wait before each replayed response, or 'recorded' to reproduce the recorded latency (default: 0)", "default": "0"}]
+
+
+class Client:
+    """
+    Fake LLM client serving responses recorded in inspect logs.
+    Requests are matched by the hash of their messages (role and content); when the
+    same request was recorded several times, its responses are served in order.
+    """
+
+    def __init__(self, config: TulpConfig, model_name: str | None = None):
+        self.config = config
+        self.model_name = model_name or config.model
+        source = self.model_name[len(MODEL_PREFIX):] if self.model_name.startswith(MODEL_PREFIX) else self.model_name
+        source = os.path.expanduser(source)
+        if not os.path.exists(source):
+            raise ValueError(f"Replay source '{source}' does not exist. Use --model replay:<inspect dir or log file>.")
+
+        latency_arg = str(config.get_llm_argument("replay_latency") or "0").strip().lower()
+        if latency_arg == "recorded":
+            self.fixed_latency = None
+        else:
+            try:
+                self.fixed_latency = max(0.0, float(latency_arg))
+            except ValueError:
+                raise ValueError(f"Invalid replay_latency '{latency_arg}': use a number of seconds or 'recorded'.")
+
+        self._lock = threading.Lock()
+        self._recordings: Dict[str, deque] = defaultdict(deque)
+        # Prefill is used if the recorded continuations ended with an assistant message
+        self.supports_prefill = False
+        num_exchanges = 0
+        log_files = find_inspect_logs(source)
+        for log_file in log_files:
+            for exchange in read_exchanges(log_file):
+                if exchange.get("response") is None:
+                    continue
+                self._recordings[exchange["request_hash"]].append(exchange)
+                if len(exchange["request"]) > 2 and exchange["request"][-1].get("role") == "assistant":
+                    self.supports_prefill = True
+                num_exchanges += 1
+        if not num_exchanges:
+            raise ValueError(f"No recorded exchanges found in replay source '{source}'.")
+        log.info(f"Replay client loaded {num_exchanges} recorded exchanges from {len(log_files)} inspect log(s) in {source}")
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Returns the recorded response for these exact request messages."""
+        key = request_hash(messages)
+        with self._lock:
+            queued = self._recordings.get(key)
+            if not queued:
+                log.error(f"No recorded response matches this request (hash {key}, {len(messages)} messages).")
+                return {"role": "error", "content": f"Replay miss: no recorded response for request {key}", "finish_reason": "error"}
+            # Keep the last recording so repeated requests still get an answer
+            exchange = queued.popleft() if len(queued) > 1 else queued[0]
+
+        latency = self.fixed_latency if self.fixed_latency is not None else (exchange.get("latency") or 0.0)
+        if latency > 0:
+            time.sleep(latency)
+
+        log.debug(f"Replaying recorded response '{exchange.get('tag')}' for request {key}")
+        return {
+            "role": exchange["response"].get("role", "assistant"),
+            "content": exchange["response"].get("content", ""),
+            "finish_reason": exchange.get("finish_reason") or "stop",
+            "usage": exchange.get("usage"),
+        }
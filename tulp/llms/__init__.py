@@ -172,8 +172,8 @@ def get_model_client(model_name: str, config: 'TulpConfig') -> 'LlmClientType':
         if hasattr(module, 'Client') and callable(getattr(module, 'Client')):
             try:
                 log.info(f"Instantiating client for model '{model_name}' using module {module.__name__}")
-                # The Client class __init__ expects the config object
-                client_instance = module.Client(config)
+                # The Client class __init__ expects the config object and the model to use
+                client_instance = module.Client(config, model_name)
                 return client_instance
             except ImportError as ie:
                  # Catch missing libraries specific to the client here
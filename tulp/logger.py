@@ -1,6 +1,11 @@
 # logger.py
 import os
 import sys
+import json
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from . import constants
 
 YELLOW = '\033[33m'
@@ -18,17 +23,26 @@ GREY_16 = "\033[38;5;248m"
 GREY_17 = "\033[38;5;249m"
 GREY_18 = "\033[38;5;250m"
 
+# Numeric level lookup, so level checks are a single integer comparison
+_LEVEL_NUMBERS = {name: number for number, name in enumerate(constants.LOG_LEVELS)}
+DEBUG = _LEVEL_NUMBERS["DEBUG"]
+INFO = _LEVEL_NUMBERS["INFO"]
+WARNING = _LEVEL_NUMBERS["WARNING"]
+ERROR = _LEVEL_NUMBERS["ERROR"]
+
 # Global log level setting
 _global_log_level = constants.DEFAULT_LOG_LEVEL.upper()
+_global_log_level_no = _LEVEL_NUMBERS[_global_log_level]
 
 def set_global_log_level(level: str):
     """Sets the global logging level."""
-    global _global_log_level
+    global _global_log_level, _global_log_level_no
     level_upper = level.upper()
-    if level_upper in constants.LOG_LEVELS:
+    if level_upper in _LEVEL_NUMBERS:
         _global_log_level = level_upper
+        _global_log_level_no = _LEVEL_NUMBERS[level_upper]
     else:
-        print(f"[ERROR] Invalid log level: {level}. Using {_global_log_level}.", file=sys.stderr)
+        sys.stderr.write(f"[ERROR] Invalid log level: {level}. Using {_global_log_level}.\n")
 
 def get_global_log_level() -> str:
     """Gets the global logging level."""
@@ -41,51 +55,131 @@ if sys.stderr.isatty():
         _use_colors = True
 
 def _print_color(text, color):
-    """Prints text in the specified color to stderr."""
+    """Writes text in the specified color to stderr."""
     if _use_colors:
-        print(f"{color}{text}{RESET}", file=sys.stderr)
+        sys.stderr.write(f"{color}{text}{RESET}\n")
     else:
-        print(text, file=sys.stderr)
+        sys.stderr.write(f"{text}\n")
+
+
+# --- Chunk ids ---
+# Worker threads process different chunks, so the current chunk id is thread-local
+_chunk_state = threading.local()
+
+@contextmanager
+def log_chunk(chunk_id):
+    """Tags every log record emitted inside the block (in this thread) with chunk_id."""
+    previous = getattr(_chunk_state, "chunk_id", None)
+    _chunk_state.chunk_id = chunk_id
+    try:
+        yield
+    finally:
+        _chunk_state.chunk_id = previous
+
+
+# --- JSON lines sink ---
+
+class JsonLogSink:
+    """Appends log records as JSON lines (timestamp, level, chunk id, message) to a buffered file."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._file = open(file_path, "a", encoding="utf-8", buffering=constants.LOG_JSON_BUFFER_BYTES)
+
+    def write(self, level: str, message: str):
+        record = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "level": level,
+            "chunk": getattr(_chunk_state, "chunk_id", None),
+            "msg": message,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_json_sink: JsonLogSink | None = None
+
+def set_log_json_file(file_path: str | None):
+    """Enables (or, with None, disables) the JSON lines log sink."""
+    global _json_sink
+    close_log_json_file()
+    if file_path:
+        try:
+            _json_sink = JsonLogSink(file_path)
+        except OSError as e:
+            sys.stderr.write(f"[ERROR] Cannot open JSON log file '{file_path}': {e}\n")
+
+def close_log_json_file():
+    """Flushes and closes the JSON lines log sink, if any."""
+    global _json_sink
+    if _json_sink is not None:
+        _json_sink.close()
+        _json_sink = None
+
+atexit.register(close_log_json_file)
+
 
 class Logger:
     """
     A simple logger class that writes messages to stderr with optional color.
     Uses a global log level setting but can override it per instance.
+
+    Messages are only built when the level is enabled: pass printf-style arguments
+    (log.debug("Response: %s", response)) or a callable returning the message
+    (log.debug(lambda: expensive_summary())) to keep disabled levels free.
     """
     def __init__(self, instance_log_level: str = None):
         self._instance_log_level = instance_log_level.upper() if instance_log_level else None
-        if self._instance_log_level and self._instance_log_level not in constants.LOG_LEVELS:
-            print(f"[WARNING] Invalid instance log level '{instance_log_level}'. Using global level.", file=sys.stderr)
+        if self._instance_log_level and self._instance_log_level not in _LEVEL_NUMBERS:
+            sys.stderr.write(f"[WARNING] Invalid instance log level '{instance_log_level}'. Using global level.\n")
             self._instance_log_level = None
+        self._instance_level_no = _LEVEL_NUMBERS[self._instance_log_level] if self._instance_log_level else None
 
     def _get_effective_level(self) -> str:
         """Determines the effective log level (instance or global)."""
         return self._instance_log_level or get_global_log_level()
 
+    def _is_enabled(self, level_no: int) -> bool:
+        threshold = self._instance_level_no
+        return level_no >= (_global_log_level_no if threshold is None else threshold)
+
     def _should_log(self, message_level: str) -> bool:
         """Checks if a message at a given level should be logged."""
-        effective_level = self._get_effective_level()
-        level_hierarchy = constants.LOG_LEVELS # Assumes order: DEBUG, INFO, WARNING, ERROR, CRITICAL
-        try:
-            return level_hierarchy.index(message_level.upper()) >= level_hierarchy.index(effective_level)
-        except ValueError:
-            return False # Unknown level
-
-    def error(self, message):
-        if self._should_log('ERROR'):
-            _print_color(f'[ERROR] {message}', RED)
-
-    def warning(self, message):
-        if self._should_log('WARNING'):
-            _print_color(f'[WARNING] {message}', ORANGE)
-
-    def info(self, message):
-        if self._should_log('INFO'):
-            _print_color(f'[INFO] {message}', GREY_18)
-
-    def debug(self, message):
-        if self._should_log('DEBUG'):
-            _print_color(f'[DEBUG] {message}', GREY_11)
+        level_no = _LEVEL_NUMBERS.get(message_level.upper())
+        return level_no is not None and self._is_enabled(level_no)
+
+    def _log(self, level: str, color: str, message, args):
+        if callable(message):
+            message = message()
+        elif args:
+            message = message % args
+        _print_color(f'[{level}] {message}', color)
+        if _json_sink is not None:
+            _json_sink.write(level, str(message))
+
+    def error(self, message, *args):
+        if self._is_enabled(ERROR):
+            self._log('ERROR', RED, message, args)
+
+    def warning(self, message, *args):
+        if self._is_enabled(WARNING):
+            self._log('WARNING', ORANGE, message, args)
+
+    def info(self, message, *args):
+        if self._is_enabled(INFO):
+            self._log('INFO', GREY_18, message, args)
+
+    def debug(self, message, *args):
+        if self._is_enabled(DEBUG):
+            self._log('DEBUG', GREY_11, message, args)
 
 # Default logger instance
 log = Logger()
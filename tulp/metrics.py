@@ -0,0 +1,198 @@
+# metrics.py
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+from .logger import log
+
+# Phases timed for every chunk
+PHASES = ("prompt_build", "network", "parse", "write")
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float | None:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _add_tokens(total: int | None, value: Any) -> int | None:
+    """Adds a token count that may be unknown (None) to a total that may still be unknown."""
+    if not isinstance(value, int):
+        return total
+    return (total or 0) + value
+
+
+class RunMetrics:
+    """
+    Collects per-run and per-chunk measurements: phase timings, request latencies,
+    continuations, finish reasons and token usage.
+    Thread-safe, since chunks are processed by worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears all measurements and restarts the run clock."""
+        with self._lock:
+            self._started = time.perf_counter()
+            self.started_at = datetime.now(timezone.utc)
+            self.run_info: Dict[str, Any] = {}
+            self.chunks: Dict[str, Dict[str, Any]] = {}
+            self.counters: Dict[str, float] = {}
+            self.total_cost = 0.0
+            self.extra_cost = 0.0
+
+    def _chunk(self, chunk_id: str) -> Dict[str, Any]:
+        """Returns the record for chunk_id, creating it on first use. Call with the lock held."""
+        chunk = self.chunks.get(chunk_id)
+        if chunk is None:
+            chunk = {
+                "id": chunk_id,
+                "timings": {phase: 0.0 for phase in PHASES},
+                "requests": 0,
+                "request_latencies": [],
+                "continuations": 0,
+                "finish_reason": None,
+                "input_tokens": None,
+                "output_tokens": None,
+                "cost": None,
+                "model": None,
+                "escalations": 0,
+            }
+            self.chunks[chunk_id] = chunk
+        return chunk
+
+    def set_run_info(self, **info: Any):
+        """Stores run-level fields (model, mode, number of chunks...)."""
+        with self._lock:
+            self.run_info.update(info)
+
+    def set_chunk(self, chunk_id: str, **fields: Any):
+        """Stores chunk-level fields (continuations, status, output size...)."""
+        with self._lock:
+            self._chunk(chunk_id).update(fields)
+
+    def get_chunk(self, chunk_id: str) -> Dict[str, Any]:
+        """A copy of the chunk-level fields recorded so far."""
+        with self._lock:
+            return dict(self._chunk(chunk_id))
+
+    def add_time(self, chunk_id: str, phase: str, seconds: float):
+        with self._lock:
+            timings = self._chunk(chunk_id)["timings"]
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, chunk_id: str, phase: str):
+        """Adds the wall time spent inside the block to the chunk's phase timing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(chunk_id, phase, time.perf_counter() - start)
+
+    def add_counter(self, name: str, value: float = 1):
+        """Adds to a run-level counter, reported in the totals (e.g. hedged_requests)."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_cost(self, cost: float):
+        """Adds the estimated cost of a request whose reply was discarded (not tied to a chunk)."""
+        with self._lock:
+            self.total_cost += cost
+            self.extra_cost += cost
+
+    def record_duplicate(self, chunk_id: str, original_id: str):
+        """Records a chunk answered with the result of an identical earlier chunk, and what that saved."""
+        with self._lock:
+            original = self._chunk(original_id)
+            self._chunk(chunk_id)["duplicate_of"] = original_id
+            for name, value in (("duplicate_chunks", 1), ("saved_requests", original["requests"]),
+                                ("saved_input_tokens", original["input_tokens"]), ("saved_output_tokens", original["output_tokens"]),
+                                ("saved_cost", original["cost"])):
+                if value is not None:
+                    self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_response(self, chunk_id: str, response: Dict[str, Any], latency: float, cost: float | None = None):
+        """Records one LLM request: its latency, finish reason, normalized token usage and estimated cost."""
+        usage = response.get("usage") or {}
+        with self._lock:
+            chunk = self._chunk(chunk_id)
+            chunk["requests"] += 1
+            chunk["request_latencies"].append(round(latency, 4))
+            chunk["timings"]["network"] += latency
+            chunk["finish_reason"] = response.get("finish_reason")
+            chunk["input_tokens"] = _add_tokens(chunk["input_tokens"], usage.get("input_tokens"))
+            chunk["output_tokens"] = _add_tokens(chunk["output_tokens"], usage.get("output_tokens"))
+            if cost is not None:
+                chunk["cost"] = (chunk["cost"] or 0.0) + cost
+                self.total_cost += cost
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Builds the report: run info, totals and latency percentiles, then every chunk."""
+        with self._lock:
+            chunks = [dict(chunk, timings=dict(chunk["timings"]), request_latencies=list(chunk["request_latencies"])) for chunk in self.chunks.values()]
+            run_info = dict(self.run_info)
+            wall_time = time.perf_counter() - self._started
+            total_cost = self.total_cost
+            extra_cost = self.extra_cost
+            counters = dict(self.counters)
+
+        latencies = sorted(latency for chunk in chunks for latency in chunk["request_latencies"])
+        phases = list(PHASES) + sorted({phase for chunk in chunks for phase in chunk["timings"]} - set(PHASES))
+        totals: Dict[str, Any] = {
+            "chunks": len(chunks),
+            "requests": sum(chunk["requests"] for chunk in chunks),
+            "continuations": sum(chunk["continuations"] for chunk in chunks),
+            "escalations": sum(chunk["escalations"] for chunk in chunks),
+            "input_tokens": None,
+            "output_tokens": None,
+            "cost": round(total_cost, 6) if extra_cost or any(chunk["cost"] is not None for chunk in chunks) else None,
+            "timings": {phase: round(sum(chunk["timings"].get(phase, 0.0) for chunk in chunks), 4) for phase in phases},
+            "latency": {
+                "p50": _percentile(latencies, 0.50),
+                "p95": _percentile(latencies, 0.95),
+                "p99": _percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+        totals.update(counters)
+        models = [chunk["model"] for chunk in chunks if chunk["model"]]
+        if models:
+            # Chunks per model that produced their final reply (--cascade)
+            totals["models"] = {model: models.count(model) for model in dict.fromkeys(models)}
+        for chunk in chunks:
+            totals["input_tokens"] = _add_tokens(totals["input_tokens"], chunk["input_tokens"])
+            totals["output_tokens"] = _add_tokens(totals["output_tokens"], chunk["output_tokens"])
+            chunk["timings"] = {phase: round(seconds, 4) for phase, seconds in chunk["timings"].items()}
+
+        return {
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "wall_time": round(wall_time, 4),
+            **run_info,
+            "totals": totals,
+            "chunks": chunks,
+        }
+
+    def write_json(self, file_path: str) -> bool:
+        """Writes the report as one JSON document. Returns False (after logging) on failure."""
+        try:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=2, default=str)
+                f.write("\n")
+            log.debug(f"Metrics written to: {file_path}")
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            log.error(f"Failed to write metrics to '{file_path}': {e}")
+            return False
+
+
+# Default metrics instance for the run
+metrics = RunMetrics()
@@ -2,7 +2,23 @@
 import os
 import sys
 import re
+import json
+import shutil
+import tempfile
+from . import constants
 from .logger import log
+from .input_handler import detect_format
+
+# Optional YAML parser, only needed to detect YAML chunk outputs (--output-format auto)
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    yaml = None
+    YAML_AVAILABLE = False
+
+# Unified diff file headers and hunks, which also start with "---"
+DIFF_LINE_RE = re.compile(r"^(\+\+\+ |@@ .* @@|diff --git )", re.MULTILINE)
 
 # --- Output Cleaning ---
 
@@ -61,14 +77,320 @@ def print_stderr(content: str):
         log.info(f"\n--- LLM Message ---\n{trimmed_content}\n-------------------")
 
 
+# --- Streaming Output ---
+
+class OutputSink:
+    """
+    Streams the main output to stdout, or to a file, as each chunk finishes. If a
+    later chunk fails, the chunks already printed to stdout stay there (like any Unix
+    filter that fails midway), while a file target is left untouched.
+
+    File output goes to a temporary file next to the target that is atomically
+    renamed over it on close(), so the target is never left half-written. An existing
+    target is kept as a numbered backup (.backup-N), at most `max_backups` of them.
+
+    With clean=True leading and trailing whitespace of the whole output is dropped
+    incrementally, without ever holding the full output in memory. Markdown fences are
+    stripped from each reply before it gets here (see strip_code_fences).
+    """
+
+    def __init__(self, file_path: str | None = None, max_backups: int = constants.DEFAULT_MAX_BACKUPS, clean: bool = True):
+        self.file_path = os.path.abspath(file_path) if file_path else None
+        self.max_backups = max_backups
+        self.clean = clean
+        self.chars_written = 0
+        self._pending_whitespace = ""
+        self._last_char = ""
+        self._tmp_path = None
+        self._file = None
+
+    def open(self) -> tuple[bool, str]:
+        """
+        Prepares the destination. For files, validates the target and creates the temporary file.
+
+        Returns:
+            A tuple (success: bool, message: str). Message is the target on success, error on failure.
+        """
+        if not self.file_path:
+            return True, "stdout"
+
+        log.info(f"Attempting to write output to file: {self.file_path}")
+        try:
+            if os.path.isdir(self.file_path):
+                error_msg = f"Error: Output path '{self.file_path}' exists and is a directory."
+                log.error(error_msg)
+                return False, error_msg
+
+            # Ensure parent directory exists
+            parent_dir = os.path.dirname(self.file_path)
+            os.makedirs(parent_dir, exist_ok=True)
+
+            # The temporary file lives in the target directory so the final rename is atomic
+            fd, self._tmp_path = tempfile.mkstemp(dir=parent_dir, prefix=f".{os.path.basename(self.file_path)}.", suffix=".tmp")
+            # mkstemp creates the file as 0600, the replaced target must keep its usual permissions
+            os.chmod(self._tmp_path, _target_mode(self.file_path))
+            self._file = os.fdopen(fd, "w", encoding='utf-8')
+            return True, self.file_path
+        except OSError as e:
+            error_msg = f"OS error preparing output file '{self.file_path}': {e}"
+            log.error(error_msg)
+            self.abort()
+            return False, error_msg
+
+    def write(self, content: str):
+        """Writes one chunk of output."""
+        if not content:
+            return
+        if self.clean:
+            if not self.chars_written and not self._pending_whitespace:
+                content = content.lstrip()
+            body = content.rstrip()
+            if not body:
+                # Whitespace is only emitted if more content follows
+                if self.chars_written:
+                    self._pending_whitespace += content
+                return
+            content, trailing = self._pending_whitespace + body, content[len(body):]
+            self._pending_whitespace = trailing
+        self._emit(content)
+
+    def _emit(self, text: str):
+        if self._file is not None:
+            self._file.write(text)
+        elif self.file_path is None:
+            sys.stdout.buffer.write(text.encode('utf-8'))
+            sys.stdout.flush() # Ensure it's written immediately
+        self.chars_written += len(text)
+        self._last_char = text[-1:]
+
+    def close(self) -> tuple[bool, str]:
+        """
+        Finishes the output. For files, backs up the existing target and renames the
+        temporary file over it.
+
+        Returns:
+            A tuple (success: bool, message: str). Message is the target on success, error on failure.
+        """
+        if self.file_path is None:
+            if self.chars_written:
+                if self._last_char != "\n":
+                    # Mimic print()'s trailing newline for interactive use
+                    sys.stdout.buffer.write(b'\n')
+                    sys.stdout.flush()
+                log.info(f"Printed {self.chars_written} chars to stdout.")
+            else:
+                log.info("stdout content was empty.")
+            return True, "stdout"
+
+        if self._file is None:
+            return False, f"Output file '{self.file_path}' was not opened."
+
+        try:
+            self._file.close()
+            self._file = None
+            if os.path.exists(self.file_path):
+                backup_path = _backup_file(self.file_path, self.max_backups)
+                if backup_path:
+                    log.warning(f"Output file '{os.path.basename(self.file_path)}' exists. Kept existing file as '{os.path.basename(backup_path)}'.")
+            os.replace(self._tmp_path, self.file_path)
+            self._tmp_path = None
+            log.info(f"Successfully wrote {self.chars_written} chars to '{self.file_path}'.")
+            return True, self.file_path
+        except OSError as e:
+            # Keep the completed temporary file so the output is not lost
+            error_msg = f"OS error writing to file '{self.file_path}': {e}. The output was left in '{self._tmp_path}'."
+            log.error(error_msg)
+            return False, error_msg
+
+    def abort(self):
+        """
+        Discards a partially written file output, leaving any existing target untouched.
+        Output already printed to stdout cannot be taken back: it is reported as incomplete.
+        """
+        if self.file_path is None and self.chars_written:
+            log.error(f"Stopped after printing {self.chars_written} chars to stdout: the output is incomplete.")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path:
+            try:
+                os.remove(self._tmp_path)
+            except OSError as e:
+                log.warning(f"Could not remove temporary output file '{self._tmp_path}': {e}")
+            self._tmp_path = None
+
+
+class OutputMerger:
+    """
+    Joins the stdout blocks of consecutive chunks into one valid document, as they
+    arrive (a streaming pass: only the first chunk's header line is kept in memory).
+
+    The output format is given or detected from the first non-empty chunk:
+    - json: the elements of every chunk's array are written into a single array.
+    - csv: the header line repeated at the start of later chunks is dropped.
+    - yaml: sequences are concatenated, other documents are separated with '---'.
+      Only detected when the chunk parses as YAML holding mappings or nested
+      structures (needs PyYAML): diffs and markdown lists stay text.
+    - jsonl, text: chunks are joined with a newline.
+    """
+
+    def __init__(self, output_format: str = "auto"):
+        self.output_format = output_format
+        self.chunks = 0
+        self._header = None
+
+    def _detect(self, content: str) -> str:
+        if (content.startswith("---") or content.startswith("- ")) and _is_yaml_document(content):
+            return "yaml"
+        fmt = detect_format(content)
+        if fmt == "json" and _json_array(content) is None:
+            return "text"
+        return fmt if fmt in ("json", "jsonl", "csv") else "text"
+
+    def feed(self, content: str) -> str:
+        """Returns the text to write for one more chunk output (its code fences already stripped)."""
+        content = content.strip()
+        if not content:
+            return ""
+        if self.output_format == "auto":
+            self.output_format = self._detect(content)
+            log.debug(f"Merging chunk outputs as {self.output_format}.")
+        self.chunks += 1
+        first = self.chunks == 1
+
+        if self.output_format == "json":
+            elements = _json_array(content)
+            if elements is None:
+                log.warning(f"Output of chunk {self.chunks} is not a JSON array, adding it to the merged array as is.")
+                elements = content
+            if not elements:
+                self.chunks -= 1 # Nothing written, the next chunk still opens the array
+                return ""
+            return ("[\n" if first else ",\n") + elements
+        if self.output_format == "csv":
+            header, _newline, rest = content.partition("\n")
+            if first:
+                self._header = header.rstrip("\r")
+                return content
+            if header.rstrip("\r") == self._header:
+                content = rest.strip("\n")
+                if not content:
+                    return ""
+        elif self.output_format == "yaml" and not first:
+            body = re.sub(r"\A---[^\n]*\n?", "", content).strip()
+            if not body.startswith("- "):
+                return "\n---\n" + body
+            content = body
+        return content if first else "\n" + content
+
+    def finish(self) -> str:
+        """Returns the text that closes the merged output."""
+        if self.output_format == "json":
+            return "\n]" if self.chunks else "[]"
+        return ""
+
+
+def _is_yaml_document(content: str) -> bool:
+    """True if content parses as YAML with at least one mapping or nested sequence, and is not a diff."""
+    if not YAML_AVAILABLE or DIFF_LINE_RE.search(content):
+        return False
+    try:
+        documents = list(yaml.safe_load_all(content))
+    except yaml.YAMLError:
+        return False
+    # A sequence of plain scalars is as likely a markdown list
+    def structured(value) -> bool:
+        return isinstance(value, dict) or (isinstance(value, list) and any(isinstance(item, (dict, list)) for item in value))
+    return any(structured(document) for document in documents)
+
+
+def _json_array(content: str) -> str | None:
+    """The text between the brackets of a JSON array (keeping the indentation of its elements), or None if content is not one."""
+    if not (content.startswith("[") and content.endswith("]")):
+        return None
+    try:
+        if not isinstance(json.loads(content), list):
+            return None
+    except ValueError:
+        return None
+    inner = content[1:-1].lstrip("\r\n").rstrip()
+    return inner if inner.strip() else ""
+
+
+def strip_code_fences(content: str) -> str:
+    """Removes markdown code block fences (```) wrapping the whole content, keeping surrounding whitespace otherwise."""
+    match = CODE_BLOCK_RE.match(content.strip())
+    if match:
+        log.info("Stripping markdown code block fences (```).")
+        return match.group(1).strip()
+    return content
+
+
+def _target_mode(file_path: str) -> int:
+    """Permission bits for the output file: those of the existing target, else the default of a new file (0666 & ~umask)."""
+    try:
+        return os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _backup_numbers(original_path: str) -> list[int]:
+    """Lists the existing backup numbers of original_path with a single directory scan."""
+    directory = os.path.dirname(original_path)
+    base, ext = os.path.splitext(os.path.basename(original_path))
+    backup_re = re.compile(rf"^{re.escape(base)}\.backup-(\d+){re.escape(ext)}$")
+    numbers = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = backup_re.match(entry.name)
+            if match:
+                numbers.append(int(match.group(1)))
+    return sorted(numbers)
+
+
+def _backup_file(original_path: str, max_backups: int) -> str | None:
+    """
+    Keeps a copy of original_path as the next numbered backup (file.backup-N.txt) and
+    deletes the oldest backups beyond max_backups. The original stays in place until it
+    is atomically replaced. Returns the backup path, or None if backups are disabled.
+    """
+    if max_backups <= 0:
+        return None
+
+    base, ext = os.path.splitext(original_path)
+    numbers = _backup_numbers(original_path)
+    next_number = (numbers[-1] + 1) if numbers else 1
+    backup_path = f"{base}.backup-{next_number}{ext}"
+    try:
+        os.link(original_path, backup_path)
+    except OSError:
+        shutil.copy2(original_path, backup_path)
+
+    # Enforce the retention cap, oldest (lowest numbered) first
+    numbers.append(next_number)
+    for number in numbers[:-max_backups]:
+        stale_path = f"{base}.backup-{number}{ext}"
+        try:
+            os.remove(stale_path)
+            log.debug(f"Removed old backup '{stale_path}' (keeping {max_backups}).")
+        except OSError as e:
+            log.warning(f"Could not remove old backup '{stale_path}': {e}")
+    return backup_path
+
+
 # --- File Writing ---
 
 class OutputFileWriter:
     """Handles writing output to a file with automatic backup."""
 
+    def __init__(self, max_backups: int = constants.DEFAULT_MAX_BACKUPS):
+        self.max_backups = max_backups
+
     def write_to_file(self, file_path: str, content: str) -> tuple[bool, str]:
         """
-        Writes content to file_path. Creates backups if the file exists.
+        Writes content to file_path atomically. Creates backups if the file exists.
 
         Args:
             file_path: The target file path.
@@ -81,48 +403,15 @@ class OutputFileWriter:
              log.error("File path for writing cannot be empty.")
              return False, "No file path specified."
 
-        full_path = os.path.abspath(file_path)
-        log.info(f"Attempting to write output to file: {full_path}")
-
+        sink = OutputSink(file_path, self.max_backups, clean=False)
+        ok, msg = sink.open()
+        if not ok:
+            return False, msg
         try:
-            # Ensure parent directory exists
-            parent_dir = os.path.dirname(full_path)
-            if parent_dir: # Only create if not writing to current dir
-                 os.makedirs(parent_dir, exist_ok=True)
-
-            # Handle existing file backup
-            if os.path.exists(full_path):
-                if os.path.isdir(full_path):
-                     error_msg = f"Error: Output path '{full_path}' exists and is a directory."
-                     log.error(error_msg)
-                     return False, error_msg
-                backup_path = self._find_backup_path(full_path)
-                os.rename(full_path, backup_path)
-                log.warning(f"Output file '{os.path.basename(full_path)}' exists. Moved existing file to '{os.path.basename(backup_path)}'.")
-
-            # Write the new content using UTF-8 encoding
-            with open(full_path, "w", encoding='utf-8') as f:
-                bytes_written = f.write(content)
-            log.info(f"Successfully wrote {bytes_written} chars to '{full_path}'.")
-            return True, full_path
-
+            sink.write(content)
         except OSError as e:
-            error_msg = f"OS error writing to file '{full_path}': {e}"
+            sink.abort()
+            error_msg = f"OS error writing to file '{sink.file_path}': {e}"
             log.error(error_msg)
             return False, error_msg
-        except Exception as e:
-            error_msg = f"Unexpected error writing to file '{full_path}': {e}"
-            log.error(error_msg)
-            return False, error_msg
-
-    def _find_backup_path(self, original_path: str) -> str:
-        """Finds the next available backup file name (e.g., file.txt.backup-1)."""
-        base, ext = os.path.splitext(original_path)
-        counter = 0
-        while True:
-            counter += 1
-            # Ensure backup name doesn't clash with potential future directories if counter gets huge
-            backup_path = f"{base}.backup-{counter}{ext}"
-            if not os.path.exists(backup_path):
-                return backup_path
-
+        return sink.close()
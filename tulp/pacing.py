@@ -0,0 +1,34 @@
+# pacing.py
+import threading
+import time
+from typing import List, Dict, Any
+from .logger import log
+from .metrics import metrics
+
+
+class PacedClient:
+    """
+    Wraps an LLM client to stay under the model's requests-per-minute limit (its
+    "rpm" capability): request starts are spaced by 60/rpm seconds, whatever the
+    number of --jobs, so concurrent chunks wait their turn instead of getting 429s.
+    """
+
+    def __init__(self, client: Any, rpm: float):
+        self.client = client
+        self.model_name = getattr(client, "model_name", None)
+        self.supports_prefill = bool(getattr(client, "supports_prefill", False))
+        self.interval = 60.0 / rpm
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def generate(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        delay = start - now
+        if delay > 0:
+            log.debug(f"Pacing requests to {self.model_name}: waiting {delay:.2f}s")
+            metrics.add_counter("paced_requests")
+            time.sleep(delay)
+        return self.client.generate(messages)
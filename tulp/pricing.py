@@ -0,0 +1,78 @@
+# pricing.py
+import json
+import re
+from typing import Any, Dict, List, Tuple
+from .logger import log
+
+# Local price table: (model id regex, USD per 1M input tokens, USD per 1M output tokens).
+# The first matching entry wins, so more specific patterns go first.
+# List prices only (no batch or cached-input discounts); update as providers change them.
+PRICES: List[Tuple[str, float, float]] = [
+    # OpenAI
+    (r"(openai\.)?gpt-4o-mini.*", 0.15, 0.60),
+    (r"(openai\.)?(gpt|chatgpt)-4o.*", 2.50, 10.00),
+    (r"(openai\.)?gpt-4\.1-nano.*", 0.10, 0.40),
+    (r"(openai\.)?gpt-4\.1-mini.*", 0.40, 1.60),
+    (r"(openai\.)?gpt-4\.1.*", 2.00, 8.00),
+    (r"(openai\.)?gpt-4-turbo.*", 10.00, 30.00),
+    (r"(openai\.)?gpt-3\.5-turbo.*", 0.50, 1.50),
+    (r"(openai\.)?o[34]-mini.*", 1.10, 4.40),
+    # Anthropic
+    (r"claude-3-haiku.*", 0.25, 1.25),
+    (r"claude-3-5-haiku.*|claude-haiku.*", 0.80, 4.00),
+    (r"claude-.*opus.*", 15.00, 75.00),
+    (r"claude-.*sonnet.*", 3.00, 15.00),
+    # Google
+    (r"gemini-1\.5-flash-8b.*", 0.0375, 0.15),
+    (r"gemini-1\.5-flash.*", 0.075, 0.30),
+    (r"gemini-2\.0-flash-lite.*", 0.075, 0.30),
+    (r"gemini-2\.0-flash.*", 0.10, 0.40),
+    (r"gemini-2\.5-flash.*", 0.30, 2.50),
+    (r"gemini-1\.5-pro.*", 1.25, 5.00),
+    (r"gemini-2\.5-pro.*", 1.25, 10.00),
+    # Groq
+    (r"groq\.llama-3\.1-8b.*", 0.05, 0.08),
+    (r"groq\.llama-3\.3-70b.*", 0.59, 0.79),
+    # Local models
+    (r"ollama\..*", 0.0, 0.0),
+]
+
+def load_pricing_file(file_path: str) -> bool:
+    """
+    Loads extra price entries from a JSON file, taking precedence over the built-in table.
+    Format: [{"idRe": "my-model.*", "input": 1.0, "output": 2.0}, ...] (USD per 1M tokens)
+    """
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        custom = [(str(e["idRe"]), float(e["input"]), float(e["output"])) for e in entries]
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        log.error(f"Failed to load pricing file '{file_path}': {e}")
+        return False
+    PRICES[:0] = custom
+    _price_cache.clear()
+    log.debug(f"Loaded {len(custom)} price entries from {file_path}")
+    return True
+
+_price_cache: Dict[str, Tuple[float, float] | None] = {}
+
+def get_price(model_name: str) -> Tuple[float, float] | None:
+    """Returns (input, output) USD per 1M tokens for model_name, or None if unknown."""
+    if model_name not in _price_cache:
+        _price_cache[model_name] = next(
+            ((price_in, price_out) for id_re, price_in, price_out in PRICES if re.fullmatch(id_re, model_name)),
+            None
+        )
+    return _price_cache[model_name]
+
+def estimate_cost(model_name: str, usage: Dict[str, Any] | None) -> float | None:
+    """Estimates the USD cost of one request from its normalized usage. None if unknown."""
+    price = get_price(model_name)
+    if price is None or not usage:
+        return None
+    input_tokens = usage.get("input_tokens") or 0
+    output_tokens = usage.get("output_tokens") or 0
+    return (input_tokens * price[0] + output_tokens * price[1]) / 1_000_000
+
+def format_cost(cost: float | None) -> str:
+    return "unknown" if cost is None else f"${cost:.4f}"
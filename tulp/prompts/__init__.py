@@ -31,7 +31,8 @@
 from . import filtering
 from . import filtering_program
 from . import program
+from . import reduce
 from . import request
 
-__all__ = ['filtering', 'filtering_program', 'program', 'request']
+__all__ = ['filtering', 'filtering_program', 'program', 'reduce', 'request']
 
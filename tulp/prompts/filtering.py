@@ -4,7 +4,7 @@ from .. import version
 from .. import constants
 from ..logger import log
 
-def getMessages(user_instructions: str, stdin_chunk: str, num_chunks: int = 1, current_chunk_num: int = 1, context: str = None) -> List[Dict[str, str]]:
+def getMessages(user_instructions: str, stdin_chunk: str, num_chunks: int = 1, current_chunk_num: int = 1, context: str = None, map_reduce: bool = False, context_chars: int = 0, input_format: str = "text") -> List[Dict[str, str]]:
     """
     Generates prompt messages for filtering/processing stdin based on instructions.
     Uses the new FML-like dev tag format in the response template.
@@ -12,15 +12,51 @@ def getMessages(user_instructions: str, stdin_chunk: str, num_chunks: int = 1, c
     log.debug(f"Generating filtering prompt (new tags): chunk {current_chunk_num}/{num_chunks}")
     request_messages = []
 
+    # The chunk number only appears in the user prompt: the system prompt is the same for every
+    # chunk, so providers can reuse it (model instances, prompt and context caches)
     chunk_rules = ""
-    if num_chunks > 1:
+    if map_reduce and num_chunks > 1:
         chunk_rules = (
-            f"\n- IMPORTANT: The stdin content provided below is chunk {current_chunk_num} of {num_chunks}. "
+            f"\n- IMPORTANT: The stdin content provided below is one part of a larger input split into {num_chunks} parts. "
+            f"Apply the instructions to this part only. Your output is a partial result that will later be combined with the "
+            f"partial results of the other parts into one final answer, so keep every detail needed for that combination "
+            f"(facts, names, counts, totals) and do not mention that the input was split."
+        )
+    elif num_chunks > 1 and input_format in constants.STRUCTURED_INPUT_FORMATS:
+        header_note = " (the header line is repeated in every chunk)" if input_format in ("csv", "table") else ""
+        chunk_rules = (
+            f"\n- IMPORTANT: The stdin content provided below is one chunk of a larger input split into {num_chunks} chunks at {input_format.upper()} record boundaries. "
+            f"It is a complete {input_format.upper()} document{header_note}: process it on its own and write a complete document in the same format. "
+            f"The outputs of all chunks are merged automatically."
+        )
+    elif num_chunks > 1:
+        chunk_rules = (
+            f"\n- IMPORTANT: The stdin content provided below is one chunk of a larger input split into {num_chunks} chunks (its number is given with the stdin content). "
             f"Assume previous chunks (if any) were processed according to the instructions, "
             f"and the output you generate will be concatenated. Process this chunk as a valid continuation. "
             f"If you started a structure (like JSON array or list) in a previous chunk, continue it directly without re-opening tags/brackets unless necessary for the format."
         )
 
+    # Compacted array of objects (--compact): explain the table form and ask for it back
+    if input_format == "table":
+        chunk_rules += (
+            f"\n- The stdin content is a JSON array of objects written in compact table form: the first line is the JSON list of the keys, "
+            f"every other line is the JSON list of one object's values, in the same order. Unless the instructions ask for another output format, "
+            f"write the output in the same table form (a header line, then one line per object): it is converted back to a JSON array of objects."
+        )
+
+    # Rolling context: the model keeps a compact state block that is fed into the next chunk's prompt
+    carry_context = context_chars > 0 and num_chunks > 1
+    context_template = ""
+    if carry_context:
+        chunk_rules += (
+            f"\n- After the '{constants.BLOCK_STDOUT}' block, write a {constants.TAG_CONTEXT_START} / {constants.TAG_FILE_END} block "
+            f"of at most {context_chars} characters with the compact state needed to process the NEXT chunk consistently "
+            f"(e.g. running totals and counters, open structures, naming or glossary decisions). "
+            f"It replaces any previous context entirely, so carry over what is still relevant. It is never shown to the user."
+        )
+        context_template = f"{constants.TAG_CONTEXT_START}\n<Compact state for the next chunk (at most {context_chars} characters), between context start/end tags.>\n{constants.TAG_FILE_END}\n"
+
     # NOTE: Use BLOCK constants when referring to block names in explanations
     system_instructions = f"""# You are a Unix cli tool named tulp version {version.VERSION} created by fedenunez.
 - Your main functionality is to process the given stdin content ({constants.TAG_STDIN_PROMPT_DELIMITER_START}...{constants.TAG_STDIN_PROMPT_DELIMITER_END}) following the user's `Processing instructions`.
@@ -48,7 +84,7 @@ def getMessages(user_instructions: str, stdin_chunk: str, num_chunks: int = 1, c
 {constants.TAG_STDOUT_START}
 <Write the processed output here. Content between stdout start/end tags.>
 {constants.TAG_FILE_END}
-{constants.TAG_ERROR_START}
+{context_template}{constants.TAG_ERROR_START}
 <ONLY if processing failed irrecoverably: Explain the error clearly and concisely between error start/end tags.>
 {constants.TAG_FILE_END}
 {constants.TAG_STDERR_START}
@@ -59,9 +95,13 @@ def getMessages(user_instructions: str, stdin_chunk: str, num_chunks: int = 1, c
     request_messages.append({"role": "system", "content": system_instructions})
 
     # User instructions section with updated stdin delimiter
+    context_section = ""
+    if carry_context and context:
+        context_section = f"\n# Context carried over from the previous chunks:\n{constants.TAG_CONTEXT_START}\n{context}\n{constants.TAG_FILE_END}\n"
+
     user_prompt = f"""# Processing instructions:
 {user_instructions}
-
+{context_section}
 # Stdin content chunk {current_chunk_num}/{num_chunks} to process:
 {constants.TAG_STDIN_PROMPT_DELIMITER_START}
 {stdin_chunk}
@@ -4,9 +4,10 @@ from .. import version
 from .. import constants
 from ..logger import log
 
-def getMessages(user_instructions: str, stdin_example_chunk: str, **kwargs) -> List[Dict[str, str]]:
+def getMessages(user_instructions: str, stdin_example_chunk: str, input_summary: str = "", **kwargs) -> List[Dict[str, str]]:
     """
     Generates prompt messages for creating a Python program to filter/process stdin.
+    input_summary describes the whole input when stdin_example_chunk is only a sample of it.
     Uses the new FML-like dev tag format in the response template.
     """
     log.debug("Generating filtering program prompt (new tags).")
@@ -65,11 +66,20 @@ if __name__ == "__main__":
 """
     request_messages.append({"role": "system", "content": system_instructions})
 
+    # Large input: a summary of the whole stdin precedes the sampled records
+    summary_section = ""
+    if input_summary:
+        summary_section = f"""
+# Stdin Overview:
+(The program will read the whole input; below is a summary of it, followed by a sample of its records.)
+{input_summary}
+"""
+
     # User request section with updated stdin delimiter
     user_prompt = f"""# Request:
 Create a Python program that reads from stdin, processes the input according to the following requirement, and prints the result to stdout:
 {user_instructions}
-
+{summary_section}
 # Example Stdin Content:
 (This is just a small sample to illustrate the input format.)
 {constants.TAG_STDIN_PROMPT_DELIMITER_START}
@@ -0,0 +1,58 @@
+# prompts/records.py
+from typing import List, Dict, Tuple
+from .. import version
+from .. import constants
+from ..logger import log
+
+def getMessages(user_instructions: str, records: List[Tuple[int, str]], **kwargs) -> List[Dict[str, str]]:
+    """
+    Generates prompt messages for processing a batch of independent, numbered records (--per-record).
+    Every record is answered on its own line, prefixed with its number and a tab.
+    Uses the new FML-like dev tag format in the response template.
+    """
+    log.debug(f"Generating per-record prompt (new tags): {len(records)} records")
+    request_messages = []
+
+    # NOTE: Use BLOCK constants when referring to block names in explanations
+    system_instructions = f"""# You are a Unix cli tool named tulp version {version.VERSION} created by fedenunez.
+- Per-record processing: the stdin content ({constants.TAG_STDIN_PROMPT_DELIMITER_START}...{constants.TAG_STDIN_PROMPT_DELIMITER_END}) is a batch of independent records, one per line, each prefixed with its record number and a tab.
+- Apply the user's `Processing instructions` to EVERY record separately, as if it were the only input.
+
+# Core Rules
+- You MUST faithfully follow the `Processing instructions` for each record.
+- Your entire response MUST start EXACTLY with {constants.TAG_REPLY_START} on its own line and end EXACTLY with {constants.TAG_REPLY_END} on its own line.
+- Inside the reply, you MUST generate the results within a {constants.TAG_STDOUT_START} / {constants.TAG_FILE_END} block pair. This block is MANDATORY unless an error occurs.
+- In the '{constants.BLOCK_STDOUT}' block write exactly ONE line per record: the record number, a tab, and the result for that record on a single line. Keep the record order and never skip, merge or add records.
+- If the result for a record is empty, write its number and a tab with nothing after it.
+- Do NOT add any explanations, headers, or markdown formatting within the '{constants.BLOCK_STDOUT}' block.
+- Explanations about the process belong ONLY in the {constants.TAG_STDERR_START} / {constants.TAG_FILE_END} block.
+- ONLY use the {constants.TAG_ERROR_START} / {constants.TAG_FILE_END} block if you absolutely cannot fulfill the request.
+- NEVER ask follow-up questions or engage in conversation. Provide the output or an error.
+
+## Response Template (MUST Follow Exactly)
+{constants.TAG_REPLY_START}
+{constants.TAG_STDOUT_START}
+<One line per record: NUMBER<tab>RESULT. Content between stdout start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_ERROR_START}
+<ONLY if processing failed irrecoverably: Explain the error clearly and concisely between error start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_STDERR_START}
+<Explain WHAT was done to create the output in the stdout block and HOW. Put explanations between stderr start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_REPLY_END}
+"""
+    request_messages.append({"role": "system", "content": system_instructions})
+
+    numbered_records = "\n".join(f"{number}\t{record}" for number, record in records)
+    user_prompt = f"""# Processing instructions:
+{user_instructions}
+
+# Records to process ({len(records)}):
+{constants.TAG_STDIN_PROMPT_DELIMITER_START}
+{numbered_records}
+{constants.TAG_STDIN_PROMPT_DELIMITER_END}
+"""
+    request_messages.append({"role": "user", "content": user_prompt})
+
+    return request_messages
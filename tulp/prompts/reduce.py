@@ -0,0 +1,67 @@
+# prompts/reduce.py
+from typing import List, Dict, Any
+from .. import version
+from .. import constants
+from ..logger import log
+
+def getMessages(user_instructions: str, partial_results: List[str], is_final: bool = True, **kwargs) -> List[Dict[str, str]]:
+    """
+    Generates prompt messages for combining partial results of a map-reduce run.
+    Uses the new FML-like dev tag format in the response template.
+    """
+    log.debug(f"Generating reduce prompt (new tags): {len(partial_results)} partial results, final={is_final}")
+    request_messages = []
+
+    if is_final:
+        goal_rules = "- Combine the partial results into the single, final answer to the `Processing instructions`, as if you had processed the whole input at once."
+    else:
+        goal_rules = (
+            "- Combine the partial results into ONE partial result. It will later be combined again with other partial results, "
+            "so keep every detail needed for that final combination (facts, names, counts, totals)."
+        )
+
+    # NOTE: Use BLOCK constants when referring to block names in explanations
+    system_instructions = f"""# You are a Unix cli tool named tulp version {version.VERSION} created by fedenunez.
+- A large input was split into parts and the `Processing instructions` were applied to each part separately.
+- Your task is to merge the given partial results ({constants.TAG_STDIN_PROMPT_DELIMITER_START}...{constants.TAG_STDIN_PROMPT_DELIMITER_END}) following the user's `Processing instructions`.
+
+# Core Rules
+{goal_rules}
+- Your entire response MUST start EXACTLY with {constants.TAG_REPLY_START} on its own line and end EXACTLY with {constants.TAG_REPLY_END} on its own line.
+- Inside the reply, you MUST generate the combined output within a {constants.TAG_STDOUT_START} / {constants.TAG_FILE_END} block pair. This block is MANDATORY unless an error occurs.
+- Use the exact response format specified below. Tags MUST be on their own lines.
+- Merge duplicated information, add up counts and totals, and keep the output format requested by the `Processing instructions`.
+- Do NOT mention the partial results, the parts, or the splitting in the '{constants.BLOCK_STDOUT}' block.
+- ONLY use the {constants.TAG_ERROR_START} / {constants.TAG_FILE_END} block if you absolutely cannot fulfill the request.
+- NEVER ask follow-up questions or engage in conversation. Provide the output or an error.
+- Explanations about the process belong ONLY in the {constants.TAG_STDERR_START} / {constants.TAG_FILE_END} block.
+
+## Response Template (MUST Follow Exactly)
+{constants.TAG_REPLY_START}
+{constants.TAG_STDOUT_START}
+<Write the combined output here. Content between stdout start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_ERROR_START}
+<ONLY if processing failed irrecoverably: Explain the error clearly and concisely between error start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_STDERR_START}
+<Explain WHAT was done to create the output in the stdout block and HOW. Put explanations between stderr start/end tags.>
+{constants.TAG_FILE_END}
+{constants.TAG_REPLY_END}
+"""
+    request_messages.append({"role": "system", "content": system_instructions})
+
+    parts = "\n\n".join(
+        f"## Partial result {i + 1}/{len(partial_results)}\n{partial}" for i, partial in enumerate(partial_results)
+    )
+    user_prompt = f"""# Processing instructions:
+{user_instructions}
+
+# Partial results to combine:
+{constants.TAG_STDIN_PROMPT_DELIMITER_START}
+{parts}
+{constants.TAG_STDIN_PROMPT_DELIMITER_END}
+"""
+    request_messages.append({"role": "user", "content": user_prompt})
+
+    return request_messages
@@ -0,0 +1,168 @@
+# records.py
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from typing import List, Dict, Any, Iterable, Tuple, TYPE_CHECKING
+from . import constants
+from .logger import log
+from .response_parser import block_content, block_exists
+from .output_handler import print_stderr
+from .core import map_chunks, process_chunk, write_output, budget_exceeded
+from .prompts import records as records_prompt
+from .metrics import metrics
+from .pricing import format_cost
+
+# Type hints
+if TYPE_CHECKING:
+    from .config import TulpConfig
+    from .inspect_log import InspectLog
+    LlmClientType = Any
+
+# One result line of a per-record reply: "<record number>\t<result>". The tab of an
+# empty result may be lost when the reply is stripped, so a bare number is an empty result.
+RESULT_LINE_RE = re.compile(r"^\s*(\d+)(?:\t(.*))?$")
+
+
+def record_key(model: str, user_request: str, record: str) -> str:
+    """Cache key of a record's result: depends on the model, the request and the record content."""
+    payload = f"{model}\x00{user_request}\x00{record}".encode("utf-8", errors="replace")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class RecordCache:
+    """Persistent key-value store (SQLite) of per-record results."""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Returns the cached results of the given keys (missing keys are left out)."""
+        keys = list(keys)
+        found: Dict[str, str] = {}
+        for start in range(0, len(keys), constants.RECORD_CACHE_QUERY_BATCH):
+            batch = keys[start:start + constants.RECORD_CACHE_QUERY_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._db.execute(f"SELECT key, result FROM results WHERE key IN ({placeholders})", batch))
+        return found
+
+    def put_many(self, results: Dict[str, str]):
+        now = time.time()
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO results (key, result, created) VALUES (?, ?, ?)",
+                                 [(key, result, now) for key, result in results.items()])
+
+    def close(self):
+        self._db.close()
+
+
+def pack_batches(records: List[str], max_chars: int, max_records: int = constants.RECORD_BATCH_MAX_RECORDS) -> List[List[str]]:
+    """Groups records into batches of at most max_records records and (about) max_chars characters."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_len = 0
+    for record in records:
+        record_len = len(record) + 8 # Number, tab and newline
+        if current and (len(current) >= max_records or current_len + record_len > max_chars):
+            batches.append(current)
+            current, current_len = [], 0
+        current.append(record)
+        current_len += record_len
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_results(stdout: str, num_records: int) -> Dict[int, str]:
+    """Parses the "<number>\\t<result>" lines of a per-record reply. Returns {record number: result}."""
+    results: Dict[int, str] = {}
+    for line in stdout.splitlines():
+        match = RESULT_LINE_RE.match(line)
+        if match and 1 <= int(match.group(1)) <= num_records:
+            results.setdefault(int(match.group(1)), (match.group(2) or "").rstrip("\r"))
+    return results
+
+
+def handle_per_record_request(
+    llm_client: 'LlmClientType',
+    user_request: str,
+    input_text: str,
+    config: 'TulpConfig',
+    args: Any,
+    inspect_manager: 'InspectLog | None'
+) -> int:
+    """
+    Processes every stdin line as an independent record (--per-record).
+
+    Results are memoized in a persistent cache keyed by (model, request, record):
+    only records never seen before are sent to the LLM, packed into batches, and
+    the output is reassembled in input order. Records missing from a reply are
+    sent again once in a new batch.
+    """
+    records = [line.rstrip("\r") for line in input_text.split("\n")]
+    keys = [record_key(config.model, user_request, record) if record.strip() else None for record in records]
+
+    cache = RecordCache(config.record_cache)
+    try:
+        known = cache.get_many({key for key in keys if key})
+        pending: Dict[str, str] = {}
+        for record, key in zip(records, keys):
+            if key and key not in known:
+                pending.setdefault(key, record)
+        cached = sum(1 for key in keys if key and key in known)
+        log.info(f"Per-record mode: {len(records)} records, {cached} answered from the cache ({cache.path}), {len(pending)} unique records to send.")
+        metrics.set_run_info(mode="per_record", records=len(records))
+        metrics.add_counter("cached_records", cached)
+        metrics.add_counter("sent_records", len(pending))
+
+        last_stderr = ""
+        for attempt in range(1 + constants.RECORD_MAX_RETRIES):
+            if not pending:
+                break
+            if attempt:
+                log.warning(f"{len(pending)} records were missing from the replies, sending them again.")
+            batches = pack_batches(list(pending.values()), config.max_chars)
+            batch_keys = []
+            position = 0
+            pending_keys = list(pending)
+            for batch in batches:
+                batch_keys.append(pending_keys[position:position + len(batch)])
+                position += len(batch)
+
+            def run_batch(j: int, batch: List[str]) -> Dict[str, str] | None:
+                batch_label = f"record batch {j + 1}/{len(batches)}"
+                if budget_exceeded(config):
+                    log.error(f"Cost budget reached ({format_cost(metrics.total_cost)} of {format_cost(config.max_cost)}) before {batch_label}. Stopping.")
+                    return None
+                with metrics.timed(f"records_{attempt}_{j}", "prompt_build"):
+                    request_messages = records_prompt.getMessages(user_request, list(enumerate(batch, 1)))
+                return process_chunk(llm_client, request_messages, config, inspect_manager, batch_label, f"records_{attempt}_{j}")
+
+            for j, parsed_response in enumerate(map_chunks(run_batch, batches, config.jobs, log_id=lambda j: f"records-{j + 1}")):
+                if parsed_response is None:
+                    return 1
+                results = parse_results(block_content(parsed_response, constants.BLOCK_STDOUT), len(batches[j]))
+                answered = {batch_keys[j][number - 1]: result for number, result in results.items()}
+                # Store as soon as a batch is done, so an interrupted run keeps its progress
+                cache.put_many(answered)
+                known.update(answered)
+                for key in answered:
+                    pending.pop(key, None)
+                if block_exists(parsed_response, constants.BLOCK_STDERR):
+                    last_stderr = block_content(parsed_response, constants.BLOCK_STDERR)
+
+        if pending:
+            log.error(f"{len(pending)} records have no result after {1 + constants.RECORD_MAX_RETRIES} attempts.")
+            return 1
+    finally:
+        cache.close()
+
+    if last_stderr:
+        print_stderr(last_stderr)
+    return write_output("\n".join(known[key] if key else "" for key in keys), config)
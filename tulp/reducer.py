@@ -0,0 +1,129 @@
+# reducer.py
+from typing import List, Dict, Any, TYPE_CHECKING
+from .logger import log
+from . import constants
+from .response_parser import block_exists, block_content
+from .output_handler import print_stderr, strip_code_fences
+from .core import map_chunks, process_chunk, write_output, budget_exceeded
+from .compaction import restore_output
+from .prompts import reduce as reduce_prompt
+from .metrics import metrics
+from .pricing import format_cost
+
+# Type hints
+if TYPE_CHECKING:
+    from .config import TulpConfig
+    from .inspect_log import InspectLog
+    LlmClientType = Any
+    PromptFactoryType = Any
+
+# Separator overhead per partial result inside the reduce prompt ("## Partial result i/n" header)
+PARTIAL_HEADER_OVERHEAD = 40
+
+def plan_reduce_batches(partial_results: List[str], max_chars: int) -> List[List[str]]:
+    """
+    Groups partial results into batches whose combined size fits within max_chars.
+    Every batch holds at least two partial results (when available) so each
+    reduction level is guaranteed to shrink the number of results.
+    """
+    batches: List[List[str]] = []
+    current: List[str] = []
+    current_len = 0
+
+    for partial in partial_results:
+        partial_len = len(partial) + PARTIAL_HEADER_OVERHEAD
+        if len(current) >= 2 and current_len + partial_len > max_chars:
+            batches.append(current)
+            current, current_len = [], 0
+        current.append(partial)
+        current_len += partial_len
+    if current:
+        # A trailing single result is merged into the previous batch instead of passing through
+        if len(current) == 1 and batches:
+            batches[-1].extend(current)
+        else:
+            batches.append(current)
+
+    return batches
+
+
+def handle_reduce_request(
+    llm_client: 'LlmClientType',
+    prompt_factory: 'PromptFactoryType',
+    user_request: str,
+    stdin_chunks: List[str],
+    config: 'TulpConfig',
+    args: Any,
+    inspect_manager: 'InspectLog | None',
+    input_format: str = "text",
+    layout: Dict[str, Any] | None = None,
+) -> int:
+    """
+    Processes stdin as a map-reduce job: the request is applied to every chunk in
+    parallel (map), then the partial results are combined in batches that fit the
+    chunk size until a single answer remains (tree reduction).
+    """
+    num_chunks = len(stdin_chunks)
+    log.info(f"Map-reduce mode: mapping the request over {num_chunks} chunks (jobs: {config.jobs}).")
+
+    def map_chunk(i: int, stdin_chunk: str) -> Dict[str, str] | None:
+        chunk_num_display = f"{i + 1}/{num_chunks}"
+        if budget_exceeded(config):
+            log.error(f"Cost budget reached ({format_cost(metrics.total_cost)} of {format_cost(config.max_cost)}) before chunk {chunk_num_display}. Stopping.")
+            return None
+        log.info(f"Mapping chunk {chunk_num_display}...")
+        with metrics.timed(f"map_{i}", "prompt_build"):
+            request_messages = prompt_factory.getMessages(
+                user_instructions=user_request,
+                stdin_chunk=stdin_chunk,
+                num_chunks=num_chunks,
+                current_chunk_num=i + 1,
+                map_reduce=True,
+                input_format=input_format,
+            )
+        return process_chunk(llm_client, request_messages, config, inspect_manager, f"chunk {chunk_num_display}", f"map_{i}")
+
+    partial_results: List[str] = []
+    last_parsed: Dict[str, str] = {}
+    for parsed_response in map_chunks(map_chunk, stdin_chunks, config.jobs, log_id=lambda i: f"map-{i + 1}"):
+        if parsed_response is None:
+            return 1
+        last_parsed = parsed_response
+        partial_results.append(block_content(parsed_response, constants.BLOCK_STDOUT))
+    log.info(f"Map step done, estimated cost so far: {format_cost(metrics.total_cost)}.")
+
+    # --- Tree reduction ---
+    level = 0
+    while len(partial_results) > 1:
+        level += 1
+        batches = plan_reduce_batches(partial_results, config.max_chars)
+        is_final = len(batches) == 1
+        log.info(f"Reduce level {level}: combining {len(partial_results)} partial results in {len(batches)} batch(es).")
+
+        def reduce_batch(j: int, batch: List[str]) -> Dict[str, str] | None:
+            batch_label = f"reduce level {level} batch {j + 1}/{len(batches)}"
+            if budget_exceeded(config):
+                log.error(f"Cost budget reached ({format_cost(metrics.total_cost)} of {format_cost(config.max_cost)}) before {batch_label}. Stopping.")
+                return None
+            with metrics.timed(f"reduce_{level}_{j}", "prompt_build"):
+                request_messages = reduce_prompt.getMessages(user_request, batch, is_final=is_final)
+            return process_chunk(llm_client, request_messages, config, inspect_manager, batch_label, f"reduce_{level}_{j}")
+
+        reduced_results: List[str] = []
+        for parsed_response in map_chunks(reduce_batch, batches, config.jobs, log_id=lambda j: f"reduce-{level}-{j + 1}"):
+            if parsed_response is None:
+                return 1
+            last_parsed = parsed_response
+            reduced_results.append(block_content(parsed_response, constants.BLOCK_STDOUT))
+        partial_results = reduced_results
+        log.info(f"Reduce level {level} done, estimated cost so far: {format_cost(metrics.total_cost)}.")
+
+    final_output = restore_output(strip_code_fences(partial_results[0]), layout, config.restore_format) if partial_results else ""
+    if not final_output.strip():
+        log.warning("Map-reduce finished, but the final stdout content is empty after cleaning.")
+
+    if block_exists(last_parsed, constants.BLOCK_STDERR) and block_content(last_parsed, constants.BLOCK_STDERR):
+        print_stderr(block_content(last_parsed, constants.BLOCK_STDERR))
+
+    metrics.set_run_info(reduce_levels=level)
+    return write_output(final_output, config)
@@ -73,7 +73,7 @@ def parse_response(response_text: str) -> Dict[str, str]:
             if block_name in constants.VALID_RESPONSE_BLOCK_NAMES:
                 current_block_name = block_name
                 current_content = [] # Reset content buffer
-                log.debug(f"Started parsing block: '{current_block_name}'")
+                log.debug("Started parsing block: '%s'", current_block_name)
             else:
                 log.warning(f"Ignoring block with unrecognized name: '{block_name}'")
                 current_block_name = None # Stop collecting content until next valid start tag
@@ -86,7 +86,7 @@ def parse_response(response_text: str) -> Dict[str, str]:
                 # Join lines and strip leading/trailing whitespace from the final block content
                 block_content_str = "\n".join(current_content).strip()
                 blocks[current_block_name] = block_content_str
-                log.debug(f"Finished parsing block: '{current_block_name}' ({len(block_content_str)} chars)")
+                log.debug("Finished parsing block: '%s' (%d chars)", current_block_name, len(block_content_str))
                 current_block_name = None # Reset for next block
                 current_content = []
             else:
@@ -117,7 +117,7 @@ def parse_response(response_text: str) -> Dict[str, str]:
          if has_reply_end(blocks):
              log.warning(f"Neither '{constants.BLOCK_STDOUT}' nor '{constants.BLOCK_ERROR}' block found in the response.")
 
-    log.debug(f"Final parsed block keys: {list(blocks.keys())}")
+    log.debug("Final parsed block keys: %s", list(blocks))
     return blocks
 
 
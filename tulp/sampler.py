@@ -0,0 +1,194 @@
+# sampler.py
+import csv
+import json
+import math
+import random
+import re
+from collections import Counter
+from typing import List, Dict, Tuple, Any
+from . import constants
+from .logger import log
+from .input_handler import detect_format, split_records, csv_delimiter
+
+# Level of a log entry, used to show at least one entry of every level
+LOG_LEVEL_RE = re.compile(r"\b(TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|CRITICAL|FATAL)\b")
+INTEGER_RE = re.compile(r"^[+-]?\d+$")
+NUMBER_RE = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2})?)?")
+
+
+def _text_type(value: str) -> str:
+    """Type of a CSV field, as shown in the schema summary."""
+    value = value.strip()
+    if not value:
+        return "empty"
+    if INTEGER_RE.match(value):
+        return "integer"
+    if NUMBER_RE.match(value):
+        return "number"
+    if value.lower() in ("true", "false"):
+        return "boolean"
+    if DATE_RE.match(value):
+        return "date"
+    return "text"
+
+def _json_type(value: Any) -> str:
+    """Type of a JSON value, as shown in the schema summary."""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    return "array" if isinstance(value, list) else "object"
+
+def _describe_fields(field_types: Dict[str, Counter], scanned: int) -> str:
+    """One "name (type, N% empty/missing)" entry per field, in order of first appearance."""
+    entries = []
+    for name, types in field_types.items():
+        present = {t: n for t, n in types.items() if t not in ("empty", "null")}
+        type_names = "/".join(t for t, _n in Counter(present).most_common(2)) or "empty"
+        missing = scanned - sum(present.values())
+        note = f", {100 * missing // scanned}% empty or missing" if missing and present else ""
+        entries.append(f"{name} ({type_names}{note})")
+    return ", ".join(entries)
+
+
+def _shape(record: str, input_format: str, delimiter: str) -> Any:
+    """A coarse shape of a record: records of different shapes are all shown in the sample."""
+    if input_format in ("json", "jsonl"):
+        try:
+            value = json.loads(record)
+        except ValueError:
+            return "invalid"
+        return tuple(sorted(value)) if isinstance(value, dict) else _json_type(value)
+    if input_format == "csv":
+        row = next(csv.reader([record], delimiter=delimiter), [])
+        return (len(row), tuple(not field.strip() for field in row))
+    if input_format == "log":
+        match = LOG_LEVEL_RE.search(record[:200])
+        return (match.group(1) if match else None, "\n" in record)
+    # Plain text: the order of magnitude of the line length
+    return int(math.log2(len(record) + 1))
+
+def _scan_positions(num_records: int) -> List[int]:
+    """Evenly spaced positions of at most SAMPLE_SCAN_RECORDS records, examined for shapes and schema."""
+    if num_records <= constants.SAMPLE_SCAN_RECORDS:
+        return list(range(num_records))
+    step = num_records / constants.SAMPLE_SCAN_RECORDS
+    return [int(i * step) for i in range(constants.SAMPLE_SCAN_RECORDS)]
+
+
+def _schema_summary(header: str, records: List[str], positions: List[int], input_format: str, delimiter: str) -> str:
+    """Format-specific summary of the scanned records: columns or fields with their types, or line lengths."""
+    field_types: Dict[str, Counter] = {}
+    if input_format == "csv":
+        names = next(csv.reader([header], delimiter=delimiter), [])
+        field_types = {name: Counter() for name in names}
+        for position in positions:
+            row = next(csv.reader([records[position]], delimiter=delimiter), [])
+            for name, value in zip(names, row):
+                field_types[name][_text_type(value)] += 1
+        return f"Columns (delimiter {delimiter!r}): " + _describe_fields(field_types, len(positions))
+    if input_format in ("json", "jsonl"):
+        kinds: Counter = Counter()
+        for position in positions:
+            try:
+                value = json.loads(records[position])
+            except ValueError:
+                kinds["invalid JSON"] += 1
+                continue
+            kinds[_json_type(value)] += 1
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    field_types.setdefault(key, Counter())[_json_type(item)] += 1
+        summary = "Record types: " + ", ".join(f"{kind} ({count})" for kind, count in kinds.most_common())
+        objects = kinds.get("object", 0)
+        if field_types and objects:
+            summary += "\nObject fields: " + _describe_fields(field_types, objects)
+        return summary
+    lengths = [len(records[position]) for position in positions]
+    summary = f"Record length in characters: min {min(lengths)}, average {sum(lengths) // len(lengths)}, max {max(lengths)}"
+    if input_format == "log":
+        levels = Counter(match.group(1) for position in positions if (match := LOG_LEVEL_RE.search(records[position][:200])))
+        if levels:
+            summary += "\nLevels: " + ", ".join(f"{level} ({count})" for level, count in levels.most_common())
+    return summary
+
+
+def _select(records: List[str], positions: List[int], input_format: str, delimiter: str, budget: int) -> Tuple[List[int], Dict[str, int]]:
+    """
+    Picks the records to show within budget characters: the head and the tail, then
+    the first record of every shape (rarest shapes first), then random records.
+    """
+    num_records = len(records)
+    head = list(range(min(constants.SAMPLE_HEAD_RECORDS, num_records)))
+    tail = list(range(max(len(head), num_records - constants.SAMPLE_TAIL_RECORDS), num_records))
+    shapes: Dict[Any, List[int]] = {}
+    for position in positions:
+        shapes.setdefault(_shape(records[position], input_format, delimiter), []).append(position)
+    stratified = [members[0] for members in sorted(shapes.values(), key=len)]
+    rng = random.Random(constants.SAMPLE_SEED) # Same input, same prompt
+    randomized = rng.sample(range(num_records), min(num_records, constants.SAMPLE_RANDOM_RECORDS))
+
+    chosen: Dict[int, str] = {}
+    used = 0
+    for kind, candidates in (("head", head), ("tail", tail), ("stratified", stratified), ("random", randomized)):
+        for position in candidates:
+            if position in chosen:
+                continue
+            cost = len(records[position]) + 2
+            if used + cost > budget:
+                if kind in ("head", "tail") and not chosen:
+                    # Always show at least one record, even if it is huge (it is truncated later)
+                    chosen[position] = kind
+                    used = budget
+                continue
+            chosen[position] = kind
+            used += cost
+    return sorted(chosen), dict(Counter(chosen.values()))
+
+
+def sample_input(input_text: str, max_chars: int, input_format: str = "auto") -> Tuple[str, str]:
+    """
+    Builds a compact, representative excerpt of the input for code-generation prompts.
+
+    Inputs that fit in max_chars are returned whole. Otherwise the excerpt holds
+    complete records (lines, log entries, CSV rows under the header, JSON array
+    elements) chosen from the head, the tail, every distinct record shape and at
+    random, and is a valid document of the input format.
+
+    Returns:
+        A tuple (summary, excerpt): summary describes the whole input (size, number
+        of records, schema) and what the excerpt shows; it is empty if the input fits.
+    """
+    if len(input_text) <= max_chars:
+        return "", input_text
+    if input_format == "auto":
+        input_format = detect_format(input_text)
+    delimiter = (csv_delimiter(input_text) or ",") if input_format == "csv" else ","
+    input_format, header, records, join = split_records(input_text, input_format)
+    if not records:
+        return "", input_text[:max_chars]
+
+    positions = _scan_positions(len(records))
+    summary_lines = [f"Format: {input_format}, {len(input_text)} characters, {len(records)} records" + (" (plus the header)" if header else "")]
+    summary_lines.append(_schema_summary(header, records, positions, input_format, delimiter))
+
+    # The summary is part of the budget, so the prompt stays about max_chars long
+    budget = max(1, max_chars - len(header) - sum(len(line) + 1 for line in summary_lines))
+    selected, kinds = _select(records, positions, input_format, delimiter, budget)
+    excerpt_records = records if len(selected) == len(records) else [records[position] for position in selected]
+    if len(excerpt_records) == 1 and len(excerpt_records[0]) > budget:
+        excerpt_records = [excerpt_records[0][:budget]]
+        summary_lines.append(f"The excerpt shows the first {budget} characters of the first record only.")
+    else:
+        labels = {"head": "the first {}", "tail": "the last {}", "stratified": "{} of less common shapes", "random": "{} at random"}
+        shown = ", ".join(labels[kind].format(count) for kind, count in kinds.items())
+        summary_lines.append(f"The excerpt shows {len(excerpt_records)} of the {len(records)} records, in input order ({shown}).")
+    log.info(f"Input sampled for the prompt: {len(excerpt_records)} of {len(records)} {input_format} records.")
+    return "\n".join(summary_lines), join(header, excerpt_records)